@@ -15,7 +15,7 @@ from pstats import Stats
 import sys
 import traceback
 from typing import Dict, Optional
-from urllib.parse import urlsplit
+from urllib.parse import parse_qs, urlsplit
 
 import thor
 from thor.loop import _loop
@@ -23,6 +23,10 @@ from thor.loop import _loop
 from redbot import __version__
 from redbot.type import RawHeaderListType
 from redbot.webui import RedWebUi
+from redbot.webui.memory import memory
+from redbot.webui.metrics import metrics
+from redbot.webui.profiler import lag_sampler, profiler, tracer
+from redbot.formatter.html_base import extra_content  # after webui; see its imports
 
 if os.environ.get("SYSTEMD_WATCHDOG"):
     try:
@@ -33,7 +37,6 @@ else:
     notify = Notification = None  # pylint: disable=invalid-name
 
 _loop.precision = 0.2
-_loop.debug = True
 
 
 def print_debug(message: str, profile: Optional[cProfile.Profile]) -> None:
@@ -68,6 +71,15 @@ class RedBotServer:
         self.static_files = self.walk_files(self.config["asset_dir"], b"static/")
         if self.config.get("extra_base_dir"):
             self.static_files.update(self.walk_files(self.config["extra_base_dir"]))
+        extra_content.load(self.config.get("extra_dir", ""))
+        metrics.setup(self.config)
+        memory.setup(self.config)
+        lag_sampler.setup(self.config)
+        profiler.setup(self.config)
+        tracer.setup(self.config)
+        # thor's profiling of slow events can't run alongside test profiling.
+        if not profiler.enabled:
+            _loop.debug = self.config.getboolean("loop_debug", fallback=False)
 
         # Set up the server
         server = thor.http.HttpServer(
@@ -150,6 +162,23 @@ class RedHandler:
             self.exchange.response_start(b"200", b"OK", headers)
             self.exchange.response_body(self.static_files[p_uri.path])
             self.exchange.response_done([])
+        elif p_uri.path == b"/metrics" and metrics.enabled:
+            headers = []
+            headers.append((b"Content-Type", b"text/plain; version=0.0.4"))
+            headers.append((b"Cache-Control", b"no-store"))
+            self.exchange.response_start(b"200", b"OK", headers)
+            self.exchange.response_body(metrics.render().encode("utf-8"))
+            self.exchange.response_done([])
+        elif p_uri.path == b"/memory" and memory.enabled:
+            limit = parse_qs(p_uri.query).get(b"limit", [b"20"])[0]
+            headers = []
+            headers.append((b"Content-Type", b"text/plain; charset=utf-8"))
+            headers.append((b"Cache-Control", b"no-store"))
+            self.exchange.response_start(b"200", b"OK", headers)
+            self.exchange.response_body(
+                memory.report(int(limit) if limit.isdigit() else 20).encode("utf-8")
+            )
+            self.exchange.response_done([])
         elif p_uri.path == b"/":
             try:
                 self.req_hdrs.append(
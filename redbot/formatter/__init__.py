@@ -12,14 +12,13 @@ import time
 from typing import Any, Callable, List, Dict, Type, TYPE_CHECKING
 import unittest
 
-from markdown import Markdown
 import thor
 from thor.events import EventEmitter
 
 if TYPE_CHECKING:
     from redbot.resource import HttpResource  # pylint: disable=cyclic-import
 
-_formatters = ["html", "text", "har"]
+_formatters = ["html", "text", "har", "json"]
 
 
 def find_formatter(
@@ -97,7 +96,7 @@ class Formatter(EventEmitter):
         self.lang = config["lang"]
         self.output = output  # output file object
         self.kw = kw  # extra keyword arguments
-        self._markdown = Markdown(output_format="html")
+        self.render_time: float = None  # seconds taken by finish_output()
 
     def bind_resource(self, display_resource: "HttpResource") -> None:
         """
@@ -116,13 +115,20 @@ class Formatter(EventEmitter):
             display_resource.response.on("chunk", self.feed)
             display_resource.on("status", self.status)
             display_resource.on("debug", self.debug)
-            # we want to wait just a little bit, for extra data.
+
             @thor.events.on(display_resource)
             def check_done() -> None:
-                thor.schedule(0.1, self._done)
+                if display_resource.connections_settled():
+                    self._done()
+                else:
+                    # we don't know if there's more to come; wait just a little bit.
+                    thor.schedule(0.1, self._done)
 
     def _done(self) -> None:
-        self.finish_output()
+        started = time.monotonic()
+        with self.resource.timings.measure("render"):
+            self.finish_output()
+        self.render_time = time.monotonic() - started
         self.emit("formatter_done")
 
     def start_output(self) -> None:
@@ -183,6 +189,11 @@ def f_num(i: int, by1024: bool = False) -> str:
     return locale.format_string("%d", i, grouping=True)
 
 
+def f_duration(seconds: float) -> str:
+    "Format a duration in seconds as milliseconds, according to the locale."
+    return locale.format_string("%.1f", seconds * 1000, grouping=True) + " ms"
+
+
 def relative_time(utime: float, now: float = None, show_sign: int = 1) -> str:
     """
     Given two times, return a string that explains how far apart they are.
@@ -5,13 +5,14 @@ HAR Formatter for REDbot.
 
 import datetime
 import json
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Set, Union
 from typing_extensions import TypedDict
 
 from redbot import __version__
 from redbot.formatter import Formatter
 from redbot.message.headers import StrHeaderListType
 from redbot.resource import HttpResource
+from redbot.resource.fetch import PhaseTimer
 
 
 class HarLogDict(TypedDict):
@@ -29,6 +30,10 @@ class HarDict(TypedDict):
 class HarFormatter(Formatter):
     """
     Format a HttpResource object (and any descendants) as HAR.
+
+    Entries are output as each resource completes, rather than all at once at the end. If the
+    compact keyword argument is true, the HAR isn't indented, and notes are identified by their
+    note_id without their (long) text.
     """
 
     can_multiple = True
@@ -43,10 +48,19 @@ class HarFormatter(Formatter):
                 "creator": {"name": "REDbot", "version": __version__},
                 "browser": {"name": "REDbot", "version": __version__},
                 "pages": [],
-                "entries": [],
+                "entries": [],  # streamed; must be last
             }
         }
         self.last_id = 0
+        self.page_id: int = None
+        self.compact = bool(self.kw.get("compact", False))
+        self.entry_count = 0
+        self._written: Set[int] = set()  # ids of the resources that have been output
+        self._tail: str = None  # what closes the document, once entries are started
+
+    def bind_resource(self, display_resource: HttpResource) -> None:
+        display_resource.on("linked_check_done", self.linked_done)
+        Formatter.bind_resource(self, display_resource)
 
     def start_output(self) -> None:
         pass
@@ -57,26 +71,67 @@ class HarFormatter(Formatter):
     def feed(self, sample: bytes) -> None:
         pass
 
+    def linked_done(self, resource: HttpResource) -> None:
+        "Output a linked resource's entry as soon as it's complete."
+        if resource.response.complete:
+            self.add_entry(resource)
+
     def finish_output(self) -> None:
-        "Fill in the template with RED's results."
+        "Output what's left of the HAR, and close it."
         if self.resource.response.complete:
-            page_id = self.add_page(self.resource)
-            self.add_entry(self.resource, page_id)
+            self.add_entry(self.resource)
             for linked_resource in [d[0] for d in self.resource.linked]:
                 # filter out incomplete responses
                 if linked_resource.response.complete:
-                    self.add_entry(linked_resource, page_id)
-        self.output(json.dumps(self.har, indent=4))
+                    self.add_entry(linked_resource)
+        self.start_entries()
+        if self.entry_count and not self.compact:
+            self.output("\n" + " " * 8)
+        self.output(self._tail)
 
     def error_output(self, message: str) -> None:
         self.output(message)
 
-    def add_entry(self, resource: HttpResource, page_ref: int = None) -> None:
+    def start_entries(self) -> None:
+        "Output the HAR up to the start of its entries, if that hasn't happened yet."
+        if self._tail is not None:
+            return
+        doc = self.dumps(self.har)
+        split = doc.rindex("[]") + 1  # the empty entries list
+        self.output(doc[:split])
+        self._tail = doc[split:]
+
+    def add_entry(self, resource: HttpResource) -> None:
+        "Output the entry for resource, unless it already has been."
+        if id(resource) in self._written:
+            return
+        self._written.add(id(resource))
+        if self._tail is None:
+            self.page_id = self.add_page(self.resource)
+            self.start_entries()
+        entry = self.format_entry(resource, self.page_id)
+        self.output(("," if self.entry_count else "") + self.dumps(entry, 3))
+        self.entry_count += 1
+
+    def dumps(self, obj: Any, level: int = 0) -> str:
+        """
+        Serialise obj as JSON. Unless compact, it's indented as if it were nested level deep, so
+        that streamed output matches what json.dumps(..., indent=4) would produce.
+        """
+        if self.compact:
+            return json.dumps(obj, separators=(",", ":"))
+        out = json.dumps(obj, indent=4)
+        if level:
+            indent = "\n" + " " * 4 * level
+            out = indent + out.replace("\n", indent)
+        return out
+
+    def format_entry(
+        self, resource: HttpResource, page_ref: int = None
+    ) -> Dict[str, Any]:
         entry = {
             "startedDateTime": isoformat(resource.request.start_time),
-            "time": int(
-                (resource.response.complete_time - resource.request.start_time) * 1000
-            ),
+            "time": 0,
             "_red_messages": self.format_notes(resource),
         }
         if page_ref:
@@ -111,18 +166,21 @@ class HarFormatter(Formatter):
         }
 
         cache: Dict[None, None] = {}
+        phases = resource.timings.phases()
         timings = {
-            "dns": -1,
-            "connect": -1,
-            "blocked": 0,
+            "dns": har_ms(phases["dns"]),
+            "connect": har_ms(phases["connect"]),
+            "blocked": har_ms(phases["blocked"]),
             "send": 0,
-            "wait": int(
-                (resource.response.start_time - resource.request.start_time) * 1000
-            ),
-            "receive": int(
-                (resource.response.complete_time - resource.response.start_time) * 1000
-            ),
+            "wait": har_ms(phases["wait"]),
+            "receive": har_ms(phases["receive"]),
         }
+        for phase in PhaseTimer.processing_phases:
+            if phases[phase] is not None:
+                timings[f"_red_{phase}"] = har_ms(phases[phase])
+        entry["time"] = round(
+            sum(max(0, timings[phase]) for phase in PhaseTimer.network_phases), 3
+        )
 
         entry.update(
             {
@@ -132,7 +190,7 @@ class HarFormatter(Formatter):
                 "timings": timings,
             }
         )
-        self.har["log"]["entries"].append(entry)
+        return entry
 
     def add_page(self, resource: HttpResource) -> int:
         page_id = self.last_id + 1
@@ -158,11 +216,19 @@ class HarFormatter(Formatter):
                 "category": note.category.name,
                 "level": note.level.name,
                 "summary": note.show_summary(self.lang),
-                "text": note.show_text(self.lang),
             }
+            if not self.compact:
+                msg["text"] = note.show_text(self.lang)
             out.append(msg)
         return out
 
 
+def har_ms(seconds: Union[float, None]) -> float:
+    "Convert seconds to HAR milliseconds; -1 means that the phase didn't happen."
+    if seconds is None:
+        return -1
+    return round(seconds * 1000, 3)
+
+
 def isoformat(timestamp: float) -> str:
     return f"{datetime.datetime.utcfromtimestamp(timestamp).isoformat()}Z"
@@ -20,7 +20,7 @@ from redbot.formatter.html_base import (
 )
 from redbot.resource import HttpResource, active_check
 from redbot.message.headers import HeaderProcessor
-from redbot.speak import Note, levels, categories
+from redbot.speak import Note, levels, categories, markdown_template
 
 
 class SingleEntryHtmlFormatter(BaseHtmlFormatter):
@@ -79,13 +79,6 @@ class SingleEntryHtmlFormatter(BaseHtmlFormatter):
 
     def __init__(self, *args: Any, **kw: Any) -> None:
         BaseHtmlFormatter.__init__(self, *args, **kw)
-        self.templates.filters.update(
-            {
-                "header_present": self.format_header,
-                "header_description": self.format_header_description,
-                "subrequest_messages": self.format_subrequest_messages,
-            }
-        )
         self.header_presenter = HeaderPresenter(self)
 
     def finish_output(self) -> None:
@@ -95,9 +88,9 @@ class SingleEntryHtmlFormatter(BaseHtmlFormatter):
             validator_link = self.validators.get(media_type, None)
             if validator_link:
                 validator_link = validator_link % e_query_arg(self.resource.request.uri)
-            tpl = self.templates.get_template("response_finish.html")
             self.output(
-                tpl.render(
+                self.render(
+                    "response_finish.html",
                     resource=self.resource,
                     body=self.format_body_sample(self.resource),
                     is_resource=isinstance(self.resource, HttpResource),
@@ -206,9 +199,7 @@ class SingleEntryHtmlFormatter(BaseHtmlFormatter):
         if description:
             return Markup(
                 '<span class="tip">'
-                + self._markdown.reset().convert(
-                    description % {"field_name": header_name}
-                )
+                + markdown_template(description) % {"field_name": escape(header_name)}
                 + "</span>"
             )
         return Markup("")
@@ -275,18 +266,12 @@ class TableHtmlFormatter(BaseHtmlFormatter):
     def __init__(self, *args: Any, **kw: Any) -> None:
         BaseHtmlFormatter.__init__(self, *args, **kw)
         self.problems: List[Note] = []
-        self.templates.filters.update(
-            {
-                "index_problem": self.index_problem,
-                "note_description": self.format_note_description,
-            }
-        )
 
     def finish_output(self) -> None:
         self.final_status()
-        tpl = self.templates.get_template("response_multi_finish.html")
         self.output(
-            tpl.render(
+            self.render(
+                "response_multi_finish.html",
                 droid_lists=self.make_droid_lists(self.resource),
                 problems=self.problems,
                 levels=levels,
@@ -328,8 +313,6 @@ class TableHtmlFormatter(BaseHtmlFormatter):
         description = HeaderProcessor.find_header_handler(header_name).description
         if description:
             return Markup(
-                self._markdown.reset().convert(
-                    description % {"field_name": header_name}
-                )
+                markdown_template(description) % {"field_name": escape(header_name)}
             )
         return Markup("")
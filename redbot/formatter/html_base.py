@@ -3,14 +3,22 @@ from functools import partial
 import json
 import os
 import time
-from typing import Any, List, Tuple
+from typing import Any, Callable, Dict, List, Optional, Tuple
 from urllib.parse import urljoin, urlencode, quote as urlquote
 
-from jinja2 import Environment, PackageLoader, select_autoescape
+from jinja2 import (
+    BytecodeCache,
+    Environment,
+    FileSystemBytecodeCache,
+    PackageLoader,
+    pass_context,
+    select_autoescape,
+)
+from jinja2.runtime import Context
 from markupsafe import Markup, escape
 
 from redbot import __version__
-from redbot.formatter import Formatter, relative_time, f_num
+from redbot.formatter import Formatter, relative_time, f_duration, f_num
 from redbot.webui.captcha import CAPTCHA_PROVIDERS
 
 NL = "\n"
@@ -50,9 +58,100 @@ def e_js(instr: str) -> Markup:
     return Markup(instr)
 
 
+def formatter_filter(method_name: str) -> Callable[..., Any]:
+    """
+    Return a template filter that calls method_name on the formatter doing the rendering, which
+    is in the render context.
+    """
+
+    @pass_context
+    def call_formatter(context: Context, *args: Any, **kw: Any) -> Any:
+        return getattr(context["formatter"], method_name)(*args, **kw)
+
+    return call_formatter
+
+
+def bytecode_cache() -> Optional[BytecodeCache]:
+    "Keep compiled templates in a per-user temporary directory, if one can be made safely."
+    try:
+        return FileSystemBytecodeCache()
+    except RuntimeError:
+        return None
+
+
+class ExtraContent:
+    """
+    An in-memory cache of the files in extra_dir, by extension.
+
+    The directory is checked for changes (by file name and mtime) at most every check_interval
+    seconds, and is only read again if something has changed.
+    """
+
+    check_interval = 5.0
+    etypes = [".html", ".js"]
+
+    def __init__(self) -> None:
+        self.extra_dir: str = None
+        self.last_check: float = 0.0
+        self._mtimes: Dict[str, float] = {}
+        self._content: Dict[str, Markup] = {}
+
+    def get(self, extra_dir: str, etype: str) -> Markup:
+        "Return the content of the files in extra_dir with the extension etype."
+        if (
+            extra_dir != self.extra_dir
+            or time.monotonic() - self.last_check > self.check_interval
+        ):
+            self.load(extra_dir)
+        return self._content.get(etype, Markup(""))
+
+    def load(self, extra_dir: str) -> None:
+        "Check extra_dir for changes, and read it again if there are any."
+        self.last_check = time.monotonic()
+        mtimes = {}
+        if extra_dir and os.path.isdir(extra_dir):
+            for extra_file in sorted(os.listdir(extra_dir)):
+                if os.path.splitext(extra_file)[1] not in self.etypes:
+                    continue
+                try:
+                    mtimes[extra_file] = os.stat(
+                        os.path.join(extra_dir, extra_file)
+                    ).st_mtime
+                except OSError:
+                    continue
+        if extra_dir == self.extra_dir and mtimes == self._mtimes:
+            return
+        self.extra_dir = extra_dir
+        self._mtimes = mtimes
+        content: Dict[str, List[str]] = {}
+        for extra_file in mtimes:
+            extra_path = os.path.join(extra_dir, extra_file)
+            try:
+                with codecs.open(
+                    extra_path,
+                    mode="r",
+                    encoding="utf-8",
+                    errors="replace",
+                ) as fh:
+                    text = fh.read()
+            except IOError as why:
+                text = f"<!-- error opening {extra_file}: {why} -->"
+            content.setdefault(os.path.splitext(extra_file)[1], []).append(text)
+        self._content = {
+            etype: Markup(NL.join(texts)) for etype, texts in content.items()
+        }
+
+
+extra_content = ExtraContent()
+
+
 class BaseHtmlFormatter(Formatter):
     """
-    Base class for HTML formatters."""
+    Base class for HTML formatters.
+
+    The template Environment is shared, so it must not be changed per request; anything that
+    varies by request goes into the render context (see render()).
+    """
 
     media_type = "text/html"
     templates = Environment(
@@ -62,34 +161,45 @@ class BaseHtmlFormatter(Formatter):
             enabled_extensions=("html", "xml"),
             default_for_string=True,
         ),
+        bytecode_cache=bytecode_cache(),
     )
+    templates.filters.update(
+        {
+            "f_num": f_num,
+            "f_duration": f_duration,
+            "relative_time": relative_time,
+            "redbot_link": formatter_filter("redbot_link"),
+            "header_present": formatter_filter("format_header"),
+            "header_description": formatter_filter("format_header_description"),
+            "subrequest_messages": formatter_filter("format_subrequest_messages"),
+            "index_problem": formatter_filter("index_problem"),
+            "note_description": formatter_filter("format_note_description"),
+        }
+    )
+    templates.globals.update({"version": __version__})
 
     def __init__(self, *args: Any, **kw: Any) -> None:
         Formatter.__init__(self, *args, **kw)
-        self.templates.filters.update(
-            {
-                "f_num": f_num,
-                "relative_time": relative_time,
-                "redbot_link": self.redbot_link,
-            }
-        )
         captcha_provider = self.config.get("captcha_provider", "")
         captcha_data = CAPTCHA_PROVIDERS.get(captcha_provider, {})
-        self.templates.globals.update(
-            {
-                "formatter": self,
-                "version": __version__,
-                "baseuri": self.config["ui_uri"],
-                "static": self.config["static_root"],
-                "captcha_provider": captcha_provider,
-                "captcha_script_url": Markup(
-                    captcha_data.get("script_url", b"").decode("ascii")
-                ),
-                "nonce": self.kw["nonce"],
-            }
-        )
+        self.template_vars: Dict[str, Any] = {
+            "formatter": self,
+            "baseuri": self.config["ui_uri"],
+            "static": self.config["static_root"],
+            "captcha_provider": captcha_provider,
+            "captcha_script_url": Markup(
+                captcha_data.get("script_url", b"").decode("ascii")
+            ),
+            "nonce": self.kw["nonce"],
+        }
         self.start = time.time()
 
+    def render(self, template_name: str, **kw: Any) -> str:
+        "Render the named template with this formatter's context, plus kw."
+        return self.templates.get_template(template_name).render(
+            self.template_vars, **kw
+        )
+
     def feed(self, sample: bytes) -> None:
         pass
 
@@ -112,9 +222,9 @@ class BaseHtmlFormatter(Formatter):
         descend = ""
         if self.kw.get("descend", False):
             descend = "&descend=True"
-        tpl = self.templates.get_template("response_start.html")
         self.output(
-            tpl.render(
+            self.render(
+                "response_start.html",
                 html_uri=uri,
                 test_id=self.kw.get("test_id", ""),
                 config=Markup(
@@ -141,16 +251,14 @@ class BaseHtmlFormatter(Formatter):
         The bottom bits.
         """
         self.output(self.format_extra())
-        tpl = self.templates.get_template("footer.html")
-        self.output(tpl.render())
+        self.output(self.render("footer.html"))
 
     def error_output(self, message: str) -> None:
         """
         Something bad happened.
         """
         self.output(f"<p class='error'>{message}</p>")
-        tpl = self.templates.get_template("footer.html")
-        self.output(tpl.render(baseuri=self.config["ui_uri"]))
+        self.output(self.render("footer.html"))
 
     def status(self, status: str) -> None:
         "Update the status bar of the browser"
@@ -195,26 +303,7 @@ console.log("{time.time() - self.start:3.3f} {e_js(message)}");
           - '.js': javascript block (with script tag surrounding)
             included on every page view.
         """
-        out = []
-        if self.config.get("extra_dir", "") and os.path.isdir(self.config["extra_dir"]):
-            extra_files = [
-                p
-                for p in os.listdir(self.config["extra_dir"])
-                if os.path.splitext(p)[1] == etype
-            ]
-            for extra_file in extra_files:
-                extra_path = os.path.join(self.config["extra_dir"], extra_file)
-                try:
-                    with codecs.open(
-                        extra_path,
-                        mode="r",
-                        encoding="utf-8",
-                        errors="replace",
-                    ) as fh:
-                        out.append(fh.read())
-                except IOError as why:
-                    out.append(f"<!-- error opening {extra_file}: {why} -->")
-        return Markup(NL.join(out))
+        return extra_content.get(self.config.get("extra_dir", ""), etype)
 
     def redbot_link(
         self,
@@ -0,0 +1,207 @@
+"""
+JSON Formatter for REDbot.
+
+Results are streamed as newline-delimited JSON (NDJSON): one object per line, each with an "event"
+member identifying it. In order:
+
+ - "start": {"schema": SCHEMA_VERSION, "uri": str, "descend": bool}
+ - "progress" (any number): {"message": str}
+ - "resource" (one per completed resource; linked resources first, then the top-level one):
+    {
+     "uri": str, "method": str, "link_tag": str or null (for linked resources),
+     "request_headers": [[name, value], ...],
+     "complete": bool, "error": str or null,
+     "status": str, "status_phrase": str, "version": str,
+     "headers": [[name, value], ...],
+     "parsed_headers": {lowercase name: parsed value, ...} (see below),
+     "payload": {"length": int, "decoded_length": int, "header_length": int},
+     "timing": {"start": float, "response_start": float, "complete": float} (epoch seconds),
+        with "phases": {phase: seconds or null, ...} (see redbot.resource.fetch.PhaseTimer),
+     "notes": [{"note_id": str, "subject": str, "level": str, "category": str, "vars": {}}],
+     "subrequests": [
+        {"check_name": str, "started": bool, "complete": bool, "error": str or null,
+         "status": str or null}, ...
+     ]
+    }
+ - "summary" (last): {"uri": str, "resources": int, "notes": {level: count}, "test_id": str}
+ - "error": {"message": str}, in place of everything else, if the test couldn't run.
+
+Parsed header values are whatever each header's handler makes of it, converted by json_value():
+strings, integers, booleans and null as they are; tuples and lists as arrays; dicts as objects
+(note vars are converted the same way). For example:
+
+    "content-length": 5
+    "date": 946684799 (epoch seconds; also for Expires, Last-Modified, etc.)
+    "content-type": ["text/html", {"charset": "utf-8"}]
+    "cache-control": [["max-age", 60], ["public", null]]
+    "etag": [true, "x"] ([weak, tag])
+    "link": [["/a", {"rel": "next"}]]
+    "set-cookie": [["name", "value", [["Path", "/"], ["Max-Age", 5]]]]
+    "vary": ["accept"]
+
+Note text isn't included, so nothing is rendered; note_id and vars identify a note precisely.
+Members may be added to these objects without SCHEMA_VERSION changing, but not removed or altered.
+"""
+
+from collections import Counter
+import json
+from typing import Any, Dict, List, Set
+import typing
+
+from redbot.formatter import Formatter
+from redbot.message import HttpResponse
+from redbot.resource import HttpResource
+from redbot.resource.fetch import RedFetcher
+
+SCHEMA_VERSION = 1
+
+
+class JsonFormatter(Formatter):
+    """
+    Format a HttpResource object (and any descendants) as a stream of JSON events.
+    """
+
+    can_multiple = True
+    name = "json"
+    media_type = "application/x-ndjson"
+
+    def __init__(self, *args: Any, **kw: Any) -> None:
+        Formatter.__init__(self, *args, **kw)
+        self.started = False
+        self.note_counts: typing.Counter[str] = Counter()
+        self.resource_count = 0
+        self._written: Set[int] = set()  # ids of the resources that have been output
+
+    def bind_resource(self, display_resource: HttpResource) -> None:
+        display_resource.on("linked_check_done", self.linked_done)
+        Formatter.bind_resource(self, display_resource)
+
+    def start_output(self) -> None:
+        if self.started:
+            return
+        self.started = True
+        self.emit_event(
+            "start",
+            schema=SCHEMA_VERSION,
+            uri=self.resource.request.uri,
+            descend=bool(self.kw.get("descend", False)),
+        )
+
+    def feed(self, sample: bytes) -> None:
+        pass
+
+    def status(self, status: str) -> None:
+        self.emit_event("progress", message=status)
+
+    def linked_done(self, resource: HttpResource) -> None:
+        self.add_resource(resource)
+
+    def finish_output(self) -> None:
+        for linked_resource, _ in getattr(self.resource, "linked", []):
+            self.add_resource(linked_resource)
+        self.add_resource(self.resource)
+        self.emit_event(
+            "summary",
+            uri=self.resource.request.uri,
+            resources=self.resource_count,
+            notes=dict(self.note_counts),
+            test_id=self.kw.get("test_id", None),
+        )
+
+    def error_output(self, message: str) -> None:
+        self.emit_event("error", message=message)
+
+    def emit_event(self, event: str, **members: Any) -> None:
+        "Output an event as a line of JSON."
+        self.output(
+            json.dumps({"event": event, **members}, separators=(",", ":")) + "\n"
+        )
+
+    def add_resource(self, resource: RedFetcher) -> None:
+        "Output the event for a resource, unless it already has been."
+        if id(resource) in self._written:
+            return
+        self._written.add(id(resource))
+        self.resource_count += 1
+        for note in resource.notes:
+            self.note_counts[note.level.value] += 1
+        self.emit_event("resource", **self.format_resource(resource))
+
+    def format_resource(self, resource: RedFetcher) -> Dict[str, Any]:
+        response = resource.response
+        link_tag = None
+        for linked_resource, tag in getattr(self.resource, "linked", []):
+            if linked_resource is resource:
+                link_tag = tag
+        return {
+            "uri": resource.request.uri,
+            "method": resource.request.method,
+            "link_tag": link_tag,
+            "request_headers": resource.request.headers,
+            "complete": response.complete,
+            "error": error_desc(response),
+            "status": response.status_code,
+            "status_phrase": response.status_phrase,
+            "version": response.version,
+            "headers": response.headers,
+            "parsed_headers": json_value(response.parsed_headers),
+            "payload": {
+                "length": response.payload_len,
+                "decoded_length": response.decoded_len,
+                "header_length": response.header_length,
+            },
+            "timing": {
+                "start": resource.request.start_time,
+                "response_start": response.start_time,
+                "complete": response.complete_time,
+                "phases": resource.timings.phases(),
+            },
+            "notes": self.format_notes(resource),
+            "subrequests": [
+                self.format_subrequest(subreq)
+                for subreq in getattr(resource, "subreqs", {}).values()
+            ],
+        }
+
+    @staticmethod
+    def format_notes(resource: RedFetcher) -> List[Dict[str, Any]]:
+        return [
+            {
+                "note_id": note.__class__.__name__,
+                "subject": note.subject,
+                "level": note.level.value,
+                "category": note.category.value,
+                "vars": json_value(note.vars),
+            }
+            for note in resource.notes
+        ]
+
+    @staticmethod
+    def format_subrequest(subreq: RedFetcher) -> Dict[str, Any]:
+        return {
+            "check_name": subreq.check_name,
+            "started": subreq.fetch_started,
+            "complete": subreq.response.complete,
+            "error": error_desc(subreq.response),
+            "status": subreq.response.status_code,
+        }
+
+
+def error_desc(response: HttpResponse) -> str:
+    if response.http_error is None:
+        return None
+    return response.http_error.desc
+
+
+def json_value(value: Any) -> Any:
+    """
+    Convert a parsed value (see the module docstring) into something that json.dumps() handles
+    the same way every time. Values of any other type are given as strings.
+    """
+    if value is None or isinstance(value, (str, bool, int, float)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [json_value(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): json_value(item) for key, item in value.items()}
+    return str(value)
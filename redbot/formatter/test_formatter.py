@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+
+from configparser import ConfigParser
+import json
+import os
+import tempfile
+import unittest
+from typing import Any, List, cast
+
+import thor
+
+from redbot.formatter import find_formatter
+from redbot.resource import HttpResource
+from redbot.resource.replay import ReplayHttpClient, canned_record
+from redbot.speak import Note, levels, categories, markdown_template
+from redbot.webui import RedWebUi  # pylint: disable=unused-import
+from redbot.formatter.html_base import ExtraContent  # after webui; see its imports
+from redbot.formatter.json import json_value
+from redbot.formatter.text import TextFormatter
+
+RECORDS = [
+    canned_record(
+        "http://example.com/",
+        b'<html><img src="a.png"><img src="b.png"></html>',
+        [["Content-Type", "text/html"]],
+    ),
+    canned_record("http://example.com/a.png", b"png", [["Content-Type", "image/png"]]),
+    canned_record("http://example.com/b.png", b"png", [["Content-Type", "image/png"]]),
+]
+
+
+def run_formatter(
+    name: str, descend: bool = True, check_name: str = None, **kw: Any
+) -> List[str]:
+    """
+    Check http://example.com/ (and its assets) from RECORDS; return the output chunks.
+
+    If check_name is given, format that subrequest rather than the resource itself.
+    """
+    config = ConfigParser()
+    config.read_dict(
+        {
+            "redbot": {
+                "lang": "en",
+                "charset": "utf-8",
+                "ui_uri": "https://redbot.example/",
+                "static_root": "static",
+            }
+        }
+    )
+    resource = HttpResource(config["redbot"], descend=descend)
+    resource.client = ReplayHttpClient(RECORDS)
+    resource.set_request("http://example.com/", req_hdrs=[("User-Agent", "test")])
+    chunks: List[str] = []
+    formatter = find_formatter(name, multiple=descend)(
+        config["redbot"], resource, chunks.append, descend=descend, **kw
+    )
+    if check_name:
+        formatter.bind_resource(cast(HttpResource, resource.subreqs[check_name]))
+    else:
+        formatter.bind_resource(resource)
+    formatter.on("formatter_done", thor.stop)
+    resource.check()
+    thor.run()
+    return chunks
+
+
+class HarFormatterTester(unittest.TestCase):
+    def run_har(self, **kw: Any) -> List[str]:
+        return run_formatter("har", **kw)
+
+    def test_streamed(self) -> None:
+        chunks = self.run_har()
+        self.assertGreater(len(chunks), 3)
+        har = json.loads("".join(chunks))
+        self.assertEqual(
+            sorted(entry["request"]["url"] for entry in har["log"]["entries"]),
+            [
+                "http://example.com/",
+                "http://example.com/a.png",
+                "http://example.com/b.png",
+            ],
+        )
+        self.assertEqual(len(har["log"]["pages"]), 1)
+        self.assertEqual("".join(chunks), json.dumps(har, indent=4))
+        notes = har["log"]["entries"][0]["_red_messages"]
+        self.assertTrue(notes)
+        self.assertTrue(all("text" in note for note in notes))
+        for entry in har["log"]["entries"]:
+            timings = entry["timings"]
+            self.assertEqual(timings["dns"], -1)  # replayed; no connection
+            self.assertGreaterEqual(timings["wait"], 0)
+            self.assertGreaterEqual(timings["_red_headers"], 0)
+
+    def test_compact(self) -> None:
+        out = "".join(self.run_har(compact=True))
+        self.assertNotIn("\n", out)
+        har = json.loads(out)
+        self.assertEqual(len(har["log"]["entries"]), 3)
+        for entry in har["log"]["entries"]:
+            for note in entry["_red_messages"]:
+                self.assertIn("note_id", note)
+                self.assertNotIn("text", note)
+
+
+class JsonFormatterTester(unittest.TestCase):
+    def test_json_value(self) -> None:
+        self.assertEqual(
+            json_value(
+                {"a": ("text/html", {"charset": "utf-8"}), "b": [(True, "x"), None]}
+            ),
+            {"a": ["text/html", {"charset": "utf-8"}], "b": [[True, "x"], None]},
+        )
+        self.assertEqual(json_value({1: {"x"}}), {"1": "{'x'}"})
+
+    def test_events(self) -> None:
+        chunks = run_formatter("json", test_id="abc")
+        self.assertTrue(all(chunk.endswith("\n") for chunk in chunks))
+        events = [json.loads(line) for line in "".join(chunks).splitlines()]
+        self.assertEqual(events[0]["event"], "start")
+        self.assertEqual(events[0]["schema"], 1)
+        self.assertIn("progress", [event["event"] for event in events])
+        resources = [event for event in events if event["event"] == "resource"]
+        self.assertEqual(
+            [event["uri"] for event in resources],
+            [
+                "http://example.com/a.png",
+                "http://example.com/b.png",
+                "http://example.com/",
+            ],
+        )
+        top = resources[-1]
+        self.assertEqual(top["status"], "200")
+        self.assertIsNone(top["link_tag"])
+        self.assertEqual(resources[0]["link_tag"], "img")
+        self.assertEqual(top["parsed_headers"]["content-length"], 47)
+        self.assertEqual(top["parsed_headers"]["content-type"], ["text/html", {}])
+        self.assertTrue(top["subrequests"])
+        self.assertTrue(top["notes"])
+        for note in top["notes"]:
+            self.assertEqual(
+                set(note), {"note_id", "subject", "level", "category", "vars"}
+            )
+        summary = events[-1]
+        self.assertEqual(summary["event"], "summary")
+        self.assertEqual(summary["resources"], 3)
+        self.assertEqual(summary["test_id"], "abc")
+        self.assertEqual(
+            sum(summary["notes"].values()),
+            sum(len(event["notes"]) for event in resources),
+        )
+
+
+class TextFormatterTester(unittest.TestCase):
+    def test_timings(self) -> None:
+        self.assertNotIn("* Timings:", "".join(run_formatter("text")))
+        out = "".join(run_formatter("text", timings=True))
+        self.assertEqual(out.count("* Timings:\n  * wait: "), 3)
+
+    def test_timings_leave_out_render(self) -> None:
+        config = ConfigParser()
+        config.read_dict({"redbot": {}})
+        resource = HttpResource(config["redbot"])
+        resource.timings.durations.update({"headers": 0.5, "render": 1.0})
+        out = TextFormatter.format_timings(resource)
+        self.assertIn("headers", out)
+        self.assertNotIn("render", out)
+
+
+class HtmlFormatterTester(unittest.TestCase):
+    def test_single(self) -> None:
+        out = "".join(run_formatter("html", descend=False, nonce="nonce1"))
+        self.assertIn('nonce="nonce1"', out)
+        self.assertIn("class='hdr'>Content-Type:text/html<span class=\"tip\">", out)
+        self.assertIn("<td>headers</td>", out)
+        self.assertIn("</html>", out)
+
+    def test_multiple(self) -> None:
+        out = "".join(run_formatter("html", nonce="nonce2"))
+        self.assertIn('nonce="nonce2"', out)
+        self.assertIn("a.png", out)
+        self.assertIn("</html>", out)
+
+    def test_subrequest(self) -> None:
+        out = "".join(
+            run_formatter(
+                "html", descend=False, check_name="Content Negotiation", nonce="nonce4"
+            )
+        )
+        self.assertIn("Content Negotiation response", out)
+        self.assertIn("</html>", out)
+
+    def test_environment_unchanged(self) -> None:
+        templates = find_formatter("html").templates  # type: ignore
+        filters, env_globals = dict(templates.filters), dict(templates.globals)
+        run_formatter("html", descend=False, nonce="nonce3")
+        self.assertEqual(templates.filters, filters)
+        self.assertEqual(templates.globals, env_globals)
+        self.assertNotIn("nonce", templates.globals)
+
+
+class ExtraContentTester(unittest.TestCase):
+    def setUp(self) -> None:
+        self.dir = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.write("a.html", "<p>a</p>")
+        self.write("b.js", "b();")
+        self.extra = ExtraContent()
+
+    def tearDown(self) -> None:
+        self.dir.cleanup()
+
+    def write(self, name: str, content: str, mtime: float = 1000000000.0) -> None:
+        path = os.path.join(self.dir.name, name)
+        with open(path, "w", encoding="utf-8") as fh:
+            fh.write(content)
+        os.utime(path, (mtime, mtime))
+
+    def test_get(self) -> None:
+        self.assertEqual(self.extra.get(self.dir.name, ".html"), "<p>a</p>")
+        self.assertEqual(self.extra.get(self.dir.name, ".js"), "b();")
+        self.assertEqual(self.extra.get(self.dir.name, ".css"), "")
+        self.assertEqual(self.extra.get("", ".html"), "")
+
+    def test_reload(self) -> None:
+        self.extra.get(self.dir.name, ".html")
+        self.write("a.html", "<p>changed</p>", mtime=1000000001.0)
+        self.write("c.html", "<p>c</p>")
+        self.assertEqual(self.extra.get(self.dir.name, ".html"), "<p>a</p>")
+        self.extra.last_check -= ExtraContent.check_interval + 1
+        self.assertEqual(
+            self.extra.get(self.dir.name, ".html"), "<p>changed</p>\n<p>c</p>"
+        )
+
+
+class MarkdownTemplateTester(unittest.TestCase):
+    class TEST_NOTE(Note):
+        category = categories.GENERAL
+        level = levels.INFO
+        summary = "%(name)s"
+        text = """\
+The `%(name)s` value is *%(value).5s*, which is 100%% wrong."""
+
+    def test_template(self) -> None:
+        self.assertEqual(
+            markdown_template(self.TEST_NOTE.text),
+            "<p>The <code>%(name)s</code> value is <em>%(value).5s</em>, "
+            "which is 100%% wrong.</p>",
+        )
+
+    def test_show_text(self) -> None:
+        note = self.TEST_NOTE("subject", {"name": "<a&b>", "value": "*abcdefg*"})
+        self.assertEqual(
+            note.show_text("en"),
+            "<p>The <code>&lt;a&amp;b&gt;</code> value is <em>*abcd</em>, "
+            "which is 100% wrong.</p>",
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -10,7 +10,7 @@ from typing import Any, List
 
 import thor.http.error as httperr
 
-from redbot.formatter import Formatter
+from redbot.formatter import Formatter, f_duration
 from redbot.message import HttpResponse
 from redbot.resource import HttpResource
 from redbot.speak import Note, levels, categories
@@ -47,6 +47,7 @@ class BaseTextFormatter(Formatter):
     def __init__(self, *args: Any, **kw: Any) -> None:
         Formatter.__init__(self, *args, **kw)
         self.verbose = False
+        self.show_timings = bool(self.kw.get("timings"))
 
     def start_output(self) -> None:
         pass
@@ -69,6 +70,8 @@ class BaseTextFormatter(Formatter):
             )
             self.output(self.format_headers(self.resource.response) + NL + NL)
             self.output(self.format_recommendations(self.resource) + NL)
+            if self.show_timings:
+                self.output(self.format_timings(self.resource) + NL)
         else:
             if self.resource.response.http_error is None:
                 pass
@@ -89,6 +92,15 @@ class BaseTextFormatter(Formatter):
         ]
         return NL.join(out + [f"{h[0]}:{h[1]}" for h in response.headers])
 
+    @staticmethod
+    def format_timings(resource: HttpResource) -> str:
+        # render isn't done until after this is output, so it's left out
+        out = ["* Timings:"]
+        for phase, seconds in resource.timings.phases().items():
+            if seconds is not None and phase != "render":
+                out.append(f"  * {phase}: {f_duration(seconds)}")
+        return NL.join(out) + NL
+
     def format_recommendations(self, resource: HttpResource) -> str:
         return "".join(
             [
@@ -190,6 +202,8 @@ class TextListFormatter(BaseTextFormatter):
                     self.output(self.format_uri(subresource) + NL + NL)
                     self.output(self.format_headers(subresource.response) + NL + NL)
                     self.output(self.format_recommendations(subresource) + NL + NL)
+                    if self.show_timings:
+                        self.output(self.format_timings(subresource) + NL)
 
     def format_uri(self, resource: HttpResource) -> str:
         return self.colorize(None, resource.request.uri)
@@ -49,6 +49,7 @@ class HttpMessage(thor.events.EventEmitter):
         self.is_head_response = False
         self.start_time: float = None
         self.complete: bool = False
+        self.truncated: bool = False  # body wasn't read to the end
         self.complete_time: float = None
         self.headers: StrHeaderListType = []
         self.parsed_headers: HeaderDictType = {}
@@ -152,6 +153,8 @@ class HttpMessage(thor.events.EventEmitter):
         """
         Signal that the body is done. Complete should be True if we
         know it's complete (e.g., final chunk, Content-Length).
+
+        If the body is truncated, its length and MD5 can't be checked.
         """
         self.complete = complete
         self.complete_time = time.time()
@@ -163,6 +166,7 @@ class HttpMessage(thor.events.EventEmitter):
             isinstance(self, HttpResponse)
             and not self.is_head_response
             and self.status_code not in ["304"]
+            and not self.truncated
         ):
             # check payload basics
             if "content-length" in self.parsed_headers:
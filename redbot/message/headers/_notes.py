@@ -153,6 +153,16 @@ class HEADER_TOO_LARGE(Note):
 Some implementations limit the size of any single header line."""
 
 
+class HEADER_CHECKS_SKIPPED(Note):
+    category = categories.GENERAL
+    level = levels.WARN
+    summary = "REDbot didn't completely check the %(field_name)s header."
+    text = """\
+The %(field_name)s header is too large or too complex for REDbot to check in a reasonable amount
+of time, so some of its values haven't been checked. Other implementations may have trouble with
+it too."""
+
+
 class HEADER_NAME_ENCODING(Note):
     category = categories.GENERAL
     level = levels.BAD
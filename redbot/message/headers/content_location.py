@@ -20,3 +20,10 @@ class ContentLocationTest(headers.HeaderTest):
     name = "Content-Location"
     inputs = [b"/foo"]
     expected_out = "/foo"
+
+
+class LargeContentLocationTest(headers.HeaderTest):
+    name = "Content-Location"
+    inputs = [b"/" + b"=" * 5000]
+    expected_out = "/" + "=" * 5000
+    expected_err = [headers.HEADER_TOO_LARGE, headers.HEADER_CHECKS_SKIPPED]
@@ -100,3 +100,31 @@ class GeneralHeaderTesters(unittest.TestCase):
                 f"[{i}] {str(expected_pd)} != {str(param_dict)}",
             )
             i += 1
+
+    def test_split_list_header(self) -> None:
+        for (instr, expected_outlist) in [
+            ("a, b,c", ["a", "b", "c"]),
+            ('a="b,c", d', ['a="b,c"', "d"]),
+            (r'a="b\",c", d', [r'a="b\",c"', "d"]),
+            ("a, ,, b,", ["a", "b"]),
+            ('a="b, c', ['a="b, c']),
+            ("", []),
+        ]:
+            self.assertEqual(
+                expected_outlist, headers.HttpHeader.split_list_header(instr)
+            )
+
+    def test_parse_time_guard(self) -> None:
+        msg = DummyMsg()
+        max_parse_time = headers.MAX_PARSE_TIME
+        headers.MAX_PARSE_TIME = 0
+        try:
+            msg.headers, msg.parsed_headers = headers.HeaderProcessor(msg).process(
+                [(b"Cache-Control", b"max-age=60"), (b"Cache-Control", b"public")]
+            )
+        finally:
+            headers.MAX_PARSE_TIME = max_parse_time
+        self.assertEqual(msg.note_classes, ["HEADER_CHECKS_SKIPPED"])
+        self.assertEqual(
+            msg.parsed_headers["cache-control"], [("max-age", 60), ("public", None)]
+        )
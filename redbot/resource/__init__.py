@@ -10,6 +10,7 @@ See webui.py for the Web front-end.
 """
 
 from configparser import SectionProxy
+from functools import partial
 import sys
 from typing import List, Dict, Set, Tuple, Union
 from urllib.parse import urljoin
@@ -19,6 +20,7 @@ import thor
 from redbot.formatter import f_num
 from redbot.message import link_parse
 from redbot.resource.fetch import RedFetcher
+from redbot.resource.trace import format_critical_path
 from redbot.resource.active_check import active_checks
 
 
@@ -62,7 +64,7 @@ class HttpResource(RedFetcher):
         self._link_parser = link_parse.HTMLLinkParser(
             self.response, [self.process_link]
         )
-        self.response.on("chunk", self._link_parser.feed_bytes)
+        self.response.on("chunk", self._parse_links)
 
     #        self.show_task_map(True) # for debugging
 
@@ -76,10 +78,21 @@ class HttpResource(RedFetcher):
                 active_check.check()
 
     def add_check(self, *resources: RedFetcher) -> None:
-        "Remember a subordinate check on one or more HttpResource instance."
+        """
+        Remember a subordinate check on one or more HttpResource instance. They use the same
+        client and profile as this resource, are traced if it is, share its deadline if it has
+        one, and don't have a higher priority than it.
+        """
         # pylint: disable=cell-var-from-loop
         for resource in resources:
             self._task_map.add(resource)
+            resource.client = self.client
+            resource.timings.profile = self.timings.profile
+            if self.timings.spans is not None and resource.timings.spans is None:
+                resource.timings.spans = []
+            resource.priority = max(resource.priority, self.priority)
+            if resource.deadline is None:
+                resource.set_deadline(self.deadline)
 
             @thor.events.on(resource)
             def status(message: str) -> None:
@@ -107,17 +120,34 @@ class HttpResource(RedFetcher):
         #        self.emit("debug", "%s checks remaining: %i" % (repr(self), tasks_left))
         if tasks_left == 0:
             self.check_done = True
+            self.timings.mark("check_done")
             self.emit("check_done")
 
+    def connections_settled(self) -> bool:
+        """
+        Return True if all of the fetches for this resource, its subrequests and linked resources
+        are known to have nothing more to report.
+        """
+        return (
+            RedFetcher.connections_settled(self)
+            and all(subreq.connections_settled() for subreq in self.subreqs.values())
+            and all(linked.connections_settled() for linked, _ in self.linked)
+        )
+
     def show_task_map(self, watch: bool = False) -> Union[str, None]:
         """
-        Show the task map for debugging.
+        Show the critical path of the check for debugging: the chain of checks that it's waiting
+        for (or if it's done, the chain that finished last).
         """
         if self._task_map and watch:
-            sys.stderr.write(f"* {self} - {self._task_map}\n")
-            thor.schedule(5, self.show_task_map)
+            sys.stderr.write(f"* {format_critical_path(self)}\n")
+            thor.schedule(5, self.show_task_map, True)
             return None
-        return repr(self._task_map)
+        return format_critical_path(self)
+
+    def _parse_links(self, chunk: bytes) -> None:
+        with self.timings.measure("links"):
+            self._link_parser.feed_bytes(chunk)
 
     def process_link(self, base: str, link: str, tag: str, title: str) -> None:
         "Handle a link from content."
@@ -131,8 +161,11 @@ class HttpResource(RedFetcher):
             and self.link_count <= (self.config.getint("max_links", fallback=100))
         ):
             linked = HttpResource(self.config)
+            linked.priority = self.priority + 1  # after the resources that link to them
             linked.set_request(urljoin(base, link), req_hdrs=self.request.headers)
             self.linked.append((linked, tag))
+            # before add_check, so that this is emitted ahead of our own check_done
+            linked.on("check_done", partial(self.emit, "linked_check_done", linked))
             self.add_check(linked)
             linked.check()
         self.links[tag].add(link)
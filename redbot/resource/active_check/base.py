@@ -44,6 +44,7 @@ class SubRequest(RedFetcher, metaclass=ABCMeta):
         if self.preflight():
             self.done()
         self.check_done = True
+        self.timings.mark("check_done")
         self.emit("check_done")
 
     def check(self) -> None:
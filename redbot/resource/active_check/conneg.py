@@ -88,7 +88,8 @@ class ConnegCheck(SubRequest):
                 )
 
             # check body
-            if bare.payload_md5 != negotiated.decoded_md5:
+            truncated = bare.truncated or negotiated.truncated
+            if not truncated and bare.payload_md5 != negotiated.decoded_md5:
                 self.add_base_note("body", VARY_BODY_MISMATCH)
 
             # check ETag
@@ -99,6 +100,10 @@ class ConnegCheck(SubRequest):
                     self.add_base_note("header-etag", VARY_ETAG_DOESNT_CHANGE)
 
             # check compression efficiency
+            if truncated:
+                self.base.gzip_support = True
+                self.add_base_note("header-content-encoding", CONNEG_GZIP_TRUNCATED)
+                return
             if negotiated.payload_len > 0 and bare.payload_len > 0:
                 savings = int(
                     100
@@ -132,6 +137,18 @@ class ConnegCheck(SubRequest):
                 )
 
 
+class CONNEG_GZIP_TRUNCATED(Note):
+    category = categories.CONNEG
+    level = levels.GOOD
+    summary = "Content negotiation for gzip compression is supported."
+    text = """\
+HTTP supports compression of responses by negotiating for `Content-Encoding`. When REDbot asked
+for a compressed response, the resource provided one.
+
+Because the response body was too large for REDbot to download completely, it couldn't compare the
+compressed and uncompressed bodies, or work out how much compression saves."""
+
+
 class CONNEG_SUBREQ_PROBLEM(Note):
     category = categories.CONNEG
     level = levels.INFO
@@ -0,0 +1,233 @@
+"""
+Name resolution helpers for RedFetcher.
+
+DnsCache remembers lookups so that subrequests and linked resources on the same host don't
+resolve it again, and AddressFilter decides whether REDbot is allowed to connect to an address.
+"""
+
+from bisect import bisect_right
+from configparser import SectionProxy
+import ipaddress
+import socket
+import time
+from typing import Callable, Dict, Iterable, List, Tuple, Union
+
+from thor.dns import lookup, DnsResultList
+from thor.http.client import HttpConnectionInitiate, HttpClient
+from thor.http.common import OriginType
+from thor.tcp import TcpConnection
+
+# Connection error detail when every address for a host is filtered out.
+ACCESS_DENIED = "Access to that address is not allowed"
+
+# Networks that REDbot won't connect to unless enable_local_access is set.
+LOCAL_NETWORKS = [
+    # private
+    "10.0.0.0/8",
+    "100.64.0.0/10",
+    "172.16.0.0/12",
+    "192.0.0.0/24",
+    "192.168.0.0/16",
+    "198.18.0.0/15",
+    "fc00::/7",
+    "fec0::/10",
+    # loopback
+    "127.0.0.0/8",
+    "::1/128",
+    # link local
+    "169.254.0.0/16",
+    "fe80::/10",
+    # not unicast
+    "0.0.0.0/8",
+    "224.0.0.0/4",
+    "255.255.255.255/32",
+    "::/128",
+    "ff00::/8",
+]
+
+
+class AddressFilter:
+    """
+    Decide whether connecting to an IP address is allowed.
+
+    Networks are compiled into sorted, merged integer ranges when the filter is created, so that
+    checking an address is a couple of binary searches. Allowed networks take precedence over
+    denied ones.
+    """
+
+    def __init__(self, deny: Iterable[str], allow: Iterable[str] = None) -> None:
+        self._deny = self._compile(deny)
+        self._allow = self._compile(allow or [])
+
+    def __bool__(self) -> bool:
+        return any(starts for starts, _ in self._deny.values())
+
+    def check(self, address: str) -> bool:
+        "Return True if connecting to address is allowed."
+        try:
+            addr = ipaddress.ip_address(address.split("%", 1)[0])
+        except ValueError:
+            return False
+        if isinstance(addr, ipaddress.IPv6Address) and addr.ipv4_mapped:
+            addr = addr.ipv4_mapped
+        if self._contains(self._allow, addr):
+            return True
+        return not self._contains(self._deny, addr)
+
+    @staticmethod
+    def _compile(
+        networks: Iterable[str],
+    ) -> Dict[int, Tuple[List[int], List[int]]]:
+        """
+        Turn a list of CIDR strings into a (starts, ends) pair of sorted, non-overlapping
+        integer ranges for each IP version.
+        """
+        ranges: Dict[int, List[Tuple[int, int]]] = {4: [], 6: []}
+        for network in networks:
+            net = ipaddress.ip_network(network.strip(), strict=False)
+            ranges[net.version].append(
+                (int(net.network_address), int(net.broadcast_address))
+            )
+        compiled = {}
+        for version, version_ranges in ranges.items():
+            starts: List[int] = []
+            ends: List[int] = []
+            for start, end in sorted(version_ranges):
+                if ends and start <= ends[-1] + 1:
+                    ends[-1] = max(ends[-1], end)
+                else:
+                    starts.append(start)
+                    ends.append(end)
+            compiled[version] = (starts, ends)
+        return compiled
+
+    @staticmethod
+    def _contains(
+        compiled: Dict[int, Tuple[List[int], List[int]]],
+        addr: Union[ipaddress.IPv4Address, ipaddress.IPv6Address],
+    ) -> bool:
+        starts, ends = compiled[addr.version]
+        idx = bisect_right(starts, int(addr)) - 1
+        return idx >= 0 and int(addr) <= ends[idx]
+
+
+def address_filter_from_config(config: SectionProxy) -> AddressFilter:
+    """
+    Build an AddressFilter from config. Local networks are denied unless enable_local_access is
+    set; deny_networks and allow_networks are whitespace-separated lists of CIDRs.
+    """
+    deny = config.get("deny_networks", fallback="").split()
+    if not config.getboolean("enable_local_access", fallback=False):
+        deny += LOCAL_NETWORKS
+    allow = config.get("allow_networks", fallback="").split()
+    return AddressFilter(deny, allow)
+
+
+class DnsCache:
+    """
+    An in-process cache of DNS results, shared by all fetchers.
+
+    The system resolver doesn't expose record TTLs, so entries are kept for at most ttl seconds.
+    Failed lookups aren't cached.
+    """
+
+    max_entries = 2048
+
+    def __init__(self, ttl: float = 60) -> None:
+        self.ttl = ttl
+        self._entries: Dict[Tuple[bytes, int], Tuple[float, DnsResultList]] = {}
+        self.hits = 0  # see redbot.webui.metrics
+        self.misses = 0
+
+    def setup(self, config: SectionProxy) -> None:
+        """Set the TTL from config."""
+        self.ttl = config.getfloat("dns_cache_ttl", fallback=self.ttl)
+
+    def lookup(
+        self,
+        host: bytes,
+        port: int,
+        callback: Callable[[Union[DnsResultList, Exception]], None],
+    ) -> None:
+        """
+        Look up host and port, calling callback with the result. Cached results are returned
+        immediately.
+        """
+        key = (host, port)
+        now = time.monotonic()
+        entry = self._entries.get(key, None)
+        if entry and entry[0] > now:
+            self.hits += 1
+            callback(entry[1])
+            return
+        self.misses += 1
+
+        def done(results: Union[DnsResultList, Exception]) -> None:
+            if self.ttl > 0 and not isinstance(results, Exception) and results:
+                if len(self._entries) >= self.max_entries:
+                    self.expire()
+                self._entries[key] = (time.monotonic() + self.ttl, results)
+            callback(results)
+
+        lookup(host, port, socket.SOCK_STREAM, done)
+
+    def expire(self) -> None:
+        """Remove stale entries; if the cache is still full, empty it."""
+        now = time.monotonic()
+        self._entries = {k: v for k, v in self._entries.items() if v[0] > now}
+        if len(self._entries) >= self.max_entries:
+            self._entries.clear()
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+dns_cache = DnsCache()
+
+
+# pylint: disable=too-few-public-methods
+class CachingConnectionInitiate(HttpConnectionInitiate):
+    """
+    Creates a new TCP connection to an origin, using the DNS cache and refusing addresses that
+    the client's address filter doesn't allow before trying to connect to them.
+
+    New connections get a connect_timing attribute: (seconds resolving, seconds connecting).
+    """
+
+    def __init__(  # pylint: disable=super-init-not-called
+        self,
+        client: HttpClient,
+        origin: OriginType,
+        handle_connect: Callable[[TcpConnection], None],
+        handle_error: Callable[[str, int, str], None],
+    ) -> None:
+        self.client = client
+        self.origin = origin
+        self.handle_connect = self._connected
+        self.handle_error = handle_error
+        self._on_connect = handle_connect
+        self._attempts = 0
+        self._dns_results: DnsResultList = []
+        self._started = time.monotonic()
+        self._resolved: float = None
+        _, host, port = origin
+        getattr(client, "dns_cache", dns_cache).lookup(
+            host.encode("idna"), port, self._handle_dns
+        )
+
+    def _handle_dns(self, dns_results: Union[DnsResultList, Exception]) -> None:
+        self._resolved = time.monotonic()
+        if not isinstance(dns_results, Exception) and callable(self.client.check_ip):
+            dns_results = [r for r in dns_results if self.client.check_ip(r[4][0])]
+            if not dns_results:
+                # "retry" errors aren't retried by the exchange.
+                self.handle_error("retry", 0, ACCESS_DENIED)
+                return
+        HttpConnectionInitiate._handle_dns(self, dns_results)
+
+    def _connected(self, tcp_conn: TcpConnection) -> None:
+        tcp_conn.connect_timing = (  # type: ignore[attr-defined]
+            self._resolved - self._started,
+            time.monotonic() - self._resolved,
+        )
+        self._on_connect(tcp_conn)
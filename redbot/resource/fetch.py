@@ -6,21 +6,36 @@ problems and other interesting characteristics. It only makes one request,
 based upon the provided headers.
 """
 
+from bisect import insort
+from collections import defaultdict
 from configparser import SectionProxy
+from contextlib import contextmanager
+import cProfile
+from email.utils import parsedate_to_datetime
+from itertools import count
 import time
-from typing import Any, Dict, List, Tuple, Type, Union
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Type, Union
+from urllib.parse import urlsplit
 
 import thor
 from thor.http.client import HttpClientExchange
+from thor.http.common import OriginType, States
 import thor.http.error as httperr
-
-from netaddr import IPAddress  # type: ignore
+from thor.tcp import TcpConnection
 
 from redbot import __version__
 from redbot.speak import Note, levels, categories
 from redbot.message import HttpRequest, HttpResponse
 from redbot.message.status import StatusChecker
 from redbot.message.cache import check_caching
+from redbot.formatter import f_num
+from redbot.resource.dns import (
+    ACCESS_DENIED,
+    AddressFilter,
+    CachingConnectionInitiate,
+    address_filter_from_config,
+    dns_cache,
+)
 from redbot.type import StrHeaderListType, RawHeaderListType
 
 
@@ -36,6 +51,483 @@ class RedHttpClient(thor.http.HttpClient):
         self.read_timeout = 15
         self.retry_delay = 1
         self.careful = False
+        self.dns_cache = dns_cache
+        self.address_filter: AddressFilter = None
+        self.circuit_breaker: CircuitBreaker = None
+        self.scheduler: OutboundScheduler = None
+
+    def setup(self, config: SectionProxy) -> None:
+        """
+        Configure the DNS cache, the address filter, the circuit breaker and the outbound
+        scheduler. Only the first call has any effect.
+        """
+        if self.address_filter is not None:
+            return
+        self.dns_cache.setup(config)
+        self.circuit_breaker = circuit_breaker
+        if not circuit_breaker.running:
+            circuit_breaker.setup(config)
+        self.scheduler = outbound_scheduler
+        if not outbound_scheduler.running:
+            outbound_scheduler.setup(config)
+        self.address_filter = address_filter_from_config(config)
+        if self.address_filter:
+            self.check_ip = self.address_filter.check
+
+    def exchange(self) -> "RedHttpClientExchange":
+        return RedHttpClientExchange(self)
+
+    def _new_conn(
+        self,
+        origin: OriginType,
+        handle_connect: Callable[[TcpConnection], None],
+        handle_error: Callable[[str, int, str], None],
+    ) -> None:
+        "Create a new connection, using the DNS cache."
+        if self.conn_counts[origin] >= self.max_server_conn:
+            self._req_q[origin].append((handle_connect, handle_error))
+            return
+        CachingConnectionInitiate(self, origin, handle_connect, handle_error)
+
+
+class RedHttpClientExchange(HttpClientExchange):
+    """
+    Thor HttpClientExchange that can be cancelled.
+
+    Emits "settled" once the response has finished and the connection can't tell us anything more
+    about it; i.e., after any extra data following the response has been noticed.
+    """
+
+    def __init__(self, client: RedHttpClient) -> None:
+        HttpClientExchange.__init__(self, client)
+        self.cancelled = False
+        self.settled = False
+        self.timings: PhaseTimer = None
+        self._input_depth = 0
+        self._input_ended = False
+
+    def handle_input(self, inbytes: bytes) -> None:
+        self._input_depth += 1
+        try:
+            HttpClientExchange.handle_input(self, inbytes)
+        finally:
+            self._input_depth -= 1
+        if self._input_ended and not self._input_depth:
+            self._settle()
+
+    def input_end(self, trailers: RawHeaderListType) -> None:
+        self._input_ended = True
+        HttpClientExchange.input_end(self, trailers)
+        if not self._input_depth:
+            self._settle()
+
+    def input_error(self, err: httperr.HttpError, close: bool = True) -> None:
+        HttpClientExchange.input_error(self, err, close)
+        if self._input_state == States.ERROR:
+            self._input_ended = True
+            if not self._input_depth:
+                self._settle()
+
+    def now(self) -> float:
+        "Return the current time, for timestamping messages."
+        return time.time()
+
+    def _settle(self) -> None:
+        if not self.settled:
+            self.settled = True
+            self.emit("settled")
+
+    def cancel(self) -> None:
+        """
+        Abandon the exchange, without emitting any more events. If it has a connection, close it;
+        if it's still waiting for one, hand it on when it arrives.
+        """
+        self.cancelled = True
+        self.remove_listeners(
+            "response_nonfinal",
+            "response_start",
+            "response_body",
+            "response_done",
+            "error",
+        )
+        self._clear_read_timeout()
+        self.settled = True
+        if self.tcp_conn:
+            self.client.dead_conn(self)
+
+    def _handle_connect(self, tcp_conn: TcpConnection) -> None:
+        if self.cancelled:
+            self.tcp_conn = tcp_conn
+            self.client.release_conn(self)
+            return
+        if self.timings is not None:
+            self.timings.connected(tcp_conn)
+        HttpClientExchange._handle_connect(self, tcp_conn)
+
+    def _retry(self) -> None:
+        if not self.cancelled:
+            HttpClientExchange._retry(self)
+
+
+class PhaseTimer:
+    """
+    How long each phase of a fetch took.
+
+    Network phases are worked out from time.monotonic() marks:
+      - blocked: waiting for a connection (e.g., because the origin's connections were all busy)
+      - dns: resolving the host name, for a new connection
+      - connect: setting up TCP (and TLS), for a new connection
+      - wait: from having a connection to the start of the response (time to first byte)
+      - receive: transferring the rest of the response
+
+    Since processing happens on the same event loop, network phases include any processing done
+    while they were underway.
+
+    Processing phases are the time spent in REDbot's own code, in seconds:
+      - headers: parsing and checking the response headers
+      - body: processing the response body (not counting links)
+      - links: parsing the body for links
+      - render: producing the formatted results (for the top-level resource). The timings shown
+        in the results leave it out, since they're rendered as part of it; see the
+        redbot_render_seconds metric instead.
+
+    cpu_time is the CPU time (per time.process_time()) used by the processing phases; when they
+    nest, it's counted once, by the outermost one.
+
+    If profile is set, processing phases are profiled with it. If spans is a list, each
+    processing phase is appended to it as (phase, start, end), for tracing (see
+    redbot.resource.trace).
+    """
+
+    network_phases = ["blocked", "dns", "connect", "wait", "receive"]
+    processing_phases = ["headers", "body", "links", "render"]
+    profile: cProfile.Profile = None
+    profiling = False  # whether any PhaseTimer's profile is enabled
+    measuring = False  # whether any PhaseTimer is measuring CPU time
+    cpu_time = 0.0
+    spans: List[Tuple[str, float, float]] = None
+
+    def __init__(self) -> None:
+        self.marks: Dict[str, float] = {}
+        self.durations: Dict[str, float] = {}
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        state.pop("profile", None)
+        state.pop("spans", None)
+        return state
+
+    def mark(self, name: str) -> None:
+        "Note that the named point in the fetch has been reached."
+        self.marks[name] = time.monotonic()
+
+    def add(self, phase: str, seconds: float) -> None:
+        "Add some time to a phase."
+        self.durations[phase] = self.durations.get(phase, 0.0) + seconds
+
+    @contextmanager
+    def measure(self, phase: str) -> Iterator[None]:
+        "Add the time taken by a with block to a phase."
+        profile = None if PhaseTimer.profiling else self.profile
+        if profile is not None:
+            PhaseTimer.profiling = True
+            profile.enable()
+        outermost = not PhaseTimer.measuring
+        if outermost:
+            PhaseTimer.measuring = True
+            cpu_started = time.process_time()
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            ended = time.monotonic()
+            self.add(phase, ended - started)
+            if self.spans is not None:
+                self.spans.append((phase, started, ended))
+            if outermost:
+                self.cpu_time += time.process_time() - cpu_started
+                PhaseTimer.measuring = False
+            if profile is not None:
+                profile.disable()
+                PhaseTimer.profiling = False
+
+    def connected(self, tcp_conn: TcpConnection) -> None:
+        """
+        Note that the fetch has a connection. Only the first exchange on a connection is charged
+        for setting it up.
+        """
+        self.mark("connected")
+        connect_timing = getattr(tcp_conn, "connect_timing", None)
+        if connect_timing:
+            self.durations["dns"], self.durations["connect"] = connect_timing
+            tcp_conn.connect_timing = None  # type: ignore[attr-defined]
+
+    def between(self, start: str, end: str) -> Union[float, None]:
+        "Return the seconds between two marks, or None if either hasn't happened."
+        if start not in self.marks or end not in self.marks:
+            return None
+        return max(0.0, self.marks[end] - self.marks[start])
+
+    def phases(self) -> Dict[str, Union[float, None]]:
+        "Return the seconds taken by each phase, in order; None if it didn't happen."
+        out: Dict[str, Union[float, None]] = {
+            "blocked": None,
+            "dns": self.durations.get("dns"),
+            "connect": self.durations.get("connect"),
+            "wait": self.between("connected", "response_start"),
+            "receive": self.between("response_start", "response_done"),
+        }
+        blocked = self.between("request_start", "connected")
+        if blocked is not None:
+            out["blocked"] = max(
+                0.0, blocked - (out["dns"] or 0) - (out["connect"] or 0)
+            )
+        else:
+            out["wait"] = self.between("request_start", "response_start")
+        for phase in self.processing_phases:
+            out[phase] = self.durations.get(phase)
+        if out["body"] is not None and out["links"] is not None:
+            out["body"] = max(0.0, out["body"] - out["links"])
+        return out
+
+    def processing_time(self) -> float:
+        "Return the seconds spent processing the response."
+        return sum(self.durations.get(phase, 0.0) for phase in ["headers", "body"])
+
+
+class OriginUnavailableError(httperr.HttpError):
+    desc = "The origin server is unavailable"
+
+
+class CircuitBreaker:
+    """
+    Remember origins that recently failed to resolve, connect or respond in time, so that
+    fetches to them fail fast instead of waiting out the same timeouts again.
+
+    After `threshold` consecutive failures, an origin's circuit opens for `cooldown` seconds.
+    Once that passes, one fetch is let through as a probe; if it gets a response the circuit
+    closes, and if it fails the circuit opens again.
+
+    `stats` counts what happens; redbot.webui.metrics exports it.
+    """
+
+    failure_errors = (httperr.DnsError, httperr.ConnectError, httperr.ReadTimeoutError)
+    max_origins = 4096
+
+    def __init__(self) -> None:
+        self.threshold = 3
+        self.cooldown = 30.0
+        self.failures: Dict[str, Tuple[int, float]] = {}
+        self.open_until: Dict[str, float] = {}
+        self.probing: Dict[str, float] = {}
+        self.stats: Dict[str, int] = defaultdict(int)
+        self.running = False
+
+    def setup(self, config: SectionProxy) -> None:
+        """Set the threshold and cool-down from config."""
+        self.threshold = config.getint("circuit_breaker_failures", fallback=3)
+        self.cooldown = config.getfloat("circuit_breaker_cooldown", fallback=30)
+        self.running = True
+
+    def allow(self, origin: str) -> bool:
+        """
+        Return True if a fetch to origin should go ahead.
+        """
+        if origin not in self.open_until:
+            return True
+        now = time.monotonic()
+        if now < self.open_until[origin] or (
+            origin in self.probing and now < self.probing[origin] + self.cooldown
+        ):
+            self.stats["fail_fast"] += 1
+            return False
+        self.probing[origin] = now
+        self.stats["probe"] += 1
+        return True
+
+    def retry_in(self, origin: str) -> int:
+        """
+        Return how many seconds until origin will be tried again.
+        """
+        return max(1, int(self.open_until.get(origin, 0) - time.monotonic() + 0.5))
+
+    def success(self, origin: str) -> None:
+        """
+        Record that origin responded.
+        """
+        self.failures.pop(origin, None)
+        self.probing.pop(origin, None)
+        if self.open_until.pop(origin, None) is not None:
+            self.stats["close"] += 1
+
+    def failure(self, origin: str, error: httperr.HttpError) -> None:
+        """
+        Record that a fetch to origin failed with error.
+        """
+        if not self.threshold or not isinstance(error, self.failure_errors):
+            return
+        if error.detail == ACCESS_DENIED:
+            return  # not the origin's fault
+        self.stats["failure"] += 1
+        now = time.monotonic()
+        failures, last = self.failures.get(origin, (0, now))
+        if now - last > self.cooldown:
+            failures = 0
+        self.failures[origin] = (failures + 1, now)
+        if self.probing.pop(origin, None) is not None:
+            self.stats["reopen"] += 1
+        elif failures + 1 >= self.threshold and origin not in self.open_until:
+            self.stats["open"] += 1
+        else:
+            return
+        self.open_until[origin] = now + self.cooldown
+        if len(self.failures) > self.max_origins:
+            self.prune()
+
+    def prune(self) -> None:
+        """
+        Forget about failures that are old enough not to matter.
+        """
+        now = time.monotonic()
+        self.failures = {
+            o: f for o, f in self.failures.items() if now - f[1] <= self.cooldown
+        }
+        self.open_until = {
+            o: t
+            for o, t in self.open_until.items()
+            if o in self.failures or o in self.probing
+        }
+
+
+circuit_breaker = CircuitBreaker()
+
+
+class OutboundTicket:
+    "A fetch's place in the OutboundScheduler."
+
+    def __init__(
+        self, origin: str, priority: int, seq: int, start: Callable[[], None]
+    ) -> None:
+        self.origin = origin
+        self.priority = priority
+        self.seq = seq
+        self.start = start
+        self.running = False
+
+    def __lt__(self, other: "OutboundTicket") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class OutboundScheduler:
+    """
+    Decide when fetches can start, so that a test doesn't hit an origin with all of its requests
+    at once.
+
+    No more than max_origin fetches run at once to an origin, and no more than max_total in all
+    (0 means no limit). Waiting fetches start in priority order (lower first), then in the order
+    they were requested.
+
+    When an origin says it's overloaded (with a 429, or a 503 with Retry-After), its limit is
+    halved and it's paused for the Retry-After time (up to max_pause seconds). Each response
+    that isn't one of those raises its limit by one again, up to max_origin.
+    """
+
+    throttle_statuses = ["429", "503"]
+    default_pause = 1.0  # seconds to pause for a 429 without Retry-After
+
+    def __init__(self) -> None:
+        self.max_origin = 0
+        self.max_total = 0
+        self.max_pause = 10.0
+        self.running = False
+        self.active: Dict[str, int] = defaultdict(int)
+        self.total_active = 0
+        self.limits: Dict[str, int] = {}  # origins with reduced limits
+        self.paused: Dict[str, float] = {}  # origin: time.monotonic() to resume at
+        self.waiting: List[OutboundTicket] = []  # sorted
+        self.stats: Dict[str, int] = defaultdict(int)  # see redbot.webui.metrics
+        self._seq = count()
+
+    def setup(self, config: SectionProxy) -> None:
+        """Set the limits from config."""
+        self.max_origin = config.getint("max_origin_requests", fallback=0)
+        self.max_total = config.getint("max_outbound_requests", fallback=0)
+        self.max_pause = config.getfloat("max_retry_after", fallback=10)
+        self.running = True
+
+    def request(
+        self, origin: str, priority: int, start: Callable[[], None]
+    ) -> OutboundTicket:
+        """
+        Call start when a fetch to origin can go ahead; possibly immediately. The returned
+        ticket must be passed to release() when the fetch is finished or abandoned.
+        """
+        ticket = OutboundTicket(origin, priority, next(self._seq), start)
+        insort(self.waiting, ticket)
+        # start it now, unless something that goes before it can take the last slot
+        self._pump()
+        if ticket in self.waiting:
+            self.stats["queued"] += 1
+        return ticket
+
+    def release(self, ticket: OutboundTicket) -> None:
+        "A fetch is finished; start whatever can go now."
+        if ticket.running:
+            ticket.running = False
+            self.active[ticket.origin] -= 1
+            if not self.active[ticket.origin]:
+                del self.active[ticket.origin]
+            self.total_active -= 1
+            self._pump()
+        elif ticket in self.waiting:
+            self.waiting.remove(ticket)
+
+    def can_start(self, origin: str) -> bool:
+        "Return whether a fetch to origin can start now."
+        if self.max_total and self.total_active >= self.max_total:
+            return False
+        if origin in self.paused:
+            if self.paused[origin] > time.monotonic():
+                return False
+            del self.paused[origin]
+        limit = self.limits.get(origin, self.max_origin)
+        return not limit or self.active.get(origin, 0) < limit
+
+    def response(self, origin: str, status: str, retry_secs: Optional[float]) -> None:
+        "Adapt to a response from origin, which said to retry after retry_secs (if it did)."
+        if status in self.throttle_statuses and (status == "429" or retry_secs):
+            self.stats["throttled"] += 1
+            limit = self.limits.get(origin, self.max_origin) or self.active[origin]
+            self.limits[origin] = max(1, limit // 2)
+            pause = min(self.max_pause, retry_secs or self.default_pause)
+            if pause > 0:
+                self.paused[origin] = time.monotonic() + pause
+                thor.schedule(pause, self._pump)
+        elif origin in self.limits:
+            self.limits[origin] += 1
+            if self.limits[origin] >= self.max_origin:
+                del self.limits[origin]
+
+    def _start(self, ticket: OutboundTicket) -> None:
+        ticket.running = True
+        self.active[ticket.origin] += 1
+        self.total_active += 1
+        ticket.start()
+
+    def _pump(self) -> None:
+        for ticket in list(self.waiting):
+            if self.max_total and self.total_active >= self.max_total:
+                return
+            if ticket in self.waiting and self.can_start(ticket.origin):
+                self.waiting.remove(ticket)
+                self._start(ticket)
+
+
+outbound_scheduler = OutboundScheduler()
+
+
+class DeadlineError(httperr.HttpError):
+    desc = "REDbot ran out of time"
 
 
 class RedFetcher(thor.events.EventEmitter):
@@ -52,6 +544,7 @@ class RedFetcher(thor.events.EventEmitter):
 
     check_name = "undefined"
     response_phrase = "undefined"
+    priority = 0  # for the outbound scheduler; lower goes first
     client = RedHttpClient()
     client.idle_timeout = 5
 
@@ -64,16 +557,29 @@ class RedFetcher(thor.events.EventEmitter):
         self.request = HttpRequest(self.ignore_note)
         self.nonfinal_responses: List[HttpResponse] = []
         self.response = HttpResponse(self.add_note)
-        self.exchange: HttpClientExchange = None
+        self.exchange: RedHttpClientExchange = None
+        self.deadline: float = None  # time.monotonic() value
+        self._deadline_ev: thor.loop.ScheduledEvent = None
+        self._ticket: OutboundTicket = None
         self.fetch_started = False
         self.fetch_done = False
-        self.setup_check_ip()
+        self.timings = PhaseTimer()
+        self.settled = True  # no connection is still telling us about this fetch
+        self._done_pending = False
+        self.max_body_bytes = config.getint("max_body_bytes", fallback=0)
 
     def __getstate__(self) -> Dict[str, Any]:
         state: Dict[str, Any] = thor.events.EventEmitter.__getstate__(self)
         del state["exchange"]
+        del state["_deadline_ev"]
+        del state["_ticket"]
         return state
 
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        if "timings" not in state:  # saved before timings were recorded
+            self.timings = PhaseTimer()
+
     def __repr__(self) -> str:
         out = [self.__class__.__name__]
         if self.request.uri:
@@ -84,6 +590,18 @@ class RedFetcher(thor.events.EventEmitter):
             out.append("fetch_done")
         return f"{', '.join(out)} at {id(self):#x}>"
 
+    @property
+    def analysis_time(self) -> float:
+        "Seconds spent processing the response."
+        return self.timings.processing_time()
+
+    def connections_settled(self) -> bool:
+        """
+        Return True if the connections used by this fetch are known to have nothing more to
+        report.
+        """
+        return self.settled
+
     def add_note(self, subject: str, note: Type[Note], **kw: Union[str, int]) -> None:
         "Set a note."
         if "response" not in kw:
@@ -95,6 +613,13 @@ class RedFetcher(thor.events.EventEmitter):
         "Ignore a note (for requests)."
         return
 
+    def set_deadline(self, deadline: float) -> None:
+        """
+        Give up on the fetch if it hasn't finished by deadline (a time.monotonic() value).
+        Must be called before check().
+        """
+        self.deadline = deadline
+
     def preflight(self) -> bool:
         """
         Check to see if we should bother running. Return True
@@ -102,27 +627,6 @@ class RedFetcher(thor.events.EventEmitter):
         """
         return True
 
-    def setup_check_ip(self) -> None:
-        """
-        Check to see if access to this IP is allowed.
-        """
-        if (
-            not self.config.getboolean("enable_local_access", fallback=False)
-        ) and self.client.check_ip is None:
-
-            def check_ip(dns_result: str) -> bool:
-                addr = IPAddress(dns_result)
-                if (
-                    (not addr.is_unicast())
-                    or addr.is_private()
-                    or addr.is_loopback()
-                    or addr.is_link_local()
-                ):
-                    return False
-                return True
-
-            self.client.check_ip = check_ip
-
     def set_request(
         self,
         iri: str,
@@ -151,16 +655,51 @@ class RedFetcher(thor.events.EventEmitter):
         updated and 'fetch_done' when it's done. Reason is used to explain what the
         request is in the status callback.
         """
+        self.timings.mark("check_start")
+        self.client.setup(self.config)
         if not self.preflight() or self.request.uri is None:
             # generally a good sign that we're not going much further.
             self._fetch_done()
             return
 
+        origin = url_to_origin(self.request.uri)
+        breaker = self.client.circuit_breaker
+        if origin and breaker and not breaker.allow(origin):
+            self.response.http_error = OriginUnavailableError(
+                f"Recent requests to {origin} failed; REDbot will try it again "
+                f"in {breaker.retry_in(origin)} seconds."
+            )
+            self._fetch_done()
+            return
+
+        if self.deadline is not None:
+            remaining = self.deadline - time.monotonic()
+            if remaining <= 0:
+                self.response.http_error = DeadlineError(
+                    "The test's time limit was reached before this request was made."
+                )
+                self._fetch_done()
+                return
+            self._deadline_ev = thor.schedule(remaining, self._deadline_passed)
+
+        self.timings.mark("request_start")
+        scheduler = self.client.scheduler
+        if origin and scheduler:
+            self._ticket = scheduler.request(origin, self.priority, self._start_fetch)
+        else:
+            self._start_fetch()
+
+    def _start_fetch(self) -> None:
+        "Send the request, now that the scheduler has let it go."
         self.fetch_started = True
+        self.timings.mark("fetch_start")
 
         if "user-agent" not in [i[0].lower() for i in self.request.headers]:
             self.request.headers.append(("User-Agent", UA_STRING))
         self.exchange = self.client.exchange()
+        self.exchange.timings = self.timings
+        self.settled = False
+        self.exchange.once("settled", self._settled)
         self.exchange.on("response_nonfinal", self._response_nonfinal)
         self.exchange.once("response_start", self._response_start)
         self.exchange.on("response_body", self._response_body)
@@ -172,12 +711,13 @@ class RedFetcher(thor.events.EventEmitter):
             (k.encode("ascii", "replace"), v.encode("ascii", "replace"))
             for (k, v) in self.request.headers
         ]
-        self.exchange.request_start(
+        exchange = self.exchange
+        exchange.request_start(
             self.request.method.encode("ascii"),
             self.request.uri.encode("ascii"),
             req_hdrs,
         )
-        self.request.start_time = time.time()
+        self.request.start_time = exchange.now()
         if not self.fetch_done:  # the request could have immediately failed.
             if self.request.payload is not None:
                 self.exchange.request_body(self.request.payload)
@@ -199,24 +739,77 @@ class RedFetcher(thor.events.EventEmitter):
         self, status: bytes, phrase: bytes, res_headers: RawHeaderListType
     ) -> None:
         "Process the response start-line and headers."
-        self.response.start_time = time.time()
-        self.response.process_top_line(self.exchange.res_version, status, phrase)
-        self.response.process_raw_headers(res_headers)
-        StatusChecker(self.response, self.request)
-        check_caching(self.response, self.request)
+        self.timings.mark("response_start")
+        self.response.start_time = self.exchange.now()
+        if self.client.circuit_breaker:
+            self.client.circuit_breaker.success(url_to_origin(self.request.uri))
+        with self.timings.measure("headers"):
+            self.response.process_top_line(self.exchange.res_version, status, phrase)
+            self.response.process_raw_headers(res_headers)
+            StatusChecker(self.response, self.request)
+            check_caching(self.response, self.request)
+        if self._ticket:
+            self.client.scheduler.response(
+                self._ticket.origin,
+                self.response.status_code,
+                retry_after(self.response),
+            )
 
     def _response_body(self, chunk: bytes) -> None:
         "Process a chunk of the response body."
         self.transfer_in += len(chunk)
-        self.response.feed_body(chunk)
+        if self.response.truncated:
+            return
+        if self.max_body_bytes:
+            remaining = self.max_body_bytes - self.response.payload_len
+            if len(chunk) > remaining:
+                chunk = chunk[:remaining]
+                self.response.truncated = True
+        with self.timings.measure("body"):
+            self.response.feed_body(chunk)
+        if self.response.truncated:
+            self.add_note(
+                "body", BODY_TRUNCATED, max_body_bytes=f_num(self.max_body_bytes)
+            )
+            # thor is still processing input for this exchange; stop it afterwards.
+            thor.schedule(0, self._truncate)
+
+    def _truncate(self) -> None:
+        "Stop reading a response that has reached max_body_bytes."
+        if self.fetch_done or self.exchange is None:
+            return
+        self.timings.mark("response_done")
+        self.emit("debug", f"truncated {self.request.uri} ({self.check_name})")
+        self.response.transfer_length = self.exchange.input_transfer_length
+        self.response.header_length = self.exchange.input_header_length
+        self.exchange.cancel()
+        self.settled = True
+        self.response.body_done(True)
+        self._fetch_done()
+
+    def _deadline_passed(self) -> None:
+        "Give up on a fetch that has run out of time."
+        self._deadline_ev = None
+        if self.fetch_done:
+            return
+        self.emit("debug", f"deadline passed {self.request.uri} ({self.check_name})")
+        if self.exchange:
+            self.exchange.cancel()
+        self.settled = True
+        self.response.http_error = DeadlineError(
+            "The test's time limit was reached before this response was complete."
+        )
+        self._fetch_done()
 
     def _response_done(self, trailers: List[Tuple[bytes, bytes]]) -> None:
         "Finish analysing the response, handling any parse errors."
+        self.timings.mark("response_done")
         self.emit("debug", f"fetched {self.request.uri} ({self.check_name})")
         self.response.transfer_length = self.exchange.input_transfer_length
         self.response.header_length = self.exchange.input_header_length
-        self.response.body_done(True, trailers)
-        self._fetch_done()
+        with self.timings.measure("body"):
+            self.response.body_done(True, trailers)
+        self._finish_fetch()
 
     def _response_error(self, error: httperr.HttpError) -> None:
         "Handle an error encountered while fetching the response."
@@ -239,15 +832,82 @@ class RedFetcher(thor.events.EventEmitter):
             self.add_note(subject, HEADER_NAME_SPACE, header_name=error.detail)
         else:
             self.response.http_error = error
-        self._fetch_done()
+            if self.client.circuit_breaker:
+                self.client.circuit_breaker.failure(
+                    url_to_origin(self.request.uri), error
+                )
+        self._finish_fetch()
+
+    def _finish_fetch(self) -> None:
+        """
+        Finish the fetch once the connection has settled, so that problems like extra data after
+        the response are noted first.
+        """
+        if self.settled or not isinstance(self.exchange, RedHttpClientExchange):
+            self._fetch_done()
+        else:
+            self._done_pending = True
+
+    def _settled(self) -> None:
+        self.settled = True
+        if self._done_pending:
+            self._done_pending = False
+            self._fetch_done()
 
     def _fetch_done(self) -> None:
         if not self.fetch_done:
             self.fetch_done = True
+            self.timings.mark("fetch_done")
             self.exchange = None
+            if self._deadline_ev:
+                self._deadline_ev.delete()
+                self._deadline_ev = None
+            if self._ticket:
+                self.client.scheduler.release(self._ticket)
+                self._ticket = None
             self.emit("fetch_done")
 
 
+def url_to_origin(url: str) -> Union[str, None]:
+    "Convert an URL to an RFC6454 Origin."
+    default_port = {"http": 80, "https": 443}
+    try:
+        p_url = urlsplit(url)
+        origin = (
+            f"{p_url.scheme.lower()}://"
+            f"{p_url.hostname.lower()}:"
+            f"{p_url.port or default_port.get(p_url.scheme, 0)}"
+        )
+    except (AttributeError, ValueError):
+        origin = None
+    return origin
+
+
+def retry_after(response: HttpResponse) -> Optional[float]:
+    "Return how many seconds response asks clients to wait before retrying, if it does."
+    value = response.parsed_headers.get("retry-after", None)
+    if not isinstance(value, str):
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class BODY_TRUNCATED(Note):
+    category = categories.GENERAL
+    level = levels.INFO
+    summary = "%(response)s's body was too large for REDbot to download completely."
+    text = """\
+REDbot stopped downloading the body after %(max_body_bytes)s bytes.
+
+Because of this, it didn't check the `Content-Length` and `Content-MD5` headers against the body,
+or compare bodies when checking content negotiation."""
+
+
 class BODY_NOT_ALLOWED(Note):
     category = categories.CONNECTION
     level = levels.BAD
@@ -0,0 +1,307 @@
+"""
+Offline analysis of the exchanges in HAR files.
+
+Entries are read from HAR files as a stream, so that very large files don't need to be loaded
+into memory. Each is turned into a HttpRequest and HttpResponse, whose headers, status and caching
+are checked as if REDbot had fetched them itself; the bodies aren't available, so checks that need
+them (or that need to make more requests) don't run.
+
+Work is spread across a pool of processes in batches of entries.
+"""
+
+from collections import Counter, deque
+from datetime import datetime
+import json
+import multiprocessing
+import re
+import time
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Tuple, Type, Union
+import typing
+
+import thor.http.error as httperr
+
+from redbot.message import HttpRequest, HttpResponse
+from redbot.message.cache import check_caching
+from redbot.message.status import StatusChecker
+from redbot.speak import Note
+from redbot.type import StrHeaderListType
+
+EntryType = Dict[str, Any]
+ResultType = Dict[str, Any]
+BatchType = List[Tuple[int, EntryType]]
+
+ENTRIES_START = re.compile(r'"entries"\s*:\s*\[')
+SEPARATOR = re.compile(r"[\s,]*")
+READ_SIZE = 1024 * 1024
+
+
+def read_entries(path: str, read_size: int = READ_SIZE) -> Iterator[EntryType]:
+    """
+    Yield the entries in the HAR file at path, one at a time.
+
+    Raises ValueError if the file isn't a HAR file, or is truncated.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, encoding="utf-8-sig") as fh:
+        buf = fh.read(read_size)
+        match = ENTRIES_START.search(buf)
+        while match is None:
+            chunk = fh.read(read_size)
+            if not chunk:
+                raise ValueError(f"{path} doesn't contain any HAR entries")
+            buf = buf[-32:] + chunk  # the key could be split across chunks
+            match = ENTRIES_START.search(buf)
+        pos = match.end()
+        eof = False
+        while True:
+            pos = SEPARATOR.match(buf, pos).end()
+            if pos < len(buf) and buf[pos] == "]":
+                return
+            try:
+                if pos == len(buf):
+                    raise json.JSONDecodeError("Need more input", buf, pos)
+                entry, pos = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError as why:
+                if eof:
+                    raise ValueError(
+                        f"{path} isn't a complete HAR file: {why}"
+                    ) from why
+                chunk = fh.read(read_size)
+                eof = not chunk
+                buf = buf[pos:] + chunk
+                pos = 0
+                continue
+            yield entry
+
+
+def slim_entry(entry: Any) -> Any:
+    """
+    Return a copy of a HAR entry with only what HarEntry needs, with missing or null members
+    defaulted. Anything that isn't an object is returned as-is, for HarEntry to report.
+    """
+    if not isinstance(entry, dict):
+        return entry
+    request = _member(entry, "request", {})
+    response = _member(entry, "response", {})
+    return {
+        "startedDateTime": entry.get("startedDateTime"),
+        "timings": _member(entry, "timings", {}),
+        "request": {
+            "method": _member(request, "method", "GET"),
+            "url": _member(request, "url", ""),
+            "headers": _member(request, "headers", []),
+        },
+        "response": {
+            "status": _member(response, "status", 0),
+            "statusText": _member(response, "statusText", ""),
+            "httpVersion": _member(response, "httpVersion", ""),
+            "headers": _member(response, "headers", []),
+        },
+    }
+
+
+def _member(obj: Any, name: str, default: Any) -> Any:
+    if not isinstance(obj, dict) or obj.get(name) is None:
+        return default
+    return obj[name]
+
+
+def response_start_time(entry: EntryType) -> float:
+    "Work out when the response started from a HAR entry's timings."
+    try:
+        started = datetime.fromisoformat(
+            entry["startedDateTime"].replace("Z", "+00:00")
+        ).timestamp()
+    except (KeyError, AttributeError, ValueError):
+        return time.time()
+    timings = entry.get("timings", {})
+    waited = sum(
+        max(0, timings.get(phase, 0) or 0)
+        for phase in ["blocked", "dns", "connect", "send", "wait"]
+    )
+    return float(started + waited / 1000)
+
+
+def _headers(har_headers: List[Dict[str, str]]) -> StrHeaderListType:
+    "Raises ValueError if a header isn't an object with string name and value members."
+    headers: StrHeaderListType = []
+    for hdr in har_headers:
+        try:
+            name, value = hdr["name"], hdr["value"]
+        except (KeyError, TypeError) as why:
+            raise ValueError(f"Malformed header: {hdr!r}") from why
+        if not isinstance(name, str) or not isinstance(value, str):
+            raise ValueError(f"Malformed header: {hdr!r}")
+        if not name.startswith(":"):  # HTTP/2 pseudo-headers
+            headers.append((name, value))
+    return headers
+
+
+class HarEntry:
+    """
+    The analysis of a single HAR entry.
+    """
+
+    response_phrase = "This response"
+
+    def __init__(self, entry: EntryType) -> None:
+        self.notes: List[Note] = []
+        self.request = HttpRequest(self.ignore_note)
+        self.response = HttpResponse(self.add_note)
+        self.error: str = None
+        try:
+            self.check(entry)
+        except (KeyError, TypeError, AttributeError) as why:
+            self.notes = []
+            self.error = f"Malformed entry: {why!r}"
+
+    def check(self, entry: EntryType) -> None:
+        "Check entry; raises KeyError, TypeError or AttributeError if it's malformed."
+        har_req = entry["request"]
+        har_res = entry["response"]
+        self.request.method = har_req["method"]
+        self.response.is_head_response = self.request.method == "HEAD"
+        if not har_req["url"]:
+            self.error = "No request URL"
+            return
+        try:
+            self.request.set_iri(har_req["url"])
+        except httperr.UrlError as why:
+            self.error = why.desc
+            return
+        try:
+            req_hdrs = _headers(har_req["headers"])
+            res_hdrs = _headers(har_res["headers"])
+        except ValueError as why:
+            self.error = str(why)
+            return
+        self.request.set_headers(req_hdrs)
+        if not har_res["status"]:
+            self.error = "No response"
+            return
+        self.response.base_uri = self.request.uri
+        self.response.start_time = response_start_time(entry)
+        self.response.process_top_line(
+            har_res["httpVersion"].encode("ascii", "replace"),
+            str(har_res["status"]).encode("ascii"),
+            har_res["statusText"].encode("utf-8"),
+        )
+        self.response.process_raw_headers(
+            [
+                (name.encode("iso-8859-1", "replace"), value.encode("utf-8"))
+                for name, value in res_hdrs
+            ]
+        )
+        StatusChecker(self.response, self.request)
+        check_caching(self.response, self.request)
+
+    def add_note(self, subject: str, note: Type[Note], **kw: Union[str, int]) -> None:
+        "Set a note."
+        if "response" not in kw:
+            kw["response"] = self.response_phrase
+        self.notes.append(note(subject, kw))
+
+    @staticmethod
+    def ignore_note(subject: str, note: Type[Note], **kw: str) -> None:
+        "Ignore a note (for requests)."
+        return
+
+    def result(self, index: int) -> ResultType:
+        "Return a summary of the analysis that can be serialised."
+        return {
+            "index": index,
+            "method": self.request.method,
+            "uri": self.request.uri,
+            "status": self.response.status_code,
+            "error": self.error,
+            "notes": [
+                {
+                    "note": note.__class__.__name__,
+                    "subject": note.subject,
+                    "level": note.level.value,
+                    "category": note.category.value,
+                    "summary": str(note.show_summary("en")),
+                }
+                for note in self.notes
+            ],
+        }
+
+
+def analyse_batch(batch: BatchType) -> List[ResultType]:
+    "Analyse a batch of (index, entry) pairs."
+    return [HarEntry(entry).result(index) for index, entry in batch]
+
+
+def _batches(entries: Iterable[EntryType], batch_size: int) -> Iterator[BatchType]:
+    batch: BatchType = []
+    for index, entry in enumerate(entries):
+        batch.append((index, slim_entry(entry)))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def analyse(
+    entries: Iterable[EntryType], processes: int = None, batch_size: int = 200
+) -> Iterator[ResultType]:
+    """
+    Analyse HAR entries, yielding a result for each in order.
+
+    Batches of batch_size entries are handed to a pool of processes (by default, one per CPU).
+    Only a few batches per process are outstanding at a time, so that memory use stays flat.
+    """
+    batches = _batches(entries, batch_size)
+    processes = processes or multiprocessing.cpu_count()
+    if processes == 1:
+        for batch in batches:
+            yield from analyse_batch(batch)
+        return
+    with multiprocessing.Pool(processes) as pool:
+        pending: Deque[Any] = deque()
+        for batch in batches:
+            pending.append(pool.apply_async(analyse_batch, (batch,)))
+            while len(pending) >= processes * 2:
+                yield from pending.popleft().get()
+        while pending:
+            yield from pending.popleft().get()
+
+
+class HarSummary:
+    """
+    Aggregate statistics about analysed HAR entries.
+    """
+
+    def __init__(self) -> None:
+        self.entries = 0
+        self.errors = 0
+        self.statuses: typing.Counter[str] = Counter()
+        self.levels: typing.Counter[str] = Counter()
+        self.notes: typing.Counter[str] = Counter()
+        self.summaries: Dict[str, str] = {}
+
+    def add(self, result: ResultType) -> None:
+        "Add a result from analyse() to the summary."
+        self.entries += 1
+        if result["error"]:
+            self.errors += 1
+            return
+        self.statuses[result["status"]] += 1
+        for note in result["notes"]:
+            self.levels[note["level"]] += 1
+            self.notes[note["note"]] += 1
+            self.summaries.setdefault(note["note"], note["summary"])
+
+    def as_dict(self, top: int = 20) -> Dict[str, Any]:
+        "Return the summary, with the top most common notes."
+        return {
+            "entries": self.entries,
+            "errors": self.errors,
+            "statuses": dict(self.statuses.most_common()),
+            "levels": dict(self.levels.most_common()),
+            "notes": [
+                {"note": name, "count": count, "summary": self.summaries[name]}
+                for name, count in self.notes.most_common(top)
+            ],
+        }
@@ -0,0 +1,336 @@
+"""
+Record and replay the HTTP exchanges behind a test.
+
+RecordingHttpClient captures each exchange's request and the events of its response (status line,
+raw headers, body chunks with timing, trailers and errors). ReplayHttpClient feeds them back into
+RedFetcher without touching the network, so that a test can be analysed again, reproducibly.
+
+Recordings are stored as gzipped JSON lines, one exchange per line.
+
+To use them, set the client on the top-level resource before checking it; subrequests and linked
+resources use the same client:
+
+    resource.client = RecordingHttpClient()
+    ...
+    resource.client.save("capture.jsonl.gz")
+
+    resource.client = ReplayHttpClient(load_recording("capture.jsonl.gz"))
+
+Exchanges are replayed for requests with the same method, URI and request header names, in the
+order they were recorded; exact header values are preferred if there's a choice. Because the range
+check asks for a random part of the body, it may not find the response it expects in a recording.
+"""
+
+from base64 import b64decode, b64encode
+from collections import defaultdict
+from configparser import SectionProxy
+import gzip
+import json
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+import thor
+import thor.http.error as httperr
+
+from redbot.resource.fetch import RedHttpClient, RedHttpClientExchange, DeadlineError
+from redbot.type import RawHeaderListType
+
+RecordType = Dict[str, Any]
+
+# Seconds to wait at the end of a cancelled recording for REDbot to cancel the replay.
+CANCEL_GRACE = 1.0
+
+
+class NotRecordedError(httperr.HttpError):
+    desc = "There is no recorded response for this request"
+
+
+def _str(value: bytes) -> str:
+    return value.decode("iso-8859-1")
+
+
+def _bytes(value: str) -> bytes:
+    return value.encode("iso-8859-1")
+
+
+def _str_headers(headers: RawHeaderListType) -> List[List[str]]:
+    return [[_str(name), _str(value)] for name, value in headers]
+
+
+def _bytes_headers(headers: List[List[str]]) -> RawHeaderListType:
+    return [(_bytes(name), _bytes(value)) for name, value in headers]
+
+
+def _match_keys(
+    method: str, uri: str, headers: List[List[str]]
+) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+    "Return the exact and loose keys used to find a recorded exchange for a request."
+    names = tuple(sorted(name.lower() for name, _ in headers))
+    values = tuple(sorted(f"{name.lower()}:{value}" for name, value in headers))
+    return (method, uri) + values, (method, uri) + names
+
+
+def load_recording(path: str) -> List[RecordType]:
+    "Load the exchanges saved in a recording file."
+    with gzip.open(path, "rt", encoding="ascii") as fh:
+        return [json.loads(line) for line in fh if line.strip()]
+
+
+def canned_record(
+    uri: str, body: bytes, res_hdrs: List[List[str]] = None
+) -> RecordType:
+    """
+    Make up a recording of a GET for uri (with a User-Agent of "test") that got a 200 OK with
+    res_hdrs (plus Content-Length) and body; e.g., for tests.
+    """
+    headers = (res_hdrs or []) + [["Content-Length", str(len(body))]]
+    header_length = len("HTTP/1.1 200 OK\r\n\r\n") + sum(
+        len(f"{name}: {value}\r\n") for name, value in headers
+    )
+    return {
+        "time": 1000000000.0,
+        "method": "GET",
+        "uri": uri,
+        "headers": [["User-Agent", "test"]],
+        "req_body": "",
+        "events": [
+            [0.1, "response_start", "1.1", "200", "OK", headers],
+            [0.2, "response_body", b64encode(body).decode("ascii")],
+            [0.2, "response_done", [], len(body), header_length],
+        ],
+    }
+
+
+class RecordingHttpClient(RedHttpClient):
+    "A RedHttpClient that records its exchanges."
+
+    def __init__(self, loop: thor.loop.LoopBase = None) -> None:
+        RedHttpClient.__init__(self, loop)
+        self.records: List[RecordType] = []
+
+    def exchange(self) -> RedHttpClientExchange:
+        return RecordingExchange(self)
+
+    def save(self, path: str) -> None:
+        "Write the recorded exchanges to path."
+        with gzip.open(path, "wt", encoding="ascii") as fh:
+            for record in self.records:
+                fh.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+
+class RecordingExchange(RedHttpClientExchange):
+    "A RedHttpClientExchange that records what happens to it."
+
+    def __init__(self, client: RecordingHttpClient) -> None:
+        RedHttpClientExchange.__init__(self, client)
+        self.recorder = client
+        self.record: RecordType = {"req_body": "", "events": []}
+        self._started = time.monotonic()
+        self._saved = False
+
+    def request_start(
+        self, method: bytes, uri: bytes, req_hdrs: RawHeaderListType
+    ) -> None:
+        self._started = time.monotonic()
+        self.record.update(
+            {
+                "time": round(time.time(), 3),
+                "method": _str(method),
+                "uri": _str(uri),
+                "headers": _str_headers(req_hdrs),
+            }
+        )
+        RedHttpClientExchange.request_start(self, method, uri, req_hdrs)
+
+    def request_body(self, chunk: bytes) -> None:
+        self.record["req_body"] += b64encode(chunk).decode("ascii")
+        RedHttpClientExchange.request_body(self, chunk)
+
+    def emit(self, event: str, *args: Any) -> None:
+        offset = round(time.monotonic() - self._started, 4)
+        if event in ["response_nonfinal", "response_start"]:
+            status, phrase, headers = args
+            self.record["events"].append(
+                [
+                    offset,
+                    event,
+                    _str(self.res_version),
+                    _str(status),
+                    _str(phrase),
+                    _str_headers(headers),
+                ]
+            )
+        elif event == "response_body":
+            self.record["events"].append(
+                [offset, event, b64encode(args[0]).decode("ascii")]
+            )
+        elif event == "response_done":
+            self.record["events"].append(
+                [
+                    offset,
+                    event,
+                    _str_headers(args[0]),
+                    self.input_transfer_length,
+                    self.input_header_length,
+                ]
+            )
+        elif event == "error":
+            self.record["events"].append(
+                [offset, event, args[0].__class__.__name__, args[0].detail]
+            )
+        elif event == "settled":
+            self._save()
+        RedHttpClientExchange.emit(self, event, *args)
+
+    def cancel(self) -> None:
+        self.record["cancelled"] = True
+        self._save()
+        RedHttpClientExchange.cancel(self)
+
+    def _save(self) -> None:
+        if not self._saved:
+            self._saved = True
+            self.recorder.records.append(self.record)
+
+
+class ReplayHttpClient(RedHttpClient):
+    """
+    A RedHttpClient that replays recorded exchanges instead of using the network.
+
+    If realtime is True, events are replayed with their recorded timing; otherwise, as soon as the
+    request is done.
+    """
+
+    def __init__(self, records: List[RecordType], realtime: bool = False) -> None:
+        RedHttpClient.__init__(self)
+        self.realtime = realtime
+        self._exact: Dict[Tuple[str, ...], List[RecordType]] = defaultdict(list)
+        self._loose: Dict[Tuple[str, ...], List[RecordType]] = defaultdict(list)
+        for record in records:
+            if "uri" not in record:
+                continue
+            exact, loose = _match_keys(
+                record["method"], record["uri"], record["headers"]
+            )
+            self._exact[exact].append(record)
+            self._loose[loose].append(record)
+
+    def setup(self, config: SectionProxy) -> None:
+        return
+
+    def exchange(self) -> RedHttpClientExchange:
+        return ReplayExchange(self)
+
+    def take(self, method: str, uri: str, headers: List[List[str]]) -> RecordType:
+        "Return the next recorded exchange for a request, or None."
+        exact, loose = _match_keys(method, uri, headers)
+        candidates = self._exact.get(exact) or self._loose.get(loose)
+        if not candidates:
+            return None
+        record = candidates.pop(0)
+        for index in [self._exact, self._loose]:
+            for key in [exact, loose]:
+                if key in index:
+                    index[key] = [r for r in index[key] if r is not record]
+        return record
+
+
+class ReplayExchange(RedHttpClientExchange):
+    """
+    A RedHttpClientExchange that plays back a recorded exchange.
+
+    now() returns the time that the current event was recorded at, so that checks that depend on
+    the time see the same thing as they did when recording.
+    """
+
+    def __init__(self, client: ReplayHttpClient) -> None:
+        RedHttpClientExchange.__init__(self, client)
+        self.replayer = client
+        self.record: RecordType = None
+        self._offset: float = 0
+        self._scheduled: List[thor.loop.ScheduledEvent] = []
+
+    def now(self) -> float:
+        if self.record is None or "time" not in self.record:
+            return time.time()
+        return float(self.record["time"]) + self._offset
+
+    def request_start(
+        self, method: bytes, uri: bytes, req_hdrs: RawHeaderListType
+    ) -> None:
+        self.method = method
+        self.uri = uri
+        self.req_hdrs = req_hdrs
+        self.record = self.replayer.take(
+            _str(method), _str(uri), _str_headers(req_hdrs)
+        )
+
+    def request_body(self, chunk: bytes) -> None:
+        return
+
+    def request_done(self, trailers: RawHeaderListType) -> None:
+        if self.record is None:
+            self._schedule(
+                0, self._play_event, [0, "error", "NotRecordedError", _str(self.uri)]
+            )
+            self._schedule(0, self._settle)
+        elif self.replayer.realtime:
+            events = self.record["events"]
+            for event in events:
+                self._schedule(event[0], self._play_event, event)
+            self._schedule(events[-1][0] if events else 0, self._play_end)
+        else:
+            # Like the network, don't respond before the request has been made.
+            self._schedule(0, self._play)
+
+    def _play(self) -> None:
+        for event in self.record["events"]:
+            self._play_event(event)
+        self._play_end()
+
+    def _play_end(self) -> None:
+        if self.record.get("cancelled", False):
+            # REDbot gave up on this exchange; if it doesn't do so again soon, stop it here.
+            self._schedule(
+                CANCEL_GRACE,
+                self._play_event,
+                [self._offset, "error", "DeadlineError", "The recording ends here."],
+            )
+        else:
+            self._settle()
+
+    def _schedule(
+        self, delta: float, callback: Callable[..., None], *args: Any
+    ) -> None:
+        self._scheduled.append(thor.schedule(delta, callback, *args))
+
+    def _play_event(self, event: List[Any]) -> None:
+        if self.cancelled:
+            return
+        self._offset = event[0]
+        name = event[1]
+        if name in ["response_nonfinal", "response_start"]:
+            self.res_version = _bytes(event[2])
+            self.emit(
+                name, _bytes(event[3]), _bytes(event[4]), _bytes_headers(event[5])
+            )
+        elif name == "response_body":
+            self.emit(name, b64decode(event[2]))
+        elif name == "response_done":
+            self.input_transfer_length = event[3]
+            self.input_header_length = event[4]
+            self.emit(name, _bytes_headers(event[2]))
+        elif name == "error":
+            error_class = {
+                "NotRecordedError": NotRecordedError,
+                "DeadlineError": DeadlineError,
+            }.get(event[2], getattr(httperr, event[2], httperr.HttpError))
+            self.emit(name, error_class(event[3]))
+            if error_class is DeadlineError:
+                self._settle()
+
+    def cancel(self) -> None:
+        for scheduled in self._scheduled:
+            scheduled.delete()
+        self._scheduled = []
+        RedHttpClientExchange.cancel(self)
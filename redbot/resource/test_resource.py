@@ -0,0 +1,580 @@
+# coding=UTF-8
+
+from base64 import b64encode
+from configparser import ConfigParser
+import json
+import os
+import tempfile
+import time
+from types import SimpleNamespace
+import unittest
+import unittest.mock
+from typing import Any, Dict, List
+
+import thor
+import thor.http.error as httperr
+
+from redbot.resource import HttpResource
+from redbot.resource.dns import ACCESS_DENIED, AddressFilter, DnsCache, LOCAL_NETWORKS
+from redbot.resource.fetch import (
+    BODY_TRUNCATED,
+    CircuitBreaker,
+    DeadlineError,
+    OutboundScheduler,
+    PhaseTimer,
+    RedFetcher,
+    RedHttpClient,
+    retry_after,
+)
+from redbot.resource.har import HarEntry, HarSummary, analyse, read_entries
+from redbot.resource.replay import (
+    NotRecordedError,
+    ReplayHttpClient,
+    canned_record,
+)
+from redbot.resource.trace import children, critical_path, describe, trace_events
+
+
+class AddressFilterTester(unittest.TestCase):
+    def test_local(self) -> None:
+        address_filter = AddressFilter(LOCAL_NETWORKS)
+        for addr in [
+            "127.0.0.1",
+            "10.1.2.3",
+            "192.168.1.1",
+            "172.31.255.255",
+            "169.254.169.254",
+            "0.0.0.0",
+            "224.0.0.1",
+            "::1",
+            "fe80::1",
+            "fd00::1",
+            "ff02::1",
+            "::ffff:127.0.0.1",
+            "fe80::1%eth0",
+            "not an address",
+        ]:
+            self.assertFalse(address_filter.check(addr), addr)
+        for addr in ["93.184.216.34", "172.32.0.1", "2606:2800:220:1::1"]:
+            self.assertTrue(address_filter.check(addr), addr)
+
+    def test_allow(self) -> None:
+        address_filter = AddressFilter(
+            LOCAL_NETWORKS + ["203.0.113.0/24"], ["10.1.0.0/16"]
+        )
+        self.assertTrue(address_filter.check("10.1.2.3"))
+        self.assertFalse(address_filter.check("10.2.2.3"))
+        self.assertFalse(address_filter.check("203.0.113.99"))
+
+    def test_merge(self) -> None:
+        address_filter = AddressFilter(["10.0.0.0/9", "10.128.0.0/9", "10.64.0.0/10"])
+        self.assertFalse(address_filter.check("10.200.0.1"))
+        self.assertTrue(address_filter.check("11.0.0.0"))
+        self.assertTrue(address_filter.check("9.255.255.255"))
+
+    def test_empty(self) -> None:
+        self.assertFalse(AddressFilter([]))
+        self.assertTrue(AddressFilter(["10.0.0.0/8"]))
+
+
+class DnsCacheTester(unittest.TestCase):
+    results = [(2, 1, 6, "", ("192.0.2.1", 80))]
+
+    def setUp(self) -> None:
+        self.cache = DnsCache()
+        self.now = 0.0
+        self.resolved: List[bytes] = []
+
+        def resolve(host: bytes, port: int, _: int, callback: Any) -> None:
+            self.resolved.append(host)
+            callback(self.results)
+
+        for target, func in [("lookup", resolve), ("time.monotonic", lambda: self.now)]:
+            patcher = unittest.mock.patch(f"redbot.resource.dns.{target}", func)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def lookup(self, host: bytes) -> List[Any]:
+        got: List[Any] = []
+        self.cache.lookup(host, 80, got.append)
+        return got
+
+    def test_hit(self) -> None:
+        self.assertEqual(self.lookup(b"example.com"), [self.results])
+        self.assertEqual(self.lookup(b"example.com"), [self.results])
+        self.assertEqual(self.resolved, [b"example.com"])
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_expire(self) -> None:
+        self.cache.max_entries = 2
+        self.lookup(b"old.example.com")
+        self.now = 50.0
+        self.lookup(b"new.example.com")
+        self.now = 70.0
+        self.lookup(b"other.example.com")  # full; old.example.com is stale, so it goes
+        self.lookup(b"new.example.com")
+        self.assertEqual(self.cache.hits, 1)
+        self.lookup(b"another.example.com")  # full, but nothing is stale; start again
+        self.lookup(b"new.example.com")
+        self.assertEqual(self.cache.hits, 1)
+
+
+class CircuitBreakerTester(unittest.TestCase):
+    origin = "http://example.com:80"
+
+    def setUp(self) -> None:
+        self.breaker = CircuitBreaker()
+
+    def record_failures(self, count: int = 1) -> None:
+        for _ in range(count):
+            self.breaker.failure(self.origin, httperr.ConnectError("refused"))
+
+    def test_open(self) -> None:
+        self.record_failures(2)
+        self.assertTrue(self.breaker.allow(self.origin))
+        self.record_failures()
+        self.assertFalse(self.breaker.allow(self.origin))
+        self.assertTrue(self.breaker.allow("http://example.net:80"))
+        self.assertEqual(self.breaker.stats["open"], 1)
+        self.assertEqual(self.breaker.stats["fail_fast"], 1)
+
+    def test_success_resets(self) -> None:
+        self.record_failures(2)
+        self.breaker.success(self.origin)
+        self.record_failures(2)
+        self.assertTrue(self.breaker.allow(self.origin))
+
+    def test_other_errors(self) -> None:
+        for _ in range(5):
+            self.breaker.failure(self.origin, httperr.ExtraDataError("oops"))
+            self.breaker.failure(self.origin, httperr.ConnectError(ACCESS_DENIED))
+        self.assertTrue(self.breaker.allow(self.origin))
+
+    def test_probe(self) -> None:
+        self.record_failures(3)
+        self.breaker.open_until[self.origin] = 0
+        self.assertTrue(self.breaker.allow(self.origin))
+        self.assertFalse(self.breaker.allow(self.origin))  # probe in flight
+        self.record_failures()
+        self.assertFalse(self.breaker.allow(self.origin))
+        self.assertEqual(self.breaker.stats["reopen"], 1)
+        self.breaker.open_until[self.origin] = 0
+        self.assertTrue(self.breaker.allow(self.origin))
+        self.breaker.success(self.origin)
+        self.assertTrue(self.breaker.allow(self.origin))
+        self.assertEqual(self.breaker.stats["close"], 1)
+
+    def test_disabled(self) -> None:
+        self.breaker.threshold = 0
+        self.record_failures(10)
+        self.assertTrue(self.breaker.allow(self.origin))
+
+
+class OutboundSchedulerTester(unittest.TestCase):
+    def setUp(self) -> None:
+        self.scheduler = OutboundScheduler()
+        self.scheduler.max_origin = 2
+        self.started: List[str] = []
+
+    def request(self, name: str, origin: str = "a", priority: int = 0) -> Any:
+        return self.scheduler.request(
+            origin, priority, lambda: self.started.append(name)
+        )
+
+    def test_origin_limit(self) -> None:
+        first = self.request("1")
+        self.request("2")
+        self.request("3")
+        self.request("b1", origin="b")
+        self.assertEqual(self.started, ["1", "2", "b1"])
+        self.scheduler.release(first)
+        self.assertEqual(self.started, ["1", "2", "b1", "3"])
+
+    def test_priority(self) -> None:
+        first = self.request("1")
+        self.request("2")
+        self.request("asset", priority=1)
+        self.request("check")
+        self.scheduler.release(first)
+        self.assertEqual(self.started, ["1", "2", "check"])
+
+    def test_total_limit(self) -> None:
+        self.scheduler.max_total = 1
+        first = self.request("a1")
+        waiting = self.request("b1", origin="b")
+        self.request("c1", origin="c")
+        self.scheduler.release(waiting)
+        self.scheduler.release(first)
+        self.assertEqual(self.started, ["a1", "c1"])
+
+    def test_throttle(self) -> None:
+        self.scheduler.max_origin = 4
+        self.scheduler.max_pause = 0  # don't actually pause
+        tickets = [self.request(str(i)) for i in range(4)]
+        self.scheduler.response("a", "429", None)
+        self.assertEqual(self.scheduler.limits["a"], 2)
+        for ticket in tickets:
+            self.scheduler.release(ticket)
+        self.request("4")
+        self.request("5")
+        self.request("6")
+        self.assertEqual(self.started[4:], ["4", "5"])
+        self.scheduler.response("a", "200", None)
+        self.scheduler.response("a", "200", None)
+        self.assertNotIn("a", self.scheduler.limits)
+        self.scheduler.response("a", "503", None)  # no Retry-After; not throttled
+        self.assertNotIn("a", self.scheduler.limits)
+
+    def test_pause(self) -> None:
+        self.scheduler.response("a", "503", 5)
+        self.assertFalse(self.scheduler.can_start("a"))
+        self.assertTrue(self.scheduler.can_start("b"))
+        self.scheduler.paused["a"] = time.monotonic() - 1
+        self.assertTrue(self.scheduler.can_start("a"))
+
+    def test_paused_origin_doesnt_block(self) -> None:
+        self.request("1")
+        self.request("2")
+        self.request("3")
+        self.scheduler.response("a", "429", 10)
+        self.request("c1", origin="c")
+        self.assertEqual(self.started, ["1", "2", "c1"])
+        self.assertEqual(len(self.scheduler.waiting), 1)
+
+    def test_retry_after(self) -> None:
+        config = ConfigParser()
+        config.read_dict({"redbot": {}})
+        fetcher = RedFetcher(config["redbot"])
+        self.assertIsNone(retry_after(fetcher.response))
+        fetcher.response.parsed_headers["retry-after"] = "120"
+        self.assertEqual(retry_after(fetcher.response), 120)
+        fetcher.response.parsed_headers["retry-after"] = "Fri, 31 Dec 1999 23:59:59 GMT"
+        self.assertEqual(retry_after(fetcher.response), 0)
+        fetcher.response.parsed_headers["retry-after"] = "soon"
+        self.assertIsNone(retry_after(fetcher.response))
+
+
+class TruncationTester(unittest.TestCase):
+    def fetch(self, chunks: List[bytes]) -> RedFetcher:
+        "Fetch a response whose body arrives in chunks, with a max_body_bytes of 10."
+        record = canned_record("http://example.com/", b"".join(chunks))
+        body_event = record["events"].pop(1)
+        record["events"][1:1] = [
+            [body_event[0], "response_body", b64encode(chunk).decode("ascii")]
+            for chunk in chunks
+        ]
+        config = ConfigParser()
+        config.read_dict({"redbot": {"max_body_bytes": "10"}})
+        fetcher = RedFetcher(config["redbot"])
+        fetcher.client = ReplayHttpClient([record])
+        fetcher.set_request("http://example.com/", req_hdrs=[("User-Agent", "test")])
+        fetcher.on("fetch_done", thor.stop)
+        fetcher.check()
+        thor.run()
+        return fetcher
+
+    def test_truncate(self) -> None:
+        fetcher = self.fetch([b"123456", b"7890abc", b"defghij"])
+        self.assertTrue(fetcher.response.truncated)
+        self.assertEqual(fetcher.response.payload_len, 10)
+        self.assertEqual(
+            b"".join(chunk for _, chunk in fetcher.response.payload_sample),
+            b"1234567890",
+        )
+        self.assertEqual(fetcher.transfer_in, 20)
+        self.assertIn(BODY_TRUNCATED, [note.__class__ for note in fetcher.notes])
+
+    def test_exact_limit(self) -> None:
+        fetcher = self.fetch([b"123456", b"7890"])
+        self.assertFalse(fetcher.response.truncated)
+        self.assertEqual(fetcher.response.payload_len, 10)
+        self.assertNotIn(BODY_TRUNCATED, [note.__class__ for note in fetcher.notes])
+        fetcher = self.fetch([b"123456", b"7890", b"x"])
+        self.assertTrue(fetcher.response.truncated)
+        self.assertEqual(fetcher.response.payload_len, 10)
+
+
+class DeadlineTester(unittest.TestCase):
+    def test_passed(self) -> None:
+        config = ConfigParser()
+        config.read_dict({"redbot": {}})
+        fetcher = RedFetcher(config["redbot"])
+        fetcher.set_request("http://example.com/")
+        fetcher.set_deadline(time.monotonic() - 1)
+        done: List[bool] = []
+        fetcher.on("fetch_done", lambda: done.append(True))
+        fetcher.check()
+        self.assertEqual(done, [True])
+        self.assertFalse(fetcher.fetch_started)
+        self.assertIsInstance(fetcher.response.http_error, DeadlineError)
+
+
+class SettleTester(unittest.TestCase):
+    def setUp(self) -> None:
+        self.exchange = RedHttpClient().exchange()
+        # send the request, but with nowhere to go; the response is fed to handle_input()
+        self.exchange.method = b"GET"
+        self.exchange.req_target = b"/"
+        self.exchange.req_hdrs = []
+        self.exchange.authority = b"example.com"
+        self.exchange.request_done([])
+        self.events: List[str] = []
+        for event in ["response_done", "error", "settled"]:
+            self.exchange.on(event, lambda *args, e=event: self.events.append(e))
+
+    def test_settle(self) -> None:
+        self.exchange.handle_input(b"HTTP/1.1 200 OK\r\nContent-Length: 5\r\n\r\nhel")
+        self.assertEqual(self.events, [])
+        self.exchange.handle_input(b"lo")
+        self.assertEqual(self.events, ["response_done", "settled"])
+
+    def test_extra_data(self) -> None:
+        self.exchange.handle_input(
+            b"HTTP/1.1 200 OK\r\nContent-Length: 5\r\n\r\nhelloEXTRA"
+        )
+        self.assertEqual(self.events, ["response_done", "error", "settled"])
+
+
+class PhaseTimerTester(unittest.TestCase):
+    def setUp(self) -> None:
+        self.timer = PhaseTimer()
+        self.timer.marks = {
+            "request_start": 10.0,
+            "connected": 10.5,
+            "response_start": 11.0,
+            "response_done": 11.25,
+        }
+
+    def test_phases(self) -> None:
+        self.timer.durations = {"dns": 0.1, "connect": 0.2, "body": 0.5, "links": 0.25}
+        self.assertEqual(
+            self.timer.phases(),
+            {
+                "blocked": 0.2,
+                "dns": 0.1,
+                "connect": 0.2,
+                "wait": 0.5,
+                "receive": 0.25,
+                "headers": None,
+                "body": 0.25,
+                "links": 0.25,
+                "render": None,
+            },
+        )
+        self.assertEqual(self.timer.processing_time(), 0.5)
+
+    def test_connected(self) -> None:
+        conn = SimpleNamespace(connect_timing=(0.25, 0.5))
+        self.timer.connected(conn)  # type: ignore
+        self.assertEqual(self.timer.phases()["connect"], 0.5)
+        reused = PhaseTimer()
+        reused.connected(conn)  # type: ignore
+        self.assertIsNone(reused.phases()["dns"])
+
+    def test_cpu_time(self) -> None:
+        other = PhaseTimer()
+        with self.timer.measure("body"):
+            with other.measure("links"):
+                sum(range(100000))
+        self.assertGreater(self.timer.cpu_time, 0)
+        self.assertEqual(other.cpu_time, 0)
+        self.assertFalse(PhaseTimer.measuring)
+
+    def test_no_connection(self) -> None:
+        del self.timer.marks["connected"]
+        phases = self.timer.phases()
+        self.assertIsNone(phases["blocked"])
+        self.assertEqual(phases["wait"], 1.0)
+
+    def test_measure(self) -> None:
+        with self.timer.measure("headers"):
+            pass
+        with self.timer.measure("headers"):
+            pass
+        self.assertGreaterEqual(self.timer.durations["headers"], 0)
+
+
+class ReplayTester(unittest.TestCase):
+    record = canned_record("http://example.com/", b"hello")
+
+    def fetch(self, uri: str) -> RedFetcher:
+        config = ConfigParser()
+        config.read_dict({"redbot": {}})
+        fetcher = RedFetcher(config["redbot"])
+        fetcher.client = ReplayHttpClient([self.record])
+        fetcher.set_request(uri, req_hdrs=[("User-Agent", "test")])
+        fetcher.on("fetch_done", thor.stop)
+        fetcher.check()
+        thor.run()
+        return fetcher
+
+    def test_replay(self) -> None:
+        fetcher = self.fetch("http://example.com/")
+        self.assertEqual(fetcher.response.status_code, "200")
+        self.assertEqual(fetcher.response.decoded_sample, b"hello")
+        self.assertEqual(fetcher.response.start_time, 1000000000.1)
+        self.assertTrue(fetcher.response.complete)
+        self.assertTrue(fetcher.settled)
+        phases = fetcher.timings.phases()
+        self.assertIsNotNone(phases["wait"])
+        self.assertIsNotNone(phases["headers"])
+
+    def test_not_recorded(self) -> None:
+        fetcher = self.fetch("http://example.com/other")
+        self.assertIsInstance(fetcher.response.http_error, NotRecordedError)
+
+
+class TraceTester(unittest.TestCase):
+    def check(self) -> HttpResource:
+        config = ConfigParser()
+        config.read_dict({"redbot": {}})
+        resource = HttpResource(config["redbot"], descend=True)
+        resource.client = ReplayHttpClient(
+            [
+                canned_record(
+                    "http://example.com/",
+                    b"<img src='/a.png'>",
+                    [["Content-Type", "text/html"]],
+                ),
+                canned_record(
+                    "http://example.com/a.png", b"png", [["Content-Type", "image/png"]]
+                ),
+            ]
+        )
+        resource.timings.spans = []
+        resource.set_request("http://example.com/", req_hdrs=[("User-Agent", "test")])
+        resource.on("check_done", thor.stop)
+        resource.check()
+        thor.run()
+        return resource
+
+    def test_trace_events(self) -> None:
+        resource = self.check()
+        events = trace_events(resource)
+        names = [e["args"]["name"] for e in events if e["name"] == "thread_name"]
+        self.assertEqual(names[0], "default http://example.com/")
+        self.assertIn("default http://example.com/a.png", names)
+        checks = [e for e in events if e["name"] == "check"]
+        self.assertEqual(len(checks), len(names))
+        self.assertEqual(checks[0]["ts"], 0)
+        self.assertEqual(checks[0]["args"]["status"], "200")
+        self.assertTrue(checks[0]["args"]["critical"])
+        top = [e["name"] for e in events if e["ph"] == "X" and e["tid"] == 1]
+        for name in ["wait", "receive", "headers", "body", "links"]:
+            self.assertIn(name, top)
+        flows = [e for e in events if e["ph"] in ["s", "f"]]
+        self.assertEqual(len(flows), 2 * (len(names) - 1))
+        for event in events:
+            if event["ph"] == "X":
+                self.assertGreaterEqual(event["dur"], 0)
+
+    def test_no_spans(self) -> None:
+        config = ConfigParser()
+        config.read_dict({"redbot": {}})
+        resource = HttpResource(config["redbot"])
+        self.assertEqual(trace_events(resource), [])
+        self.assertIn("(not started)", describe(resource))
+
+    def test_critical_path(self) -> None:
+        resource = self.check()
+        path = critical_path(resource)
+        self.assertIs(path[0], resource)
+        for parent, child in zip(path, path[1:]):
+            self.assertIn(child, children(parent))
+            self.assertGreater(
+                child.timings.marks["check_done"], parent.timings.marks["fetch_done"]
+            )
+        self.assertTrue(resource.show_task_map().startswith("default <http://"))
+        self.assertIn("done in", resource.show_task_map())
+
+
+class HarTester(unittest.TestCase):
+    entry: Dict[str, Any] = {
+        "startedDateTime": "2024-05-06T10:12:31.000Z",
+        "timings": {"blocked": -1, "send": 0, "wait": 1000, "receive": 5},
+        "request": {
+            "method": "GET",
+            "url": "http://example.com/",
+            "headers": [{"name": "Accept", "value": "*/*"}],
+        },
+        "response": {
+            "status": 200,
+            "statusText": "OK",
+            "httpVersion": "HTTP/1.1",
+            "headers": [
+                {"name": "Date", "value": "Mon, 06 May 2024 10:12:32 GMT"},
+                {"name": "Cache-Control", "value": "max-age=60"},
+            ],
+            "content": {"size": 4, "text": "body"},
+        },
+    }
+
+    def write_har(self, entries: List[Any], truncate: int = 0) -> str:
+        har = json.dumps({"log": {"version": "1.2", "entries": entries}}, indent=1)
+        with tempfile.NamedTemporaryFile(
+            "w", suffix=".har", delete=False, encoding="utf-8"
+        ) as fh:
+            fh.write(har[: len(har) - truncate])
+        self.addCleanup(os.unlink, fh.name)
+        return fh.name
+
+    def test_read_entries(self) -> None:
+        entries = [dict(self.entry, index=i) for i in range(20)]
+        path = self.write_har(entries)
+        self.assertEqual(list(read_entries(path, read_size=64)), entries)
+        self.assertEqual(list(read_entries(self.write_har([]))), [])
+
+    def test_read_truncated(self) -> None:
+        path = self.write_har([self.entry] * 3, truncate=40)
+        with self.assertRaises(ValueError):
+            list(read_entries(path, read_size=64))
+
+    def test_entry(self) -> None:
+        result = HarEntry(self.entry).result(0)
+        self.assertEqual(result["uri"], "http://example.com/")
+        self.assertEqual(result["status"], "200")
+        notes = [note["note"] for note in result["notes"]]
+        self.assertIn("DATE_CORRECT", notes)
+        self.assertIn("FRESHNESS_FRESH", notes)
+
+    def test_malformed_headers(self) -> None:
+        for headers in [
+            [{"name": "Accept"}],
+            ["Accept: */*"],
+            [{"name": 1, "value": ""}],
+        ]:
+            request = dict(self.entry["request"], headers=headers)
+            result = HarEntry(dict(self.entry, request=request)).result(0)
+            self.assertTrue(result["error"].startswith("Malformed header: "))
+            self.assertEqual(result["notes"], [])
+
+    def test_null_members(self) -> None:
+        response = dict(self.entry["response"], statusText=None, httpVersion=None)
+        result = next(analyse([dict(self.entry, response=response)], 1))
+        self.assertIsNone(result["error"])
+        self.assertEqual(result["status"], "200")
+        result = HarEntry(dict(self.entry, response=response)).result(0)
+        self.assertTrue(result["error"].startswith("Malformed entry: "))
+
+    def test_not_object(self) -> None:
+        entries: List[Any] = ["entry", None, [self.entry], self.entry]
+        results = list(analyse(entries, 1))
+        for result in results[:3]:
+            self.assertTrue(result["error"].startswith("Malformed entry: "))
+        self.assertIsNone(results[3]["error"])
+
+    def test_analyse(self) -> None:
+        bad_hdrs = dict(self.entry["response"], headers=[{"value": "x"}])
+        entries = [self.entry] * 5 + [
+            dict(self.entry, request={"method": "GET"}),
+            dict(self.entry, response=bad_hdrs),
+        ]
+        for processes in [1, 2]:
+            summary = HarSummary()
+            results = list(analyse(entries, processes, batch_size=2))
+            self.assertEqual([r["index"] for r in results], list(range(7)))
+            for result in results:
+                summary.add(result)
+            self.assertEqual(summary.entries, 7)
+            self.assertEqual(summary.errors, 2)
+            self.assertEqual(summary.statuses["200"], 5)
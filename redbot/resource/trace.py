@@ -0,0 +1,214 @@
+"""
+Tracing for RED, the Resource Expert Droid.
+
+A check fans out into a tree: an HttpResource starts subrequests (see add_check), and when
+descending, linked HttpResources, which start their own. Each one's PhaseTimer marks when its
+check and fetch started and finished, and if tracing is on (PhaseTimer.spans), when its
+processing phases ran.
+
+trace_events() turns that tree into the Trace Event Format, which chrome://tracing and Perfetto
+(https://ui.perfetto.dev/) can show. Each fetch gets its own track, holding a "check" span (from
+starting the check to everything it started being done) with its network and processing phases
+inside it; arrows link each check to the checks it started.
+
+critical_path() finds the chain of checks that decided when a check finished.
+"""
+
+import json
+import math
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from redbot.resource.fetch import PhaseTimer, RedFetcher
+
+Span = Tuple[str, float, float]
+
+
+def children(fetcher: RedFetcher) -> List[RedFetcher]:
+    "Return the checks that fetcher started."
+    out = [
+        subreq
+        for subreq in getattr(fetcher, "subreqs", {}).values()
+        if "check_start" in subreq.timings.marks
+    ]
+    out.extend(linked for linked, _ in getattr(fetcher, "linked", []))
+    return out
+
+
+def walk(
+    fetcher: RedFetcher, parent: RedFetcher = None
+) -> Iterator[Tuple[RedFetcher, Optional[RedFetcher]]]:
+    "Yield (fetcher, parent) for fetcher and every check under it, depth-first."
+    yield fetcher, parent
+    for child in children(fetcher):
+        yield from walk(child, fetcher)
+
+
+def _finished(fetcher: RedFetcher, mark: str = "check_done") -> float:
+    return fetcher.timings.marks.get(mark, math.inf)
+
+
+def critical_path(fetcher: RedFetcher) -> List[RedFetcher]:
+    """
+    Return the chain of checks, starting with fetcher, that finished last (or are still going),
+    each one started by the one before it.
+    """
+    path = [fetcher]
+    while True:
+        started = children(path[-1])
+        if not started:
+            break
+        last = max(started, key=_finished)
+        if _finished(last) <= _finished(path[-1], "fetch_done"):
+            break  # its own fetch was the last thing to finish
+        path.append(last)
+    return path
+
+
+def describe(fetcher: RedFetcher, now: float = None) -> str:
+    "Describe where fetcher's check is up to."
+    marks = fetcher.timings.marks
+    if now is None:
+        now = time.monotonic()
+    start = marks.get("check_start")
+    if start is None:
+        state = "not started"
+    elif "check_done" in marks:
+        state = f"done in {marks['check_done'] - start:.2f}s"
+    else:
+        if "fetch_done" in marks:
+            doing = "waiting for its checks"
+        elif "response_start" in marks:
+            doing = "receiving"
+        elif "fetch_start" in marks:
+            doing = "waiting for a response"
+        elif "request_start" in marks:
+            doing = "queued"
+        else:
+            doing = "starting"
+        state = f"{doing} after {now - start:.2f}s"
+    return f"{fetcher.check_name} <{fetcher.request.uri}> ({state})"
+
+
+def format_critical_path(fetcher: RedFetcher) -> str:
+    "Describe the critical path of fetcher's check, for debugging."
+    now = time.monotonic()
+    return " -> ".join(describe(step, now) for step in critical_path(fetcher))
+
+
+def network_spans(timings: PhaseTimer) -> List[Span]:
+    "Return when each network phase of a fetch happened, as (phase, start, end)."
+    marks = timings.marks
+    spans: List[Span] = []
+
+    def add(name: str, start: Optional[float], end: Optional[float]) -> None:
+        if start is not None and end is not None and end > start:
+            spans.append((name, start, end))
+
+    add("queued", marks.get("request_start"), marks.get("fetch_start"))
+    connected = marks.get("connected")
+    if connected is not None:
+        connect_start = connected - timings.durations.get("connect", 0.0)
+        dns_start = connect_start - timings.durations.get("dns", 0.0)
+        fetch_start = marks.get("fetch_start", dns_start)
+        add("blocked", fetch_start, dns_start)
+        add("dns", max(fetch_start, dns_start), connect_start)
+        add("connect", max(fetch_start, connect_start), connected)
+        add("wait", connected, marks.get("response_start"))
+    else:
+        add("wait", marks.get("fetch_start"), marks.get("response_start"))
+    add("receive", marks.get("response_start"), marks.get("response_done"))
+    return spans
+
+
+def trace_events(resource: RedFetcher) -> List[Dict[str, Any]]:
+    "Return the trace events for resource's check (see the module docstring)."
+    fetchers = [
+        (fetcher, parent)
+        for fetcher, parent in walk(resource)
+        if "check_start" in fetcher.timings.marks
+    ]
+    if not fetchers:
+        return []
+    base = min(fetcher.timings.marks["check_start"] for fetcher, _ in fetchers)
+    on_path = {id(fetcher) for fetcher in critical_path(resource)}
+    tids: Dict[int, int] = {}
+    events: List[Dict[str, Any]] = []
+
+    def usec(seconds: float) -> float:
+        return round((seconds - base) * 1000000, 3)
+
+    def span(
+        tid: int, name: str, cat: str, start: float, end: float, **args: Any
+    ) -> None:
+        event = {
+            "name": name,
+            "cat": cat,
+            "ph": "X",
+            "pid": 1,
+            "tid": tid,
+            "ts": usec(start),
+            "dur": round((end - start) * 1000000, 3),
+        }
+        if args:
+            event["args"] = args
+        events.append(event)
+
+    for tid, (fetcher, parent) in enumerate(fetchers, 1):
+        tids[id(fetcher)] = tid
+        timings = fetcher.timings
+        marks = timings.marks
+        events.append(
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": 1,
+                "tid": tid,
+                "args": {"name": f"{fetcher.check_name} {fetcher.request.uri}"},
+            }
+        )
+        events.append(
+            {
+                "name": "thread_sort_index",
+                "ph": "M",
+                "pid": 1,
+                "tid": tid,
+                "args": {"sort_index": tid},
+            }
+        )
+        start = marks["check_start"]
+        end = marks.get("check_done", marks.get("fetch_done", max(marks.values())))
+        span(
+            tid,
+            "check",
+            "check",
+            start,
+            end,
+            uri=fetcher.request.uri,
+            check_name=fetcher.check_name,
+            status=fetcher.response.status_code,
+            error=fetcher.response.http_error and fetcher.response.http_error.desc,
+            critical=id(fetcher) in on_path,
+        )
+        for name, span_start, span_end in network_spans(timings):
+            span(tid, name, "network", span_start, span_end)
+        for name, span_start, span_end in timings.spans or []:
+            span(tid, name, "processing", span_start, span_end)
+        if parent is not None:
+            flow = {"name": "started", "cat": "check", "id": tid, "pid": 1}
+            events.append(dict(flow, ph="s", tid=tids[id(parent)], ts=usec(start)))
+            events.append(dict(flow, ph="f", bp="e", tid=tid, ts=usec(start)))
+    return events
+
+
+def write_trace(resource: RedFetcher, path: str) -> None:
+    "Write the trace of resource's check to path, as JSON."
+    with open(path, "w", encoding="utf-8") as fh:
+        json.dump(
+            {
+                "traceEvents": trace_events(resource),
+                "displayTimeUnit": "ms",
+                "otherData": {"uri": resource.request.uri},
+            },
+            fh,
+        )
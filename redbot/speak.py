@@ -10,11 +10,41 @@ it need to be escaped to be safe for use in HTML.
 
 from binascii import b2a_hex
 from enum import Enum
-from typing import Any, Dict, Union
+from functools import lru_cache
+import re
+from typing import Any, Dict, Match, Union
 
 from markupsafe import Markup, escape
 from markdown import Markdown
 
+# A %-format placeholder like "%(name)s" or "%(name).100s", or an escaped "%".
+PLACEHOLDER = re.compile(r"%\((\w+)\)([#0\- +]*\d*(?:\.\d+)?[sdifr])|%%")
+
+# Shared by everything that renders Markdown; conversion is synchronous, so it's never re-entered.
+_markdown = Markdown(output_format="html")
+
+
+@lru_cache(maxsize=None)
+def markdown_template(text: str) -> str:
+    """
+    Convert Markdown text containing %-format placeholders into a HTML %-format template, once.
+
+    The placeholders are kept out of the Markdown conversion, so that the values filled into them
+    (which need to be HTML-escaped first) aren't interpreted as Markdown.
+    """
+    placeholders = []
+
+    def hide(match: Match) -> str:
+        if match.group(0) == "%%":
+            return "%"
+        placeholders.append(f"%({match.group(1)}){match.group(2)}")
+        return f"REDBOTVAR{len(placeholders) - 1}X"
+
+    html = _markdown.reset().convert(PLACEHOLDER.sub(hide, text)).replace("%", "%%")
+    for num, placeholder in enumerate(placeholders):
+        html = html.replace(f"REDBOTVAR{num}X", placeholder)
+    return html
+
 
 class categories(Enum):
     "Note classifications."
@@ -45,7 +75,6 @@ class Note:
     level: levels = None
     summary = ""
     text = ""
-    _markdown = Markdown(output_format="html")
 
     def __init__(self, subject: str, vrs: Dict[str, Union[str, int]] = None) -> None:
         self.subject = subject
@@ -74,9 +103,8 @@ class Note:
         The resulting string is already HTML-encoded.
         """
         return Markup(
-            self._markdown.reset().convert(
-                self.text % {k: escape(str(v)) for k, v in self.vars.items()}
-            )
+            markdown_template(self.text)
+            % {k: escape(str(v)) for k, v in self.vars.items()}
         )
 
 
@@ -32,7 +32,7 @@ pct_encoded = rf"(?: % {HEXDIG} {HEXDIG} )"
 
 attr_char = rf"""(?:
                   {ALPHA} | {DIGIT}
-                | !  | #  | \$ | &  | \+ | -  | .
+                | !  | \#  | \$ | &  | \+ | -  | \.
                 | \^ | _  | `  | \| | ~
 )"""
 
@@ -50,7 +50,7 @@ value_chars = rf"(?: (?: {pct_encoded} | {attr_char} )* )"
 
 mime_charsetc = rf"""(?:
                   {ALPHA} | {DIGIT}
-                | !  | #  | \$ | %  | &
+                | !  | \#  | \$ | %  | &
                 | \+ | -  | \^ | _  | `
                 | \{{ | \}} | ~
 )"""
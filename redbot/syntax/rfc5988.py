@@ -18,7 +18,7 @@ from .rfc5987 import ext_value
 from .rfc7230 import list_rule, OWS, quoted_string, token
 from .rfc7231 import _type as type_name, subtype as subtype_name
 
-MediaDesc = r"(?: {token} (?: {SP}+ {token} )* )"
+MediaDesc = rf"(?: {token} (?: {SP}+ {token} )* )"
 parmname = token
 LOALPHA = r"(?: [a-z] )"
 
@@ -38,7 +38,7 @@ ext_name_star = rf"(?: {parmname} [*] )"
 #                 | "}" | "~"
 
 ptokenchar = rf"""(?:
-                     !  | #  | \$ | %  | &  | '  | \(
+                     !  | \#  | \$ | %  | &  | '  | \(
                    | \) | \* | \+ | -  | \. | /  | {DIGIT}
                    | :  | <  | =  | >  | \? | @  | {ALPHA}
                    | \[ | \] | \^ | _  | `  | \{{ | \|
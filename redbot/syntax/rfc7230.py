@@ -182,7 +182,7 @@ protocol_version = token
 
 # protocol = protocol-name [ "/" protocol-version ]
 
-protocol = rf"(?: {protocol_name} (?: {protocol_version} )? )"
+protocol = rf"(?: {protocol_name} (?: / {protocol_version} )? )"
 
 # Upgrade = 1#protocol
 
@@ -213,8 +213,11 @@ comment = rf"(?: \( (?: {ctext} | {quoted_pair} )* \) )"
 
 # Via = 1#( received-protocol RWS received-by [ RWS comment ] )
 
+# received-by can be empty (an empty reg-name), so don't let it start part-way through RWS;
+# that makes matching quadratic.
+
 Via = list_rule(
-    rf"(?: {received_protocol} {RWS} {received_by} (?: {RWS} {comment} )? )",
+    rf"(?: {received_protocol} {RWS} (?! {SP} | {HTAB} ) {received_by} (?: {RWS} {comment} )? )",
     1,
 )
 
@@ -309,11 +312,11 @@ https_URI = (
 
 # origin-form = absolute-path [ "?" query ]
 
-origin_form = rf"(?: {absolute_path} (?: {query} )? )"
+origin_form = rf"(?: {absolute_path} (?: \? {query} )? )"
 
 # partial-URI = relative-part [ "?" query ]
 
-partial_URI = rf"(?: {relative_part} (?: {query} )? )"
+partial_URI = rf"(?: {relative_part} (?: \? {query} )? )"
 
 
 ## Message
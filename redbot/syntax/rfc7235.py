@@ -41,7 +41,7 @@ challenge = rf"""(?: {auth_scheme}
                           (?: {token68} |
                             (?:
                                 (?: , | {auth_param} )
-                                (?: {OWS} , (?: OWS {auth_param} )? )*
+                                (?: {OWS} , (?: {OWS} {auth_param} )? )*
                             )?
                           )
                         )?
@@ -62,7 +62,7 @@ credentials = rf"""(?: {auth_scheme}
                           (?: {token68} |
                             (?:
                                 (?: , | {auth_param} )
-                                (?: {OWS} , (?: OWS {auth_param} )? )*
+                                (?: {OWS} , (?: {OWS} {auth_param} )? )*
                             )?
                           )
                         )?
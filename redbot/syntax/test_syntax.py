@@ -0,0 +1,129 @@
+"""
+Performance tests for the regex in redbot.syntax, using adversarial input.
+
+Each header handler's syntax is matched against long runs of characters that are likely to cause
+catastrophic backtracking, as long as the longest value HttpHeader will check (MAX_HDR_SIZE);
+matching has to finish within MATCH_BUDGET seconds.
+"""
+
+import os
+import re
+import signal
+import time
+import unittest
+from typing import Any, Callable, Iterator, List, Type
+
+from redbot.message.headers import HeaderProcessor, HttpHeader, MAX_HDR_SIZE
+from redbot.message.headers._utils import RE_FLAGS
+from redbot.syntax import rfc7230
+
+MATCH_BUDGET = 0.1  # seconds
+INPUT_SIZE = MAX_HDR_SIZE  # characters
+
+# Runs of these are repeated to make adversarial inputs.
+UNITS = [
+    "a",
+    "0",
+    " ",
+    "\t",
+    ",",
+    ";",
+    "=",
+    '"',
+    "\\",
+    "/",
+    "%0",
+    ":",
+    ".",
+    "!",
+    "(a",
+    "a=",
+    "a=b;",
+    "a ",
+    ", ",
+    'a="b\\"',
+]
+PREFIXES = ["", "a", '"', "<a>;", "0", "bytes="]
+
+
+def adversarial_inputs(size: int = INPUT_SIZE) -> Iterator[str]:
+    "Yield values that almost match many syntaxes, but fail at the end."
+    for prefix in PREFIXES:
+        for unit in UNITS:
+            yield prefix + unit * (size // len(unit)) + "\x01"
+
+
+def header_handlers() -> List[Type[HttpHeader]]:
+    "Return the header handler classes that have a syntax."
+    handlers = []
+    header_dir = os.path.join(
+        os.path.dirname(os.path.dirname(__file__)), "message", "headers"
+    )
+    for filename in sorted(os.listdir(header_dir)):
+        if not filename.endswith(".py") or filename.startswith("_"):
+            continue
+        handler = HeaderProcessor.find_header_handler(filename[:-3], default=False)
+        if handler and handler.syntax:
+            handlers.append(handler)
+    return handlers
+
+
+class MatchTimeout(Exception):
+    pass
+
+
+def _timeout(signum: int, frame: Any) -> None:
+    raise MatchTimeout
+
+
+def time_call(func: Callable[..., Any], *args: Any) -> float:
+    """
+    Call func with args and return the time taken. Where possible, give up after a few times
+    MATCH_BUDGET, so that catastrophic backtracking fails the test rather than hanging it.
+    """
+    start = time.perf_counter()
+    if hasattr(signal, "setitimer"):
+        signal.signal(signal.SIGALRM, _timeout)
+        signal.setitimer(signal.ITIMER_REAL, MATCH_BUDGET * 5)
+    try:
+        func(*args)
+    except MatchTimeout:
+        pass
+    finally:
+        if hasattr(signal, "setitimer"):
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    return time.perf_counter() - start
+
+
+def match(pattern: str, value: str) -> None:
+    "Match value against pattern as HttpHeader does."
+    re.match(rf"^(?:{pattern})$", value.strip(), RE_FLAGS)
+
+
+class SyntaxPerformanceTest(unittest.TestCase):
+    def test_header_syntax(self) -> None:
+        for handler in header_handlers():
+            syntax = handler.syntax
+            if isinstance(syntax, rfc7230.list_rule):
+                syntax = syntax.element
+            match(str(syntax), "")  # compile it outside of the timing
+            for value in adversarial_inputs():
+                elapsed = time_call(match, str(syntax), value)
+                self.assertLess(
+                    elapsed,
+                    MATCH_BUDGET,
+                    f"{handler.canonical_name} syntax took {elapsed:.3f}s on {value[:12]!r}...",
+                )
+
+    def test_split_list_header(self) -> None:
+        for value in adversarial_inputs(MAX_HDR_SIZE * 16):
+            elapsed = time_call(HttpHeader.split_list_header, value)
+            self.assertLess(
+                elapsed,
+                MATCH_BUDGET,
+                f"splitting took {elapsed:.3f}s on {value[:12]!r}...",
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
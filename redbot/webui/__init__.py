@@ -11,7 +11,7 @@ from random import getrandbits
 import string
 import sys
 import time
-from typing import Any, Callable, Dict, List, Tuple, Union, cast
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union, cast
 from urllib.parse import parse_qs, urlsplit, urlencode
 
 import thor
@@ -19,7 +19,17 @@ import thor.http.common
 from thor.http import get_header
 from redbot import __version__
 from redbot.message import HttpRequest
+from redbot.webui.access_log import access_log
+from redbot.webui.admission import admission
 from redbot.webui.captcha import CaptchaHandler
+from redbot.webui.metrics import (
+    fetchers,
+    record_test_done,
+    resource_usage,
+    tests_started,
+    tests_timed_out,
+)
+from redbot.webui.profiler import profiler, tracer
 from redbot.webui.ratelimit import ratelimiter
 from redbot.webui.saved_tests import (
     init_save_file,
@@ -29,6 +39,7 @@ from redbot.webui.saved_tests import (
 )
 from redbot.webui.slack import slack_run, slack_auth
 from redbot.resource import HttpResource
+from redbot.resource.fetch import DeadlineError, url_to_origin
 from redbot.formatter import find_formatter, html, Formatter
 from redbot.formatter.html_base import e_url
 from redbot.type import (
@@ -39,6 +50,17 @@ from redbot.type import (
 
 CSP = "script-src"
 
+# Seconds to wait after a test's deadline for its results before giving up on it.
+TIMEOUT_GRACE = 5
+
+
+def hit_deadline(top_resource: HttpResource) -> bool:
+    "Return whether any of a test's fetches were cut short by its deadline."
+    return any(
+        isinstance(fetcher.response.http_error, DeadlineError)
+        for fetcher in fetchers(top_resource)
+    )
+
 
 class RedWebUi:
     """
@@ -78,12 +100,19 @@ class RedWebUi:
         ]
         self.format = self.query_string.get("format", ["html"])[0]
         self.descend = "descend" in self.query_string
+        self.compact = "compact" in self.query_string
         self.check_name: str = None
         if not self.descend:
             self.check_name = self.query_string.get("check_name", [None])[0]
 
         self.save_path: str = None
         self.timeout: Any = None
+        self.test_labels: Dict[str, Any] = {}  # for metrics
+        self.profile_reason: str = None  # why the test is being profiled, if it is
+        self.admitted_cost = 0  # to release when the test is done
+        self.limited: str = None  # the limit that turned the test away, if any
+        self.top_resource: HttpResource = None  # the test, until it's logged
+        self.checking = False  # whether the test is running
 
         self.nonce: str = standard_b64encode(getrandbits(64).to_bytes(8, "big")).decode(
             "ascii"
@@ -131,6 +160,9 @@ class RedWebUi:
         self.test_id = init_save_file(self)
         top_resource = HttpResource(self.config, descend=self.descend)
         top_resource.set_request(self.test_uri, req_hdrs=self.req_hdrs)
+        self.top_resource = top_resource
+        if not access_log.running:
+            access_log.setup(self.config)
         formatter = find_formatter(self.format, "html", self.descend)(
             self.config,
             top_resource,
@@ -139,16 +171,14 @@ class RedWebUi:
             is_saved=False,
             test_id=self.test_id,
             descend=self.descend,
+            compact=self.compact,
             nonce=self.nonce,
         )
-        continue_test = partial(self.continue_test, top_resource, formatter)
+        self.test_labels = {"format": formatter.name, "descend": self.descend}
+        admit_test = partial(self.admit_test, top_resource, formatter)
         error_response = partial(self.error_response, formatter)
 
-        self.timeout = thor.schedule(
-            int(self.config["max_runtime"]),
-            self.timeout_error,
-            top_resource.show_task_map,
-        )
+        self.start_timeout(top_resource, self.timeout_error, top_resource.show_task_map)
 
         # referer limiting
         referers = []
@@ -185,13 +215,47 @@ class RedWebUi:
         captcha = CaptchaHandler(
             self,
             self.get_client_id(),
-            continue_test,
+            admit_test,
             error_response,
         )
         if captcha.configured():
             captcha.run()
         else:
-            continue_test()
+            admit_test()
+
+    def admit_test(
+        self,
+        top_resource: HttpResource,
+        formatter: Formatter,
+        extra_headers: RawHeaderListType = None,
+    ) -> None:
+        "Run the test once there's capacity for it, or turn it away if there isn't."
+        if not admission.running:
+            admission.setup(self.config)
+        cost = admission.cost(self.descend)
+
+        def run() -> None:
+            self.admitted_cost = cost
+            self.continue_test(top_resource, formatter, extra_headers)
+
+        def reject() -> None:
+            self.limited = "admission"
+            self.error_response(
+                formatter,
+                b"503",
+                b"Service Unavailable",
+                "REDbot is busy right now. Please try again shortly.",
+                "over capacity",
+                [(b"Retry-After", str(admission.retry_after).encode("ascii"))],
+            )
+
+        admission.admit(cost, run, reject)
+
+    def release_admission(self) -> None:
+        "Give back the test's share of admission capacity, once."
+        if self.admitted_cost:
+            admission.release(self.admitted_cost)
+            self.admitted_cost = 0
 
     def continue_test(
         self,
@@ -206,29 +270,19 @@ class RedWebUi:
 
         @thor.events.on(formatter)
         def formatter_done() -> None:
+            if not self.checking:
+                return  # it timed out
             if self.timeout:
                 self.timeout.delete()
                 self.timeout = None
+            self.release_admission()
             self.exchange.response_done([])
             save_test(self, top_resource)
-
-            # log excessive traffic
-            ti = sum(
-                [i.transfer_in for i, t in top_resource.linked],
-                top_resource.transfer_in,
-            )
-            to = sum(
-                [i.transfer_out for i, t in top_resource.linked],
-                top_resource.transfer_out,
-            )
-            if ti + to > int(self.config["log_traffic"]) * 1024:
-                self.error_log(
-                    f"{self.get_client_id()} "
-                    f"{ti / 1024:n}K in "
-                    f"{to / 1024:n}K out "
-                    f"for <{e_url(self.test_uri)}> "
-                    f"(descend {self.descend})"
-                )
+            timed_out = hit_deadline(top_resource)
+            if timed_out:
+                tests_timed_out.inc(**self.test_labels)
+            self.finish_test(top_resource, formatter.render_time)
+            self.log_test(b"200", timed_out)
 
         self.exchange.response_start(
             b"200",
@@ -250,8 +304,34 @@ class RedWebUi:
         else:
             display_resource = top_resource
         formatter.bind_resource(display_resource)
+        tests_started.inc(**self.test_labels)
+        self.checking = True
+        self.profile_reason = profiler.start(top_resource)
+        tracer.start(top_resource)
         top_resource.check()
 
+    def finish_test(
+        self, top_resource: HttpResource, render_time: Optional[float]
+    ) -> None:
+        "Account for a test that has been checked, whether it finished or timed out."
+        self.checking = False
+        record_test_done(top_resource, self.test_labels, render_time)
+        profiler.finish(top_resource, self.test_id, self.profile_reason)
+        tracer.finish(top_resource, self.test_id)
+
+        transferred, cpu_time = resource_usage(top_resource)
+        ratelimiter.record_usage(self, transferred, cpu_time)
+
+        # log excessive traffic
+        if transferred > int(self.config["log_traffic"]) * 1024:
+            self.error_log(
+                f"{self.get_client_id()} "
+                f"{transferred / 1024:n}K transferred "
+                f"{cpu_time:.2f}s CPU "
+                f"for <{e_url(self.test_uri)}> "
+                f"(descend {self.descend})"
+            )
+
     def dump_client_error(self) -> None:
         """Dump a client error."""
         body = self.req_body.decode("ascii", "replace")[:255].replace("\n", "")
@@ -306,6 +386,7 @@ class RedWebUi:
         status_phrase: bytes,
         message: str,
         log_message: str = None,
+        extra_headers: RawHeaderListType = None,
     ) -> None:
         """Send an error response."""
         if self.timeout:
@@ -321,19 +402,34 @@ class RedWebUi:
                     b"Content-Security-Policy",
                     f"{CSP} 'strict-dynamic' 'nonce-{self.nonce}'".encode("ascii"),
                 ),
-            ],
+            ]
+            + (extra_headers or []),
         )
         formatter.start_output()
         formatter.error_output(message)
         self.exchange.response_done([])
         if log_message:
             self.error_log(f"{self.get_client_id()} {log_message}")
+        self.log_test(status_code)
 
     def output(self, chunk: str) -> None:
         self.exchange.response_body(chunk.encode(self.charset, "replace"))
 
+    def start_timeout(
+        self, top_resource: HttpResource, on_timeout: Callable[..., None], *args: Any
+    ) -> None:
+        """
+        Give the test max_runtime seconds. Fetches that haven't finished by then are cancelled,
+        so the results can still be shown; on_timeout is called if even they don't arrive.
+        """
+        max_runtime = int(self.config["max_runtime"])
+        top_resource.set_deadline(time.monotonic() + max_runtime)
+        self.timeout = thor.schedule(max_runtime + TIMEOUT_GRACE, on_timeout, *args)
+
     def timeout_error(self, detail: Callable[[], str] = None) -> None:
         """Max runtime reached."""
+        tests_timed_out.inc(**self.test_labels)
+        self.release_admission()
         details = ""
         if detail:
             details = f"detail={detail()}"
@@ -342,6 +438,37 @@ class RedWebUi:
         )
         self.output("<p class='error'>REDbot timeout.</p>")
         self.exchange.response_done([])
+        if self.checking:
+            self.finish_test(self.top_resource, None)
+        self.log_test(b"200", timed_out=True)
+
+    def log_test(self, status_code: bytes, timed_out: bool = False) -> None:
+        "Write the test to the access log, once it's finished or been turned away."
+        top_resource = self.top_resource
+        if top_resource is None or not access_log.path:
+            return
+        self.top_resource = None
+        transferred, cpu_time = resource_usage(top_resource)
+        access_log.record(
+            {
+                "time": round(self.start, 3),
+                "client": self.get_client_id(),
+                "origin": url_to_origin(self.test_uri),
+                "format": self.format,
+                "descend": self.descend,
+                "status": int(status_code),
+                "duration": round(time.time() - self.start, 3),
+                "subrequests": sum(
+                    1
+                    for fetcher in fetchers(top_resource)
+                    if fetcher.fetch_started and fetcher is not top_resource
+                ),
+                "bytes": transferred,
+                "cpu": round(cpu_time, 4),
+                "limited": self.limited,
+                "timed_out": timed_out,
+            }
+        )
 
     def get_client_id(self) -> str:
         """
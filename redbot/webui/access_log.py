@@ -0,0 +1,111 @@
+"""
+Access Log for RED, the Resource Expert Droid.
+
+When access_log is set to a file name, a JSON object describing each test is written to it, one
+per line (see RedWebUi.log_test() for what's in them).
+
+So that logging doesn't hold tests up, records are buffered in memory and written out
+access_log_flush seconds after the first one in the buffer, or as soon as there are
+access_log_buffer of them. When the file would grow past access_log_max_kbytes, it's rotated to
+file.1 (and file.1 to file.2, and so on, keeping access_log_backups of them).
+"""
+
+import atexit
+from configparser import SectionProxy
+import json
+import os
+import sys
+from typing import Any, Dict, IO, List
+
+import thor.loop
+
+
+class AccessLog:
+    "A buffered, rotated JSON-lines log."
+
+    def __init__(self) -> None:
+        self.path = ""
+        self.flush_interval = 1.0
+        self.max_buffer = 1000
+        self.max_bytes = 0
+        self.backups = 5
+        self.buffer: List[str] = []
+        self.flush_event: thor.loop.ScheduledEvent = None
+        self.file: IO[str] = None
+        self.loop = thor.loop
+        self.running = False
+
+    def setup(self, config: SectionProxy) -> None:
+        "Set up logging from config."
+        self.path = config.get("access_log", "")
+        self.flush_interval = config.getfloat("access_log_flush", fallback=1)
+        self.max_buffer = config.getint("access_log_buffer", fallback=1000)
+        self.max_bytes = config.getint("access_log_max_kbytes", fallback=0) * 1024
+        self.backups = config.getint("access_log_backups", fallback=5)
+        if not self.running:
+            self.running = True
+            atexit.register(self.flush)
+
+    def record(self, entry: Dict[str, Any]) -> None:
+        "Log entry (if there's a log)."
+        if not self.path:
+            return
+        self.buffer.append(json.dumps(entry, separators=(",", ":")) + "\n")
+        if len(self.buffer) >= self.max_buffer:
+            self.flush()
+        elif self.flush_event is None:
+            self.flush_event = self.loop.schedule(self.flush_interval, self.flush)
+
+    def flush(self) -> None:
+        "Write out buffered records."
+        if self.flush_event is not None:
+            self.flush_event.delete()
+            self.flush_event = None
+        if not self.buffer:
+            return
+        data = "".join(self.buffer)
+        self.buffer = []
+        try:
+            size = self._size()
+            if self.max_bytes and size and size + len(data) > self.max_bytes:
+                self.rotate()
+            if self.file is None:
+                self.file = open(  # pylint: disable=consider-using-with
+                    self.path, "a", encoding="utf-8"
+                )
+            self.file.write(data)
+            self.file.flush()
+        except OSError as why:
+            sys.stderr.write(f"WARNING: can't write access log {self.path}: {why}\n")
+            self._close()
+
+    def rotate(self) -> None:
+        "Move the log to path.1, path.1 to path.2 and so on, dropping the oldest."
+        self._close()
+        if self.backups < 1:
+            os.remove(self.path)
+            return
+        for number in range(self.backups - 1, 0, -1):
+            older = f"{self.path}.{number}"
+            if os.path.exists(older):
+                os.replace(older, f"{self.path}.{number + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+    def _size(self) -> int:
+        if self.file is not None:
+            return self.file.tell()
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    def _close(self) -> None:
+        if self.file is not None:
+            try:
+                self.file.close()
+            except OSError:
+                pass
+            self.file = None
+
+
+access_log = AccessLog()
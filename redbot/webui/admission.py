@@ -0,0 +1,121 @@
+"""
+Admission Control for RED, the Resource Expert Droid.
+"""
+
+from collections import deque
+from configparser import SectionProxy
+import time
+from typing import Callable, Deque
+
+import thor.loop
+
+from redbot.webui.metrics import (
+    admission_in_flight,
+    admission_queued,
+    admission_rejections,
+    admission_wait,
+)
+
+
+# pylint: disable=too-few-public-methods
+class QueuedTest:
+    "A test waiting to be admitted. Just a record; AdmissionController acts on it."
+
+    def __init__(
+        self, cost: int, run: Callable[[], None], reject: Callable[[], None]
+    ) -> None:
+        self.cost = cost
+        self.run = run
+        self.reject = reject
+        self.queued_at = time.monotonic()
+        self.expiry: thor.loop.ScheduledEvent = None
+
+
+class AdmissionController:
+    """
+    Limit how much testing is in flight at once, so that a spike in traffic slows down or turns
+    away some tests, rather than timing out all of them.
+
+    Each test costs one unit, or descend_cost units if it descends. When running a test would
+    take the cost in flight over max_cost, it waits in a queue of up to queue_size tests for up to
+    queue_timeout seconds. If the queue is full or the wait is too long, the test is rejected.
+    A test is always admitted if nothing else is in flight, whatever its cost.
+    """
+
+    def __init__(self) -> None:
+        self.max_cost = 0  # 0 disables
+        self.descend_cost = 10
+        self.queue_size = 0
+        self.queue_timeout = 5.0
+        self.retry_after = 30
+        self.in_flight = 0
+        self.queue: Deque[QueuedTest] = deque()
+        self.loop = thor.loop
+        self.running = False
+
+    def setup(self, config: SectionProxy) -> None:
+        """Set the limits from config."""
+        self.max_cost = config.getint("max_inflight_cost", fallback=0)
+        self.descend_cost = config.getint("descend_cost", fallback=10)
+        self.queue_size = config.getint("admission_queue_size", fallback=0)
+        self.queue_timeout = config.getfloat("admission_queue_timeout", fallback=5)
+        self.retry_after = config.getint("admission_retry_after", fallback=30)
+        self.running = True
+
+    def cost(self, descend: bool) -> int:
+        "Return the cost of a test."
+        return self.descend_cost if descend else 1
+
+    def admit(
+        self, cost: int, run: Callable[[], None], reject: Callable[[], None]
+    ) -> None:
+        """
+        Call run when a test costing cost can be admitted, or reject if it can't be. If run is
+        called, release(cost) must be called when the test is finished.
+        """
+        if not self.queue and self.fits(cost):
+            self._start(cost, run)
+        elif len(self.queue) < self.queue_size:
+            queued = QueuedTest(cost, run, reject)
+            queued.expiry = self.loop.schedule(self.queue_timeout, self._expire, queued)
+            self.queue.append(queued)
+            admission_queued.set(len(self.queue))
+        else:
+            admission_rejections.inc(reason="queue_full")
+            reject()
+
+    def release(self, cost: int) -> None:
+        "A test costing cost has finished; admit whatever is waiting for it."
+        self.in_flight -= cost
+        admission_in_flight.set(self.in_flight)
+        while self.queue and self.fits(self.queue[0].cost):
+            queued = self.queue.popleft()
+            queued.expiry.delete()
+            admission_queued.set(len(self.queue))
+            admission_wait.observe(time.monotonic() - queued.queued_at)
+            self._start(queued.cost, queued.run)
+
+    def fits(self, cost: int) -> bool:
+        "Return whether a test costing cost can start now."
+        return (
+            not self.max_cost
+            or not self.in_flight
+            or self.in_flight + cost <= self.max_cost
+        )
+
+    def _start(self, cost: int, run: Callable[[], None]) -> None:
+        self.in_flight += cost
+        admission_in_flight.set(self.in_flight)
+        run()
+
+    def _expire(self, queued: QueuedTest) -> None:
+        try:
+            self.queue.remove(queued)
+        except ValueError:
+            return
+        admission_queued.set(len(self.queue))
+        admission_rejections.inc(reason="queue_timeout")
+        queued.reject()
+
+
+admission = AdmissionController()
@@ -0,0 +1,344 @@
+"""
+WSGI and ASGI adapters for RED, the Resource Expert Droid.
+
+These let REDbot's Web UI run in a long-lived app server process, rather than as a CGI script
+that starts a new interpreter (and throws away its connections and caches) for every request.
+For example:
+
+    gunicorn --threads 16 'redbot.webui.gateway:wsgi_app()'
+    uvicorn --factory redbot.webui.gateway:asgi_app
+
+REDbot itself runs on thor, so the adapters start thor's loop in a thread of its own, and hand each
+request to it. Responses come back through a QueueExchange. Since thor's loop is shared by the
+whole process, it can't be running anywhere else (e.g., in redbot_daemon) at the same time.
+
+Static assets (see static_root) aren't served; have the server (or a proxy in front of it) do that.
+"""
+
+import asyncio
+from configparser import ConfigParser, SectionProxy
+import locale
+import os
+import queue
+import socket
+import sys
+import threading
+import traceback
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+import thor
+import thor.loop
+
+from redbot.type import RawHeaderListType
+from redbot.webui import RedWebUi
+from redbot.webui.profiler import lag_sampler, profiler, tracer
+from redbot.formatter.html_base import extra_content  # after webui; see its imports
+
+Event = Tuple[Any, ...]
+
+
+class LoopThread:
+    """
+    Run thor's loop in a thread, and run functions on it from other threads.
+
+    Calls are put on a queue, and a byte is written to a socket that the loop is watching, so
+    that it wakes up and runs them.
+    """
+
+    def __init__(self) -> None:
+        self.thread: threading.Thread = None
+        self.calls: "queue.SimpleQueue[Tuple[Callable[..., None], Tuple]]" = (
+            queue.SimpleQueue()
+        )
+        self.waker: thor.loop.EventSource = None
+        self.reader: socket.socket = None
+        self.writer: socket.socket = None
+        self.lock = threading.Lock()
+
+    def start(self) -> None:
+        "Start the loop, if it isn't running already."
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.reader, self.writer = socket.socketpair()
+            self.reader.setblocking(False)
+            self.waker = thor.loop.EventSource()
+            self.waker.on("fd_readable", self._run_calls)
+            self.waker.register_fd(self.reader.fileno(), "fd_readable")
+            self.thread = threading.Thread(target=thor.run, name="thor", daemon=True)
+            self.thread.start()
+
+    def stop(self) -> None:
+        "Stop the loop, and wait for its thread to finish."
+        with self.lock:
+            if self.thread is None:
+                return
+            self.call(thor.stop)
+            self.thread.join()
+            self.thread = None
+            self.reader.close()
+            self.writer.close()
+
+    def call(self, func: Callable[..., None], *args: Any) -> None:
+        "Run func(*args) on the loop's thread."
+        self.calls.put((func, args))
+        try:
+            self.writer.send(b"\0")
+        except BlockingIOError:
+            pass  # the loop has plenty of wake-ups waiting already
+
+    def _run_calls(self) -> None:
+        try:
+            while self.reader.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        while True:
+            try:
+                func, args = self.calls.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                func(*args)
+            except Exception:  # pylint: disable=broad-except
+                error_log(f"*** Error running {func}:\n{traceback.format_exc()}")
+
+
+class QueueExchange:
+    """
+    An HttpResponseExchange that passes the response on, as ("start", status_code,
+    status_phrase, headers), ("body", chunk) and ("done",) events, to put.
+    """
+
+    def __init__(self, put: Callable[[Event], Any]) -> None:
+        self.put = put
+        self.started = False
+        self.done = False
+
+    def response_start(
+        self, status_code: bytes, status_phrase: bytes, res_hdrs: RawHeaderListType
+    ) -> None:
+        self.started = True
+        self.put(("start", status_code, status_phrase, res_hdrs))
+
+    def response_body(self, chunk: bytes) -> None:
+        if chunk:
+            self.put(("body", chunk))
+
+    def response_done(self, trailers: RawHeaderListType) -> None:
+        if not self.done:
+            self.done = True
+            self.put(("done",))
+
+    def error(self) -> None:
+        "Finish the response with an error, if it isn't finished already."
+        if not self.started:
+            self.response_start(
+                b"500",
+                b"Internal Server Error",
+                [(b"Content-Type", b"text/plain")],
+            )
+            self.response_body(b"REDbot has encountered an error.")
+        self.response_done([])
+
+
+def error_log(message: str) -> None:
+    sys.stderr.write(f"{message}\n")
+
+
+class RedApp:
+    "Common parts of the WSGI and ASGI adapters."
+
+    def __init__(self, config: SectionProxy, loop: LoopThread = None) -> None:
+        self.config = config
+        self.loop = loop or LoopThread()
+        extra_content.load(config.get("extra_dir", ""))
+        profiler.setup(config)
+        tracer.setup(config)
+        self.loop.start()
+        self.loop.call(lag_sampler.setup, config)
+
+    def handle(
+        self,
+        method: str,
+        query_string: bytes,
+        req_hdrs: RawHeaderListType,
+        req_body: bytes,
+        *,
+        client_ip: Optional[str],
+        put: Callable[[Event], Any],
+    ) -> None:
+        "Start handling a request; the response will be passed to put (see QueueExchange)."
+        if client_ip:
+            req_hdrs.append((b"client-ip", client_ip.encode("idna")))
+        self.loop.call(
+            self.run_webui, method, query_string, req_hdrs, req_body, QueueExchange(put)
+        )
+
+    def run_webui(
+        self,
+        method: str,
+        query_string: bytes,
+        req_hdrs: RawHeaderListType,
+        req_body: bytes,
+        exchange: QueueExchange,
+    ) -> None:
+        "Handle a request with RedWebUi; must be called on thor's loop."
+        try:
+            RedWebUi(
+                self.config,
+                method,
+                query_string,
+                req_hdrs,
+                req_body,
+                exchange,
+                error_log,
+            )
+        except Exception:  # pylint: disable=broad-except
+            error_log(f"*** Error handling request:\n{traceback.format_exc()}")
+            exchange.error()
+
+
+class WsgiApp(RedApp):
+    """
+    A WSGI application. Each request blocks its server thread until REDbot has finished with
+    it, so use a threaded server.
+    """
+
+    def __call__(
+        self, environ: Dict[str, Any], start_response: Callable[..., Any]
+    ) -> Iterable[bytes]:
+        req_hdrs: RawHeaderListType = []
+        for key, value in environ.items():
+            if key.startswith("HTTP_"):
+                name = key[5:]
+            elif key in ["CONTENT_TYPE", "CONTENT_LENGTH"]:
+                name = key
+            else:
+                continue
+            if value:
+                req_hdrs.append(
+                    (
+                        name.replace("_", "-").lower().encode("ascii"),
+                        value.encode("latin-1"),
+                    )
+                )
+        try:
+            length = int(environ.get("CONTENT_LENGTH") or 0)
+        except ValueError:
+            length = 0
+        req_body = environ["wsgi.input"].read(length) if length > 0 else b""
+        events: "queue.SimpleQueue[Event]" = queue.SimpleQueue()
+        self.handle(
+            environ.get("REQUEST_METHOD", "GET"),
+            environ.get("QUERY_STRING", "").encode("latin-1"),  # see PEP 3333
+            req_hdrs,
+            req_body,
+            client_ip=environ.get("REMOTE_ADDR"),
+            put=events.put,
+        )
+        event = events.get()
+        while event[0] != "start":
+            event = events.get()
+        _, status_code, status_phrase, res_hdrs = event
+        start_response(
+            f"{status_code.decode('ascii')} {status_phrase.decode('latin-1')}",
+            [
+                (name.decode("ascii"), value.decode("latin-1"))
+                for name, value in res_hdrs
+            ],
+        )
+        return self.body(events)
+
+    @staticmethod
+    def body(events: "queue.SimpleQueue[Event]") -> Iterable[bytes]:
+        "Yield the response body as it arrives."
+        while True:
+            event = events.get()
+            if event[0] == "done":
+                return
+            yield event[1]
+
+
+class AsgiApp(RedApp):
+    "An ASGI application."
+
+    async def __call__(
+        self,
+        scope: Dict[str, Any],
+        receive: Callable[[], Awaitable[Dict[str, Any]]],
+        send: Callable[[Dict[str, Any]], Awaitable[None]],
+    ) -> None:
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await asyncio.get_running_loop().run_in_executor(
+                        None, self.loop.stop
+                    )
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        if scope["type"] != "http":
+            return
+
+        body_parts: List[bytes] = []
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            body_parts.append(message.get("body", b""))
+            more_body = message.get("more_body", False)
+
+        events: "asyncio.Queue[Event]" = asyncio.Queue()
+        aio_loop = asyncio.get_running_loop()
+        client = scope.get("client")
+        self.handle(
+            scope["method"],
+            scope.get("query_string", b""),
+            [(bytes(name), bytes(value)) for name, value in scope.get("headers", [])],
+            b"".join(body_parts),
+            client_ip=client[0] if client else None,
+            put=lambda event: aio_loop.call_soon_threadsafe(events.put_nowait, event),
+        )
+        while True:
+            event = await events.get()
+            if event[0] == "start":
+                await send(
+                    {
+                        "type": "http.response.start",
+                        "status": int(event[1]),
+                        "headers": event[3],
+                    }
+                )
+            elif event[0] == "body":
+                await send(
+                    {"type": "http.response.body", "body": event[1], "more_body": True}
+                )
+            else:
+                await send({"type": "http.response.body", "body": b""})
+                return
+
+
+def load_config() -> SectionProxy:
+    "Read the configuration from REDBOT_CONFIG (or config.txt), and set the locale from it."
+    conf = ConfigParser()
+    conf.read(os.environ.get("REDBOT_CONFIG", "config.txt"))
+    config = conf["redbot"]
+    try:
+        locale.setlocale(locale.LC_ALL, locale.normalize(config["lang"]))
+    except ValueError:
+        locale.setlocale(locale.LC_ALL, "")
+    return config
+
+
+def wsgi_app() -> WsgiApp:
+    "Return a WSGI application configured from load_config()."
+    return WsgiApp(load_config())
+
+
+def asgi_app() -> AsgiApp:
+    "Return an ASGI application configured from load_config()."
+    return AsgiApp(load_config())
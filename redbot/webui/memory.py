@@ -0,0 +1,120 @@
+"""
+Memory diagnostics for RED, the Resource Expert Droid.
+
+When memory_diagnostics is set, allocations are traced with tracemalloc, and report() describes
+where memory is going: the process' RSS, the top allocation sites, how they've changed since the
+last report, and how many of REDbot's own objects are alive. redbot_daemon serves the report at
+/memory.
+"""
+
+from collections import Counter
+from configparser import SectionProxy
+import gc
+import os
+import resource
+import sys
+import tracemalloc
+from typing import Dict, List, Optional
+
+from redbot.formatter import Formatter
+from redbot.message import HttpMessage
+from redbot.resource import HttpResource
+from redbot.resource.fetch import RedFetcher
+
+# classes whose live instances are counted, by the name to report them under
+LIVE_TYPES = {
+    "HttpResource": HttpResource,
+    "RedFetcher": RedFetcher,
+    "HttpMessage": HttpMessage,
+    "Formatter": Formatter,
+}
+
+TRACE_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib.*>"),
+    tracemalloc.Filter(False, "<unknown>"),
+]
+
+
+def rss() -> Optional[int]:
+    "Return the resident set size of this process, in bytes, if it can be found."
+    try:
+        with open("/proc/self/statm", encoding="ascii") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    # no /proc; fall back to the peak, which is in bytes on macOS and kilobytes elsewhere
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def live_objects() -> Dict[str, int]:
+    "Count the live instances of LIVE_TYPES (including their subclasses)."
+    counts: Dict[str, int] = Counter()
+    for obj in gc.get_objects():
+        for name, cls in LIVE_TYPES.items():
+            if isinstance(obj, cls):
+                counts[name] += 1
+    return {name: counts[name] for name in LIVE_TYPES}
+
+
+class MemoryDiagnostics:
+    """
+    Trace memory allocations, and report on them.
+
+    Tracing slows allocation down and uses memory itself (more so with more frames), so it's
+    only done when configured.
+    """
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.frames = 1
+        self.last_snapshot: tracemalloc.Snapshot = None
+
+    def setup(self, config: SectionProxy) -> None:
+        "Start tracing allocations if config says so."
+        self.enabled = config.getboolean("memory_diagnostics", fallback=False)
+        self.frames = config.getint("memory_trace_frames", fallback=1)
+        if self.enabled and not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+
+    def report(self, limit: int = 20) -> str:
+        """
+        Return a plain-text report on memory use, with the top limit allocation sites. The
+        changes shown are since the previous report.
+        """
+        lines: List[str] = []
+        size = rss()
+        if size is not None:
+            lines.append(f"rss: {size / 1024 / 1024:.1f} MB")
+        lines.append("")
+        lines.append("live objects:")
+        for name, count in live_objects().items():
+            lines.append(f"  {name}: {count}")
+        if not tracemalloc.is_tracing():
+            lines.append("")
+            lines.append("tracemalloc isn't tracing.")
+            return "\n".join(lines) + "\n"
+        current, peak = tracemalloc.get_traced_memory()
+        lines.append("")
+        lines.append(
+            f"traced: {current / 1024 / 1024:.1f} MB (peak {peak / 1024 / 1024:.1f} MB)"
+        )
+        group_by = "traceback" if self.frames > 1 else "lineno"
+        snapshot = tracemalloc.take_snapshot().filter_traces(TRACE_FILTERS)
+        lines.append("")
+        lines.append("top allocation sites:")
+        for stat in snapshot.statistics(group_by)[:limit]:
+            lines.append(f"  {stat}")
+            if group_by == "traceback":
+                lines.extend(f"    {line}" for line in stat.traceback.format())
+        if self.last_snapshot is not None:
+            lines.append("")
+            lines.append("changes since the last report:")
+            for diff in snapshot.compare_to(self.last_snapshot, group_by)[:limit]:
+                lines.append(f"  {diff}")
+        self.last_snapshot = snapshot
+        return "\n".join(lines) + "\n"
+
+
+memory = MemoryDiagnostics()
@@ -0,0 +1,425 @@
+"""
+Operational metrics for RED, the Resource Expert Droid.
+
+Counters, gauges and histograms are kept in a registry, and can be exposed in the Prometheus text
+format (see redbot_daemon's /metrics, which is only served if enable_metrics is set).
+"""
+
+from abc import ABCMeta, abstractmethod
+from bisect import bisect_left
+from configparser import SectionProxy
+import os
+import time
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    TYPE_CHECKING,
+)
+
+from redbot.resource.dns import dns_cache
+from redbot.resource.fetch import circuit_breaker, outbound_scheduler
+
+if TYPE_CHECKING:
+    from redbot.resource import HttpResource  # pylint: disable=cyclic-import
+    from redbot.resource.fetch import RedFetcher  # pylint: disable=cyclic-import
+
+LabelValues = Tuple[str, ...]
+
+# seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+LAG_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return f"{{{pairs}}}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric(metaclass=ABCMeta):
+    """
+    A named metric, with zero or more labels.
+    """
+
+    metric_type: str = None
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+
+    def label_values(self, labels: Dict[str, Any]) -> LabelValues:
+        if set(labels) != set(self.labels):
+            raise KeyError(f"{self.name} needs labels {self.labels}, not {labels}")
+        return tuple(
+            str(value).lower() if isinstance(value, bool) else str(value)
+            for value in (labels[name] for name in self.labels)
+        )
+
+    @abstractmethod
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        "Yield (name, labels, value) for each sample."
+
+    def render(self) -> List[str]:
+        out = [
+            f"# HELP {self.name} {self.help_text}",
+            f"# TYPE {self.name} {self.metric_type}",
+        ]
+        for name, labels, value in self.samples():
+            out.append(f"{name}{labels} {_format_value(value)}")
+        return out
+
+
+class Counter(Metric):
+    """
+    A value that only goes up. If func is set, it's called to get the values (keyed by label
+    values) when the metric is rendered; this is for things that keep their own counts.
+    """
+
+    metric_type = "counter"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labels: Sequence[str] = (),
+        func: Callable[[], Dict[LabelValues, float]] = None,
+    ) -> None:
+        Metric.__init__(self, name, help_text, labels)
+        self.values: Dict[LabelValues, float] = {}
+        self.func = func
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = self.label_values(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels: Any) -> float:
+        values = self.func() if self.func is not None else self.values
+        return values.get(self.label_values(labels), 0)
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        values = self.func() if self.func is not None else self.values
+        for key, value in sorted(values.items()):
+            yield self.name, _format_labels(self.labels, key), value
+
+
+class Gauge(Metric):
+    """
+    A value that can go up and down. If func is set, it's called to get the value when the
+    metric is rendered.
+    """
+
+    metric_type = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labels: Sequence[str] = (),
+        func: Callable[[], float] = None,
+    ) -> None:
+        Metric.__init__(self, name, help_text, labels)
+        self.values: Dict[LabelValues, float] = {}
+        self.func = func
+
+    def set(self, value: float, **labels: Any) -> None:
+        self.values[self.label_values(labels)] = value
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = self.label_values(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels: Any) -> float:
+        return self.values.get(self.label_values(labels), 0)
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        if self.func is not None:
+            yield self.name, "", self.func()
+            return
+        for key, value in sorted(self.values.items()):
+            yield self.name, _format_labels(self.labels, key), value
+
+
+class Histogram(Metric):
+    "Counts of observations in buckets, with their sum."
+
+    metric_type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> None:
+        Metric.__init__(self, name, help_text, labels)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self.counts: Dict[LabelValues, List[int]] = {}
+        self.sums: Dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self.label_values(labels)
+        if key not in self.counts:
+            self.counts[key] = [0] * len(self.buckets)
+            self.sums[key] = 0.0
+        self.counts[key][bisect_left(self.buckets, value)] += 1
+        self.sums[key] += value
+
+    def count(self, **labels: Any) -> int:
+        return sum(self.counts.get(self.label_values(labels), []))
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        for key, counts in sorted(self.counts.items()):
+            cumulative = 0
+            for bucket, count in zip(self.buckets, counts):
+                cumulative += count
+                yield (
+                    f"{self.name}_bucket",
+                    _format_labels(
+                        self.labels + ("le",), key + (_format_value(bucket),)
+                    ),
+                    cumulative,
+                )
+            labels = _format_labels(self.labels, key)
+            yield f"{self.name}_sum", labels, self.sums[key]
+            yield f"{self.name}_count", labels, cumulative
+
+
+class MetricsRegistry:
+    """
+    A collection of metrics.
+
+    Metrics are always recorded (it's cheap); setup() decides whether they're exposed.
+    """
+
+    def __init__(self) -> None:
+        self.metrics: Dict[str, Metric] = {}
+        self.enabled = False
+        self.running = False
+
+    def counter(
+        self,
+        name: str,
+        help_text: str,
+        labels: Sequence[str] = (),
+        func: Callable[[], Dict[LabelValues, float]] = None,
+    ) -> Counter:
+        return self.register(Counter(name, help_text, labels, func))  # type: ignore
+
+    def gauge(
+        self,
+        name: str,
+        help_text: str,
+        labels: Sequence[str] = (),
+        func: Callable[[], float] = None,
+    ) -> Gauge:
+        return self.register(Gauge(name, help_text, labels, func))  # type: ignore
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, help_text, labels, buckets))  # type: ignore
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self.metrics:
+            raise KeyError(f"{metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def setup(self, config: SectionProxy) -> None:
+        "Expose metrics if config says so."
+        self.enabled = config.getboolean("enable_metrics", fallback=False)
+        if not self.enabled or self.running:
+            return
+        self.running = True
+        save_dir = config.get("save_dir", "")
+        if save_dir:
+            stats = SavedTestStats(save_dir)
+            saved_tests.func = lambda: stats.get()[0]
+            saved_test_bytes.func = lambda: stats.get()[1]
+
+    def render(self) -> str:
+        "Return the metrics in the Prometheus text exposition format."
+        out: List[str] = []
+        for metric in self.metrics.values():
+            out.extend(metric.render())
+        return "\n".join(out) + "\n"
+
+
+def saved_test_stats(save_dir: str) -> Tuple[int, int]:
+    "Return the number of saved tests in save_dir, and how many bytes they use."
+    count = size = 0
+    try:
+        with os.scandir(save_dir) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    count += 1
+                    size += entry.stat().st_size
+    except OSError:
+        pass
+    return count, size
+
+
+class SavedTestStats:
+    """
+    saved_test_stats() for save_dir, cached for max_age seconds; scanning a big save_dir
+    blocks the event loop, so it's only done once for each scrape (or fewer).
+    """
+
+    max_age = 10.0
+
+    def __init__(self, save_dir: str) -> None:
+        self.save_dir = save_dir
+        self.stats = (0, 0)
+        self.checked: float = None  # time.monotonic() value
+
+    def get(self) -> Tuple[int, int]:
+        now = time.monotonic()
+        if self.checked is None or now - self.checked >= self.max_age:
+            self.stats = saved_test_stats(self.save_dir)
+            self.checked = now
+        return self.stats
+
+
+def fetchers(resource: "HttpResource") -> Iterator["RedFetcher"]:
+    "Yield resource, its subrequests, and its linked resources (and theirs)."
+    yield resource
+    yield from getattr(resource, "subreqs", {}).values()
+    for linked, _ in getattr(resource, "linked", []):
+        yield from fetchers(linked)
+
+
+def resource_usage(top_resource: "HttpResource") -> Tuple[int, float]:
+    "Return the bytes transferred and the seconds of CPU time used by a test."
+    transferred = 0
+    cpu_time = 0.0
+    for fetcher in fetchers(top_resource):
+        transferred += fetcher.transfer_in + fetcher.transfer_out
+        cpu_time += fetcher.timings.cpu_time
+    return transferred, cpu_time
+
+
+def record_test_done(
+    top_resource: "HttpResource",
+    labels: Dict[str, Any],
+    render_time: Optional[float],
+) -> None:
+    "Record the metrics for a finished test."
+    tests_finished.inc(**labels)
+    for fetcher in fetchers(top_resource):
+        if not fetcher.fetch_started:
+            continue
+        outbound_requests.inc(check_name=fetcher.check_name)
+        bytes_in.inc(fetcher.transfer_in)
+        bytes_out.inc(fetcher.transfer_out)
+        if fetcher.response.complete:
+            fetch_latency.observe(
+                fetcher.response.complete_time - fetcher.request.start_time
+            )
+        analysis_latency.observe(fetcher.analysis_time)
+    if render_time is not None:
+        render_latency.observe(render_time)
+    test_cpu.observe(resource_usage(top_resource)[1])
+
+
+metrics = MetricsRegistry()
+
+tests_started = metrics.counter(
+    "redbot_tests_started_total", "Tests started.", ["format", "descend"]
+)
+tests_finished = metrics.counter(
+    "redbot_tests_finished_total", "Tests finished.", ["format", "descend"]
+)
+tests_timed_out = metrics.counter(
+    "redbot_tests_timed_out_total",
+    "Tests that didn't finish in time.",
+    ["format", "descend"],
+)
+outbound_requests = metrics.counter(
+    "redbot_outbound_requests_total", "Requests made by tests.", ["check_name"]
+)
+bytes_in = metrics.counter("redbot_bytes_in_total", "Bytes received by tests.")
+bytes_out = metrics.counter("redbot_bytes_out_total", "Bytes sent by tests.")
+ratelimit_rejections = metrics.counter(
+    "redbot_ratelimit_rejections_total", "Tests rejected by rate limits.", ["metric"]
+)
+admission_in_flight = metrics.gauge(
+    "redbot_admission_in_flight_cost", "Cost of the tests being run."
+)
+admission_queued = metrics.gauge(
+    "redbot_admission_queued", "Tests waiting to be admitted."
+)
+admission_rejections = metrics.counter(
+    "redbot_admission_rejections_total",
+    "Tests turned away because REDbot was busy.",
+    ["reason"],
+)
+admission_wait = metrics.histogram(
+    "redbot_admission_wait_seconds", "Time tests waited to be admitted."
+)
+saved_tests = metrics.gauge("redbot_saved_tests", "Tests in the saved test store.")
+saved_test_bytes = metrics.gauge(
+    "redbot_saved_test_bytes", "Size of the saved test store, in bytes."
+)
+fetch_latency = metrics.histogram(
+    "redbot_fetch_seconds", "Time from sending a request to the end of its response."
+)
+analysis_latency = metrics.histogram(
+    "redbot_analysis_seconds", "Time spent processing a response."
+)
+render_latency = metrics.histogram(
+    "redbot_render_seconds", "Time spent producing a test's results."
+)
+test_cpu = metrics.histogram(
+    "redbot_test_cpu_seconds", "CPU time used by each test.", buckets=LAG_BUCKETS
+)
+circuit_breaker_events = metrics.counter(
+    "redbot_circuit_breaker_events_total",
+    "What the outbound circuit breaker did (see redbot.resource.fetch.CircuitBreaker).",
+    ["event"],
+    func=lambda: {(event,): n for event, n in circuit_breaker.stats.items()},
+)
+outbound_queued = metrics.counter(
+    "redbot_outbound_queued_total",
+    "Fetches that had to wait for the outbound scheduler.",
+    func=lambda: {(): outbound_scheduler.stats["queued"]},
+)
+outbound_throttled = metrics.counter(
+    "redbot_outbound_throttled_total",
+    "Responses that made the outbound scheduler slow down for an origin.",
+    func=lambda: {(): outbound_scheduler.stats["throttled"]},
+)
+dns_cache_lookups = metrics.counter(
+    "redbot_dns_cache_lookups_total",
+    "Lookups in the DNS cache.",
+    ["result"],
+    func=lambda: {("hit",): dns_cache.hits, ("miss",): dns_cache.misses},
+)
+loop_lag = metrics.histogram(
+    "redbot_event_loop_lag_seconds",
+    "How late scheduled events run (see redbot.webui.profiler).",
+    buckets=LAG_BUCKETS,
+)
@@ -0,0 +1,186 @@
+"""
+Finding what stalls the event loop.
+
+LoopLagSampler measures how late the event loop runs a regularly scheduled event, and warns when
+that's too late.
+
+Profiler profiles the processing of a sample of tests (and optionally, every test, keeping
+those that use more CPU than they should), writing each profile to a dump directory as a pstats
+file, next to a JSON file describing the test.
+
+Tracer traces a sample of tests, writing each trace to a directory (see redbot.resource.trace).
+"""
+
+from configparser import SectionProxy
+import cProfile
+import json
+import os
+from pstats import Stats
+from random import getrandbits, random
+import sys
+import time
+from typing import Any, Dict, Optional
+
+import thor
+
+from redbot.resource import HttpResource
+from redbot.resource.trace import write_trace
+from redbot.webui.metrics import loop_lag
+
+
+class LoopLagSampler:
+    """
+    Sample how late the event loop runs events. Samples are recorded in the loop_lag metric; if
+    one is at least warn_lag seconds, a warning is written to stderr.
+    """
+
+    interval = 1.0  # seconds between samples
+
+    def __init__(self) -> None:
+        self.warn_lag = 0.0
+        self.running = False
+        self._expected: float = None
+
+    def setup(self, config: SectionProxy) -> None:
+        "Start sampling."
+        self.warn_lag = config.getfloat("loop_lag_warning", fallback=0)
+        if not self.running:
+            self.running = True
+            self._schedule()
+
+    def _schedule(self) -> None:
+        self._expected = time.monotonic() + self.interval
+        thor.schedule(self.interval, self._sample)
+
+    def _sample(self) -> None:
+        lag = max(0.0, time.monotonic() - self._expected)
+        loop_lag.observe(lag)
+        if self.warn_lag and lag >= self.warn_lag:
+            self.warn(f"event loop lag {lag:.2f}s")
+        self._schedule()
+
+    @staticmethod
+    def warn(message: str) -> None:
+        sys.stderr.write(f"WARNING: {message}\n")
+
+
+class Profiler:
+    """
+    Profile tests, when profile_dir is configured.
+
+    A profile_sample fraction of tests are profiled and dumped. If profile_cpu_budget is set,
+    every test is profiled, and dumped if processing it took more than that many seconds of CPU
+    time.
+
+    Only REDbot's processing of responses is profiled (see PhaseTimer), not the waiting for them.
+    """
+
+    def __init__(self) -> None:
+        self.dump_dir = ""
+        self.sample = 0.0
+        self.cpu_budget = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.dump_dir) and (self.sample > 0 or self.cpu_budget > 0)
+
+    def setup(self, config: SectionProxy) -> None:
+        "Read the profiling configuration."
+        self.dump_dir = config.get("profile_dir", "")
+        self.sample = config.getfloat("profile_sample", fallback=0)
+        self.cpu_budget = config.getfloat("profile_cpu_budget", fallback=0)
+
+    def start(self, resource: HttpResource) -> Optional[str]:
+        """
+        Start profiling resource, if it should be; call before its check(). Return why it's
+        being profiled, to pass to finish().
+        """
+        if not self.enabled:
+            return None
+        if random() < self.sample:
+            reason = "sample"
+        elif self.cpu_budget:
+            reason = "cpu_budget"
+        else:
+            return None
+        resource.timings.profile = cProfile.Profile(time.process_time)
+        return reason
+
+    def finish(
+        self, resource: HttpResource, test_id: str, reason: Optional[str]
+    ) -> Optional[str]:
+        """
+        Stop profiling resource, and dump its profile if need be. Return the path it was dumped
+        to (without the extension), if it was.
+        """
+        profile = resource.timings.profile
+        resource.timings.profile = None
+        if profile is None or reason is None:
+            return None
+        stats = Stats(profile)
+        cpu_time = stats.total_tt  # type: ignore[attr-defined]
+        if reason == "cpu_budget" and cpu_time <= self.cpu_budget:
+            return None
+        path = os.path.join(
+            self.dump_dir,
+            f"{time.strftime('%Y%m%d-%H%M%S')}-{test_id or f'{getrandbits(32):08x}'}",
+        )
+        info: Dict[str, Any] = {
+            "uri": resource.request.uri,
+            "test_id": test_id,
+            "descend": resource.descend,
+            "reason": reason,
+            "cpu_time": cpu_time,
+            "time": time.time(),
+        }
+        try:
+            stats.dump_stats(f"{path}.pstats")
+            with open(f"{path}.json", "w", encoding="utf-8") as fh:
+                json.dump(info, fh)
+        except OSError as why:
+            LoopLagSampler.warn(f"can't write profile to {path}: {why}")
+            return None
+        return path
+
+
+class Tracer:
+    """
+    Trace a trace_sample fraction of tests, when trace_dir is configured.
+    """
+
+    def __init__(self) -> None:
+        self.trace_dir = ""
+        self.sample = 0.0
+
+    def setup(self, config: SectionProxy) -> None:
+        "Read the tracing configuration."
+        self.trace_dir = config.get("trace_dir", "")
+        self.sample = config.getfloat("trace_sample", fallback=0)
+
+    def start(self, resource: HttpResource) -> bool:
+        "Start tracing resource, if it should be; call before its check(). Return whether it is."
+        if not self.trace_dir or random() >= self.sample:
+            return False
+        resource.timings.spans = []
+        return True
+
+    def finish(self, resource: HttpResource, test_id: str) -> Optional[str]:
+        "Write resource's trace, if it's being traced. Return the path it was written to."
+        if resource.timings.spans is None:
+            return None
+        path = os.path.join(
+            self.trace_dir,
+            f"{time.strftime('%Y%m%d-%H%M%S')}-{test_id or f'{getrandbits(32):08x}'}"
+            ".trace.json",
+        )
+        try:
+            write_trace(resource, path)
+        except OSError as why:
+            LoopLagSampler.warn(f"can't write trace to {path}: {why}")
+            return None
+        return path
+
+
+lag_sampler = LoopLagSampler()
+profiler = Profiler()
+tracer = Tracer()
@@ -4,18 +4,29 @@ Rate Limiting for RED, the Resource Expert Droid.
 
 from collections import defaultdict
 from configparser import SectionProxy
-from typing import Dict, Set, Union, Callable, TYPE_CHECKING
-from urllib.parse import urlsplit
+from typing import Dict, Set, Callable, TYPE_CHECKING
 
 import thor.loop
 
+from redbot.resource.fetch import url_to_origin
+from redbot.webui.metrics import ratelimit_rejections
+
 if TYPE_CHECKING:
     from redbot.webui import RedWebUi  # pylint: disable=cyclic-import,unused-import
 
 
 class RateLimiter:
-    limits: Dict[str, int] = {}
-    counts: Dict[str, Dict[str, int]] = {}
+    """
+    Limit how many tests clients and origins can have in a period.
+
+    Tests that transfer a lot or use a lot of CPU cost more than others, so clients and origins
+    can also be limited by how many bytes their tests transferred and how much CPU time they
+    used in a period. Those are only known once a test has finished (see record_usage()), so
+    they're checked before the next one starts.
+    """
+
+    limits: Dict[str, float] = {}
+    counts: Dict[str, Dict[str, float]] = {}
     periods: Dict[str, float] = {}
     watching: Set[str] = set()
     running = False
@@ -34,7 +45,10 @@ class RateLimiter:
             try:
                 self.increment("client_id", client_id)
                 self.increment("instant", client_id)
-            except RateLimitViolation:
+                self.check("client_bytes", client_id)
+                self.check("client_cpu", client_id)
+            except RateLimitViolation as why:
+                webui.limited = str(why)
                 error_response(
                     b"429",
                     b"Too Many Requests",
@@ -48,7 +62,10 @@ class RateLimiter:
         if origin:
             try:
                 self.increment("origin", origin)
-            except RateLimitViolation:
+                self.check("origin_bytes", origin)
+                self.check("origin_cpu", origin)
+            except RateLimitViolation as why:
+                webui.limited = str(why)
                 error_response(
                     b"429",
                     b"Too Many Requests",
@@ -57,6 +74,21 @@ class RateLimiter:
                 )
                 raise ValueError  # pylint: disable=raise-missing-from
 
+    def record_usage(
+        self, webui: "RedWebUi", transferred: int, cpu_time: float
+    ) -> None:
+        """Charge webui's client and origin for the bytes and CPU time its test used."""
+        if not self.running:
+            self.setup(webui.config)
+        client_id = webui.get_client_id()
+        if client_id:
+            self.charge("client_bytes", client_id, transferred)
+            self.charge("client_cpu", client_id, cpu_time)
+        origin = url_to_origin(webui.test_uri)
+        if origin:
+            self.charge("origin_bytes", origin, transferred)
+            self.charge("origin_cpu", origin, cpu_time)
+
     def process_slack(self, webui: "RedWebUi") -> None:
         """Enforce limits on Slack."""
         if not self.running:
@@ -96,15 +128,27 @@ class RateLimiter:
         if instant_limit:
             self._setup("instant", instant_limit, 15)
 
+        client_period = config.getfloat("limit_client_period", fallback=1) * 3600
         client_limit = config.getint("limit_client_tests", fallback=0)
         if client_limit:
-            client_period = config.getfloat("limit_client_period", fallback=1) * 3600
             self._setup("client_id", client_limit, client_period)
-
+        client_kbytes = config.getint("limit_client_kbytes", fallback=0)
+        if client_kbytes:
+            self._setup("client_bytes", client_kbytes * 1024, client_period)
+        client_cpu = config.getfloat("limit_client_cpu", fallback=0)
+        if client_cpu:
+            self._setup("client_cpu", client_cpu, client_period)
+
+        origin_period = config.getfloat("limit_origin_period", fallback=1) * 3600
         origin_limit = config.getint("limit_origin_tests", fallback=0)
         if origin_limit:
-            origin_period = config.getfloat("limit_origin_period", fallback=1) * 3600
             self._setup("origin", origin_limit, origin_period)
+        origin_kbytes = config.getint("limit_origin_kbytes", fallback=0)
+        if origin_kbytes:
+            self._setup("origin_bytes", origin_kbytes * 1024, origin_period)
+        origin_cpu = config.getfloat("limit_origin_cpu", fallback=0)
+        if origin_cpu:
+            self._setup("origin_cpu", origin_cpu, origin_period)
 
         slack_user_limit = config.getint("limit_slack_user_tests", fallback=0)
         if slack_user_limit:
@@ -122,9 +166,9 @@ class RateLimiter:
 
         self.running = True
 
-    def _setup(self, metric_name: str, limit: int, period: float) -> None:
+    def _setup(self, metric_name: str, limit: float, period: float) -> None:
         """
-        Set up a metric with a limit and a period (expressed in hours).
+        Set up a metric with a limit and a period (expressed in seconds).
         Can be called multiple times.
         """
         if not metric_name in self.watching:
@@ -144,7 +188,28 @@ class RateLimiter:
             return
         self.counts[metric_name][discriminator] += 1
         if self.counts[metric_name][discriminator] > self.limits[metric_name]:
-            raise RateLimitViolation
+            ratelimit_rejections.inc(metric=metric_name)
+            raise RateLimitViolation(metric_name)
+
+    def check(self, metric_name: str, discriminator: str) -> None:
+        """
+        Raise RateLimitViolation if this discriminator has already used up a metric.
+        If the metric isn't set up, it will be ignored.
+        """
+        if not metric_name in self.watching:
+            return
+        if self.counts[metric_name][discriminator] >= self.limits[metric_name]:
+            ratelimit_rejections.inc(metric=metric_name)
+            raise RateLimitViolation(metric_name)
+
+    def charge(self, metric_name: str, discriminator: str, amount: float) -> None:
+        """
+        Add amount to a metric for a discriminator, without enforcing its limit.
+        If the metric isn't set up, it will be ignored.
+        """
+        if not metric_name in self.watching:
+            return
+        self.counts[metric_name][discriminator] += amount
 
     def clear(self, metric_name: str) -> None:
         """
@@ -158,19 +223,4 @@ ratelimiter = RateLimiter()
 
 
 class RateLimitViolation(Exception):
-    pass
-
-
-def url_to_origin(url: str) -> Union[str, None]:
-    "Convert an URL to an RFC6454 Origin."
-    default_port = {"http": 80, "https": 443}
-    try:
-        p_url = urlsplit(url)
-        origin = (
-            f"{p_url.scheme.lower()}://"
-            f"{p_url.hostname.lower()}:"
-            f"{p_url.port or default_port.get(p_url.scheme, 0)}"
-        )
-    except (AttributeError, ValueError):
-        origin = None
-    return origin
+    "A limit has been exceeded; the argument is the name of its metric."
@@ -75,7 +75,7 @@ def slack_run(webui: "RedWebUi") -> None:
             "Bad slack token.",
         )
         return
-    webui.timeout = thor.schedule(int(webui.config["max_runtime"]), formatter.timeout)
+    webui.start_timeout(top_resource, formatter.timeout)
 
     @thor.events.on(formatter)
     def formatter_done() -> None:
@@ -0,0 +1,606 @@
+#!/usr/bin/env python3
+
+import asyncio
+from configparser import ConfigParser
+import io
+import json
+import os
+from pstats import Stats
+import tempfile
+import time
+import tracemalloc
+import unittest
+import unittest.mock
+from typing import Any, Callable, Dict, List, Tuple
+from wsgiref.util import setup_testing_defaults
+
+import thor
+
+from redbot.resource import HttpResource
+from redbot.resource.fetch import DeadlineError
+from redbot.resource.replay import ReplayHttpClient, canned_record
+from redbot.webui import metrics
+from redbot.webui import RedWebUi, hit_deadline
+from redbot.webui.access_log import AccessLog
+from redbot.webui.admission import AdmissionController
+from redbot.webui.gateway import AsgiApp, LoopThread, QueueExchange, WsgiApp
+from redbot.webui.memory import MemoryDiagnostics, live_objects, rss
+from redbot.webui.metrics import (
+    MetricsRegistry,
+    loop_lag,
+    resource_usage,
+    saved_test_stats,
+    SavedTestStats,
+)
+from redbot.webui.profiler import LoopLagSampler, Profiler, Tracer
+from redbot.webui.ratelimit import RateLimiter, RateLimitViolation
+
+
+class MetricsTester(unittest.TestCase):
+    def setUp(self) -> None:
+        self.registry = MetricsRegistry()
+
+    def test_counter(self) -> None:
+        counter = self.registry.counter("tests_total", "Tests.", ["format", "descend"])
+        counter.inc(format="html", descend=False)
+        counter.inc(2, format="html", descend=False)
+        counter.inc(format="har", descend=True)
+        self.assertEqual(counter.get(format="html", descend=False), 3)
+        self.assertEqual(
+            self.registry.render(),
+            "# HELP tests_total Tests.\n"
+            "# TYPE tests_total counter\n"
+            'tests_total{format="har",descend="true"} 1\n'
+            'tests_total{format="html",descend="false"} 3\n',
+        )
+        with self.assertRaises(KeyError):
+            counter.inc(format="html")
+
+    def test_counter_func(self) -> None:
+        counts = {"open": 2}
+        counter = self.registry.counter(
+            "events_total",
+            "Events.",
+            ["event"],
+            func=lambda: {(event,): n for event, n in counts.items()},
+        )
+        counts["close"] = 1
+        self.assertEqual(counter.get(event="open"), 2)
+        self.assertTrue(
+            self.registry.render().endswith(
+                'events_total{event="close"} 1\nevents_total{event="open"} 2\n'
+            )
+        )
+
+    def test_outbound_counts(self) -> None:
+        hits = metrics.dns_cache_lookups.get(result="hit")
+        queued = metrics.outbound_queued.get()
+        fail_fast = metrics.circuit_breaker_events.get(event="fail_fast")
+        with unittest.mock.patch.object(metrics.dns_cache, "hits", hits + 1):
+            self.assertEqual(metrics.dns_cache_lookups.get(result="hit"), hits + 1)
+        with unittest.mock.patch.dict(
+            metrics.outbound_scheduler.stats, queued=queued + 1
+        ):
+            self.assertEqual(metrics.outbound_queued.get(), queued + 1)
+        with unittest.mock.patch.dict(
+            metrics.circuit_breaker.stats, fail_fast=fail_fast + 1
+        ):
+            self.assertIn(
+                f'redbot_circuit_breaker_events_total{{event="fail_fast"}} {fail_fast + 1}\n',
+                metrics.metrics.render(),
+            )
+
+    def test_gauge(self) -> None:
+        self.registry.gauge("things", "Things.", func=lambda: 42)
+        self.assertIn("\nthings 42\n", self.registry.render())
+
+    def test_histogram(self) -> None:
+        histogram = self.registry.histogram(
+            "latency_seconds", "Latency.", buckets=[1, 5]
+        )
+        for value in [0.5, 1, 3, 10]:
+            histogram.observe(value)
+        self.assertEqual(histogram.count(), 4)
+        self.assertEqual(
+            self.registry.render().splitlines()[2:],
+            [
+                'latency_seconds_bucket{le="1"} 2',
+                'latency_seconds_bucket{le="5"} 3',
+                'latency_seconds_bucket{le="+Inf"} 4',
+                "latency_seconds_sum 14.5",
+                "latency_seconds_count 4",
+            ],
+        )
+
+    def test_escaping(self) -> None:
+        counter = self.registry.counter("requests_total", "Requests.", ["check_name"])
+        counter.inc(check_name='a "quoted"\\name')
+        self.assertIn(
+            'requests_total{check_name="a \\"quoted\\"\\\\name"} 1',
+            self.registry.render(),
+        )
+
+    def test_duplicate(self) -> None:
+        self.registry.counter("tests_total", "Tests.")
+        with self.assertRaises(KeyError):
+            self.registry.counter("tests_total", "Tests.")
+
+    def test_saved_test_stats(self) -> None:
+        with tempfile.TemporaryDirectory() as save_dir:
+            for name, size in [("a", 10), ("b", 20)]:
+                with open(os.path.join(save_dir, name), "wb") as fh:
+                    fh.write(b"x" * size)
+            os.mkdir(os.path.join(save_dir, "c"))
+            self.assertEqual(saved_test_stats(save_dir), (2, 30))
+        self.assertEqual(saved_test_stats(save_dir), (0, 0))
+
+    def test_saved_test_stats_cache(self) -> None:
+        stats = SavedTestStats("/nonexistent")
+        with unittest.mock.patch(
+            "redbot.webui.metrics.saved_test_stats", return_value=(1, 2)
+        ) as scan:
+            self.assertEqual(stats.get(), (1, 2))
+            self.assertEqual(stats.get(), (1, 2))
+            self.assertEqual(scan.call_count, 1)
+            stats.checked -= stats.max_age
+            stats.get()
+            self.assertEqual(scan.call_count, 2)
+
+
+RECORD = canned_record("http://example.com/", b"hello")
+
+
+def run_test(
+    profiler: Profiler = None, tracer: Tracer = None
+) -> Tuple[HttpResource, str]:
+    "Check http://example.com/ from RECORD, profiling and tracing it if given them."
+    config = ConfigParser()
+    config.read_dict({"redbot": {}})
+    resource = HttpResource(config["redbot"])
+    resource.client = ReplayHttpClient([RECORD])
+    resource.set_request("http://example.com/", req_hdrs=[("User-Agent", "test")])
+    resource.on("check_done", thor.stop)
+    reason = profiler.start(resource) if profiler else None
+    if tracer:
+        tracer.start(resource)
+    resource.check()
+    thor.run()
+    return resource, reason
+
+
+class NullExchange:
+    "An HttpResponseExchange that throws the response away."
+
+    def response_start(self, *args: Any) -> None:
+        pass
+
+    def response_body(self, chunk: bytes) -> None:
+        pass
+
+    def response_done(self, trailers: Any) -> None:
+        pass
+
+
+def make_webui() -> RedWebUi:
+    "Return a RedWebUi that has shown the default page for http://example.com/."
+    config = ConfigParser()
+    config.read_dict(
+        {
+            "redbot": {
+                "charset": "utf-8",
+                "lang": "en",
+                "ui_uri": "http://localhost/",
+                "static_root": "static",
+                "log_traffic": "1024",
+            }
+        }
+    )
+    return RedWebUi(
+        config["redbot"],
+        "GET",
+        b"uri=http://example.com/",
+        [(b"client-ip", b"10.0.0.1")],
+        b"",
+        NullExchange(),
+    )
+
+
+class RecordTestTester(unittest.TestCase):
+    def test_record_test_done(self) -> None:
+        resource, _ = run_test()
+        labels: Dict[str, Any] = {"format": "html", "descend": False}
+        finished = metrics.tests_finished.get(**labels)
+        requests = metrics.outbound_requests.get(check_name="default")
+        bytes_in = metrics.bytes_in.get()
+        fetches = metrics.fetch_latency.count()
+        renders = metrics.render_latency.count()
+        metrics.record_test_done(resource, labels, 0.01)
+        self.assertEqual(metrics.tests_finished.get(**labels), finished + 1)
+        self.assertEqual(
+            metrics.outbound_requests.get(check_name="default"), requests + 1
+        )
+        self.assertEqual(metrics.bytes_in.get(), bytes_in + 5)
+        self.assertGreaterEqual(metrics.fetch_latency.count(), fetches + 1)
+        self.assertEqual(metrics.render_latency.count(), renders + 1)
+
+    def test_hit_deadline(self) -> None:
+        resource, _ = run_test()
+        self.assertFalse(hit_deadline(resource))
+        subreq = list(resource.subreqs.values())[0]
+        subreq.response.http_error = DeadlineError("too late")
+        self.assertTrue(hit_deadline(resource))
+
+
+class RateLimiterTester(unittest.TestCase):
+    def setUp(self) -> None:
+        self.limiter = RateLimiter()
+        self.limiter.limits = {}
+        self.limiter.counts = {}
+        self.limiter.periods = {}
+        self.limiter.watching = set()
+        self.limiter.loop = unittest.mock.Mock()
+
+    def test_usage(self) -> None:
+        resource, _ = run_test()
+        transferred, cpu_time = resource_usage(resource)
+        self.assertEqual(transferred, resource.transfer_in + resource.transfer_out)
+        self.assertGreater(cpu_time, 0)
+
+    def test_timeout_usage(self) -> None:
+        webui = make_webui()
+        webui.top_resource, _ = run_test()
+        webui.checking = True
+        webui.test_labels = {"format": "html", "descend": False}
+        usage = resource_usage(webui.top_resource)
+        finished = metrics.tests_finished.get(**webui.test_labels)
+        with unittest.mock.patch("redbot.webui.ratelimiter") as ratelimiter:
+            webui.timeout_error()
+            webui.timeout_error()
+        ratelimiter.record_usage.assert_called_once_with(webui, *usage)
+        self.assertEqual(metrics.tests_finished.get(**webui.test_labels), finished + 1)
+
+    def test_cost_limits(self) -> None:
+        config = ConfigParser()
+        config.read_dict(
+            {"redbot": {"limit_client_kbytes": "1", "limit_origin_cpu": "0.5"}}
+        )
+        self.limiter.setup(config["redbot"])
+        self.assertEqual(self.limiter.watching, {"client_bytes", "origin_cpu"})
+        self.limiter.charge("client_bytes", "1.2.3.4", 1000)
+        self.limiter.charge("client_cpu", "1.2.3.4", 1000)  # not set up; ignored
+        self.limiter.check("client_bytes", "1.2.3.4")
+        self.limiter.check("client_cpu", "1.2.3.4")
+        self.limiter.charge("client_bytes", "1.2.3.4", 24)
+        with self.assertRaises(RateLimitViolation):
+            self.limiter.check("client_bytes", "1.2.3.4")
+        self.limiter.check("client_bytes", "5.6.7.8")
+        self.limiter.charge("origin_cpu", "http://example.com:80", 0.75)
+        with self.assertRaises(RateLimitViolation):
+            self.limiter.check("origin_cpu", "http://example.com:80")
+        self.limiter.clear("origin_cpu")
+        self.limiter.check("origin_cpu", "http://example.com:80")
+
+
+class AccessLogTester(unittest.TestCase):
+    def setUp(self) -> None:
+        self.dir = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.log = AccessLog()
+        self.log.path = os.path.join(self.dir.name, "access.json")
+        self.log.loop = unittest.mock.Mock()
+
+    def tearDown(self) -> None:
+        self.log.flush()
+        self.dir.cleanup()
+
+    def lines(self, path: str) -> List[Dict[str, Any]]:
+        with open(path, encoding="utf-8") as fh:
+            return [json.loads(line) for line in fh]
+
+    def test_buffer(self) -> None:
+        self.log.record({"n": 1})
+        self.log.record({"n": 2})
+        self.assertFalse(os.path.exists(self.log.path))
+        self.log.loop.schedule.assert_called_once_with(1.0, self.log.flush)
+        self.log.flush()
+        self.assertEqual(self.lines(self.log.path), [{"n": 1}, {"n": 2}])
+        self.log.max_buffer = 2
+        self.log.record({"n": 3})
+        self.log.record({"n": 4})
+        self.assertEqual(len(self.lines(self.log.path)), 4)
+
+    def test_rotate(self) -> None:
+        self.log.max_bytes = 20
+        self.log.backups = 2
+        for n in range(4):
+            self.log.record({"n": n, "pad": "x"})
+            self.log.flush()
+        self.assertEqual(self.lines(self.log.path), [{"n": 3, "pad": "x"}])
+        self.assertEqual(self.lines(f"{self.log.path}.1"), [{"n": 2, "pad": "x"}])
+        self.assertEqual(self.lines(f"{self.log.path}.2"), [{"n": 1, "pad": "x"}])
+        self.assertFalse(os.path.exists(f"{self.log.path}.3"))
+
+    def test_disabled(self) -> None:
+        self.log.path = ""
+        self.log.record({"n": 1})
+        self.log.flush()
+        self.assertEqual(os.listdir(self.dir.name), [])
+
+    def test_log_test(self) -> None:
+        webui = make_webui()
+        webui.top_resource, _ = run_test()
+        webui.limited = "client_bytes"
+        with unittest.mock.patch("redbot.webui.access_log", self.log):
+            webui.log_test(b"429")
+            webui.log_test(b"429")
+        self.log.flush()
+        [entry] = self.lines(self.log.path)
+        self.assertEqual(entry["client"], "10.0.0.1")
+        self.assertEqual(entry["origin"], "http://example.com:80")
+        self.assertEqual(entry["status"], 429)
+        self.assertEqual(entry["bytes"], 5)
+        self.assertEqual(entry["subrequests"], 1)  # content negotiation
+        self.assertEqual(entry["limited"], "client_bytes")
+        self.assertFalse(entry["timed_out"])
+
+
+class ProfilerTester(unittest.TestCase):
+    def setUp(self) -> None:
+        self.dir = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.profiler = Profiler()
+        self.profiler.dump_dir = self.dir.name
+
+    def tearDown(self) -> None:
+        self.dir.cleanup()
+
+    def test_disabled(self) -> None:
+        self.assertFalse(self.profiler.enabled)
+        resource, reason = run_test(self.profiler)
+        self.assertIsNone(reason)
+        self.assertIsNone(self.profiler.finish(resource, "abc", reason))
+
+    def test_sample(self) -> None:
+        self.profiler.sample = 1
+        resource, reason = run_test(self.profiler)
+        self.assertEqual(reason, "sample")
+        path = self.profiler.finish(resource, "abc", reason)
+        self.assertTrue(path.endswith("-abc"))
+        with open(f"{path}.json", encoding="utf-8") as fh:
+            info = json.load(fh)
+        self.assertEqual(info["uri"], "http://example.com/")
+        self.assertEqual(info["test_id"], "abc")
+        self.assertEqual(info["reason"], "sample")
+        self.assertTrue(Stats(f"{path}.pstats").stats)  # type: ignore[attr-defined]
+        self.assertIsNone(resource.timings.profile)
+
+    def test_cpu_budget(self) -> None:
+        self.profiler.cpu_budget = 60
+        resource, reason = run_test(self.profiler)
+        self.assertEqual(reason, "cpu_budget")
+        self.assertIsNone(self.profiler.finish(resource, None, reason))
+        self.profiler.cpu_budget = 1e-9
+        resource, reason = run_test(self.profiler)
+        self.assertIsNotNone(self.profiler.finish(resource, None, reason))
+        self.assertEqual(len(os.listdir(self.dir.name)), 2)
+
+
+class TracerTester(unittest.TestCase):
+    def test_trace(self) -> None:
+        tracer = Tracer()
+        resource, _ = run_test()
+        self.assertFalse(tracer.start(resource))
+        self.assertIsNone(tracer.finish(resource, "abc"))
+        with tempfile.TemporaryDirectory() as trace_dir:
+            tracer.trace_dir = trace_dir
+            tracer.sample = 1
+            resource, _ = run_test(tracer=tracer)
+            path = tracer.finish(resource, "abc")
+            self.assertTrue(path.endswith("-abc.trace.json"))
+            with open(path, encoding="utf-8") as fh:
+                trace = json.load(fh)
+        names = {event["name"] for event in trace["traceEvents"]}
+        self.assertTrue({"check", "wait", "headers", "body"} <= names)
+
+
+class AdmissionTester(unittest.TestCase):
+    def setUp(self) -> None:
+        self.admission = AdmissionController()
+        self.admission.max_cost = 10
+        self.admission.queue_size = 1
+        self.events: List[str] = []
+
+    def admit(self, name: str, descend: bool = False) -> None:
+        self.admission.admit(
+            self.admission.cost(descend),
+            lambda: self.events.append(f"run {name}"),
+            lambda: self.events.append(f"reject {name}"),
+        )
+
+    def test_admit(self) -> None:
+        self.admit("a", descend=True)
+        self.admit("b")
+        self.admit("c")
+        self.assertEqual(self.events, ["run a", "reject c"])
+        self.assertEqual(self.admission.in_flight, 10)
+        self.assertEqual(len(self.admission.queue), 1)
+        self.admission.release(10)
+        self.assertEqual(self.events, ["run a", "reject c", "run b"])
+        self.assertEqual(self.admission.in_flight, 1)
+        self.assertFalse(self.admission.queue)
+
+    def test_expire(self) -> None:
+        rejections = metrics.admission_rejections.get(reason="queue_timeout")
+        self.admit("a", descend=True)
+        self.admit("b")
+        self.admission._expire(self.admission.queue[0])
+        self.assertEqual(self.events, ["run a", "reject b"])
+        self.assertEqual(
+            metrics.admission_rejections.get(reason="queue_timeout"), rejections + 1
+        )
+        self.admission.release(10)
+        self.assertEqual(self.events, ["run a", "reject b"])
+
+    def test_oversized(self) -> None:
+        self.admission.descend_cost = 20
+        self.admit("a", descend=True)
+        self.assertEqual(self.events, ["run a"])
+
+    def test_disabled(self) -> None:
+        self.admission.max_cost = 0
+        for name in "abc":
+            self.admit(name, descend=True)
+        self.assertEqual(self.events, ["run a", "run b", "run c"])
+
+
+class MemoryDiagnosticsTester(unittest.TestCase):
+    def test_live_objects(self) -> None:
+        before = live_objects()
+        resource, _ = run_test()
+        during = live_objects()
+        self.assertEqual(during["HttpResource"], before["HttpResource"] + 1)
+        self.assertGreaterEqual(during["HttpMessage"], before["HttpMessage"] + 2)
+        self.assertGreater(rss(), 0)
+        del resource
+
+    def test_report(self) -> None:
+        diagnostics = MemoryDiagnostics()
+        config = ConfigParser()
+        config.read_dict({"redbot": {"memory_diagnostics": "True"}})
+        tracing = tracemalloc.is_tracing()
+        diagnostics.setup(config["redbot"])
+        try:
+            first = diagnostics.report(5)
+            self.assertIn("live objects:\n  HttpResource: ", first)
+            self.assertIn("top allocation sites:", first)
+            self.assertNotIn("changes since the last report:", first)
+            run_test()
+            self.assertIn("changes since the last report:", diagnostics.report(5))
+        finally:
+            if not tracing:
+                tracemalloc.stop()
+
+
+class LoopLagSamplerTester(unittest.TestCase):
+    def test_sample(self) -> None:
+        warnings: List[str] = []
+        sampler = LoopLagSampler()
+        sampler.warn = warnings.append  # type: ignore
+        sampler.warn_lag = 0.5
+        samples = loop_lag.count()
+        sampler._expected = time.monotonic() - 0.1
+        sampler._sample()
+        self.assertEqual(warnings, [])
+        sampler._expected = time.monotonic() - 1
+        sampler._sample()
+        self.assertEqual(len(warnings), 1)
+        self.assertEqual(loop_lag.count(), samples + 2)
+
+
+class GatewayTester(unittest.TestCase):
+    def setUp(self) -> None:
+        config = ConfigParser()
+        config.read_dict(
+            {
+                "redbot": {
+                    "charset": "utf-8",
+                    "lang": "en",
+                    "ui_uri": "http://localhost/",
+                    "static_root": "static",
+                }
+            }
+        )
+        self.config = config["redbot"]
+        self.loop = LoopThread()
+
+    def tearDown(self) -> None:
+        self.loop.stop()
+
+    def test_wsgi(self) -> None:
+        app = WsgiApp(self.config, self.loop)
+        statuses: List[str] = []
+        for method in ["GET", "PUT"]:
+            environ: Dict[str, Any] = {
+                "REQUEST_METHOD": method,
+                "wsgi.input": io.BytesIO(b""),
+            }
+            setup_testing_defaults(environ)
+            headers: List[Tuple[str, str]] = []
+
+            def start_response(status: str, res_hdrs: List[Tuple[str, str]]) -> None:
+                statuses.append(status)
+                headers.extend(res_hdrs)  # pylint: disable=cell-var-from-loop
+
+            body = b"".join(app(environ, start_response))
+            if method == "GET":
+                self.assertIn(b"<html", body)
+                self.assertIn(("Content-Type", "text/html; charset=utf-8"), headers)
+        self.assertEqual(statuses, ["200 OK", "405 Method Not Allowed"])
+
+    def test_asgi(self) -> None:
+        app = AsgiApp(self.config, self.loop)
+        sent: List[Dict[str, Any]] = []
+
+        async def receive() -> Dict[str, Any]:
+            return {"type": "http.request", "body": b""}
+
+        async def send(message: Dict[str, Any]) -> None:
+            sent.append(message)
+
+        scope = {
+            "type": "http",
+            "method": "GET",
+            "query_string": b"",
+            "headers": [(b"host", b"localhost")],
+            "client": ("10.0.0.1", 1234),
+        }
+        asyncio.run(app(scope, receive, send))
+        self.assertEqual(sent[0]["type"], "http.response.start")
+        self.assertEqual(sent[0]["status"], 200)
+        self.assertEqual(sent[-1], {"type": "http.response.body", "body": b""})
+        body = b"".join(message.get("body", b"") for message in sent[1:])
+        self.assertIn(b"<html", body)
+
+    def test_wsgi_query_string(self) -> None:
+        app = WsgiApp(self.config, self.loop)
+        query_strings: List[bytes] = []
+
+        def handle(*args: Any, put: Callable[..., None], **kw: Any) -> None:
+            query_strings.append(args[1])
+            put(("start", b"200", b"OK", []))
+            put(("done",))
+
+        app.handle = handle  # type: ignore
+        environ: Dict[str, Any] = {"QUERY_STRING": "uri=http://example.com/\xc3\xa9"}
+        setup_testing_defaults(environ)
+        list(app(environ, lambda status, headers: None))
+        self.assertEqual(query_strings, ["uri=http://example.com/é".encode("utf-8")])
+
+    def test_asgi_lifespan(self) -> None:
+        app = AsgiApp(self.config, self.loop)
+        messages = [{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}]
+        sent: List[Dict[str, Any]] = []
+
+        async def receive() -> Dict[str, Any]:
+            return messages.pop(0)
+
+        async def send(message: Dict[str, Any]) -> None:
+            sent.append(message)
+
+        asyncio.run(app({"type": "lifespan"}, receive, send))
+        self.assertEqual(
+            [message["type"] for message in sent],
+            ["lifespan.startup.complete", "lifespan.shutdown.complete"],
+        )
+        self.assertIsNone(self.loop.thread)
+
+    def test_error(self) -> None:
+        events: List[Tuple[Any, ...]] = []
+        exchange = QueueExchange(events.append)
+        exchange.error()
+        exchange.error()
+        self.assertEqual(events[0][:2], ("start", b"500"))
+        self.assertEqual(events[-1], ("done",))
+        self.assertEqual(len(events), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,371 @@
+#!/usr/bin/env python
+
+"""
+End-to-end benchmark for REDbot.
+
+Starts a synthetic origin server in another process, then runs HttpResource checks against it at
+the given concurrency. Reports throughput, latency percentiles, CPU time per test and peak RSS for
+each scenario, as JSON so that results can be compared between commits.
+
+    PYTHONPATH=. python test/benchmark.py --tests 100 --concurrency 10 --output bench.json
+"""
+
+from argparse import ArgumentParser
+from configparser import ConfigParser
+from functools import partial
+import gzip
+import hashlib
+import json
+import multiprocessing
+from multiprocessing.process import BaseProcess
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import time
+from typing import Any, Callable, Dict, List, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import thor
+from thor.http import get_header
+from thor.http.server import HttpServerExchange
+
+from redbot.resource import HttpResource
+from redbot.resource.fetch import RedFetcher, RedHttpClient
+from redbot.type import RawHeaderListType
+
+# name: (path, descend)
+SCENARIOS: Dict[str, Tuple[str, bool]] = {
+    "headers": ("/headers?count=40&size=80", False),
+    "large-headers": ("/headers?count=200&size=400", False),
+    "identity": ("/body?size=100000", False),
+    "gzip": ("/body?size=100000&gzip=1", False),
+    "chunked": ("/body?size=100000&chunked=1", False),
+    "gzip-chunked": ("/body?size=1000000&gzip=1&chunked=1", False),
+    "html": ("/html?links=50", False),
+    "html-descend": ("/html?links=20", True),
+    "slow-drip": ("/drip?size=10000&chunks=10&interval=0.05", False),
+}
+
+LAST_MODIFIED = b"Mon, 01 Jan 2024 00:00:00 GMT"
+
+
+class SyntheticOrigin:
+    """
+    Serve synthetic responses, parameterised by path and query string:
+
+      /headers?count=N&size=M  - N extra response headers, each M bytes long
+      /body?size=N&gzip=1&chunked=1 - a N byte body, optionally gzipped and/or chunked
+      /html?links=N  - HTML with N links to assets
+      /asset?n=N&type=T - a small asset
+      /drip?size=N&chunks=C&interval=S - a body sent in C chunks, S seconds apart
+
+    All responses have ETag and Last-Modified, and support conditional and range requests.
+    """
+
+    def __init__(self, exchange: HttpServerExchange) -> None:
+        self.exchange = exchange
+        self.method = b""
+        self.uri = b""
+        self.req_hdrs: RawHeaderListType = []
+        exchange.on("request_start", self.request_start)
+        exchange.on("request_done", self.request_done)
+
+    def request_start(
+        self, method: bytes, uri: bytes, req_hdrs: RawHeaderListType
+    ) -> None:
+        self.method = method
+        self.uri = uri
+        self.req_hdrs = req_hdrs
+
+    def request_done(self, trailers: RawHeaderListType) -> None:
+        p_uri = urlsplit(self.uri.decode("ascii"))
+        args = {k: v[0] for k, v in parse_qs(p_uri.query).items()}
+        headers: RawHeaderListType = [
+            (b"Cache-Control", b"max-age=60"),
+            (b"Last-Modified", LAST_MODIFIED),
+            (b"Accept-Ranges", b"bytes"),
+        ]
+        content_type = b"text/plain"
+        interval = 0.0
+        chunks = 1
+        if p_uri.path == "/headers":
+            for i in range(int(args.get("count", 10))):
+                headers.append(
+                    (f"X-Bench-{i}".encode("ascii"), b"x" * int(args.get("size", 20)))
+                )
+            body = b"ok"
+        elif p_uri.path == "/html":
+            content_type = b"text/html"
+            body = self.html(int(args.get("links", 10)))
+        elif p_uri.path == "/asset":
+            content_type = {"css": b"text/css", "js": b"text/javascript"}.get(
+                args.get("type", ""), b"image/png"
+            )
+            body = b"/* asset %s */\n" % args.get("n", "0").encode("ascii") * 20
+        elif p_uri.path in ["/body", "/drip"]:
+            body = self.text(int(args.get("size", 1000)))
+            if p_uri.path == "/drip":
+                chunks = int(args.get("chunks", 10))
+                interval = float(args.get("interval", 0.1))
+        else:
+            self.respond(b"404", b"Not Found", headers, b"not found")
+            return
+        headers.append((b"Content-Type", content_type))
+        if args.get("gzip"):
+            headers.append((b"Vary", b"Accept-Encoding"))
+            if b"gzip" in b",".join(get_header(self.req_hdrs, b"accept-encoding")):
+                body = gzip.compress(body, 6, mtime=0)
+                headers.append((b"Content-Encoding", b"gzip"))
+        etag = b'"%s"' % hashlib.md5(body).hexdigest()[:16].encode("ascii")
+        headers.append((b"ETag", etag))
+
+        if etag in get_header(self.req_hdrs, b"if-none-match") or get_header(
+            self.req_hdrs, b"if-modified-since"
+        ) == [LAST_MODIFIED]:
+            self.respond(b"304", b"Not Modified", headers, b"")
+            return
+        status, phrase = b"200", b"OK"
+        ranges = get_header(self.req_hdrs, b"range")
+        if ranges and ranges[0].startswith(b"bytes="):
+            start, end = ranges[0][6:].split(b"-", 1)
+            first, last = int(start or 0), min(int(end or len(body) - 1), len(body) - 1)
+            headers.append(
+                (b"Content-Range", b"bytes %d-%d/%d" % (first, last, len(body)))
+            )
+            body = body[first : last + 1]
+            status, phrase = b"206", b"Partial Content"
+        if not args.get("chunked") and p_uri.path != "/drip":
+            headers.append((b"Content-Length", str(len(body)).encode("ascii")))
+        self.respond(status, phrase, headers, body, chunks, interval)
+
+    def respond(
+        self,
+        status: bytes,
+        phrase: bytes,
+        headers: RawHeaderListType,
+        body: bytes,
+        chunks: int = 1,
+        interval: float = 0,
+    ) -> None:
+        self.exchange.response_start(status, phrase, headers)
+        if self.method == b"HEAD" or status == b"304":
+            self.exchange.response_done([])
+            return
+        size = max(1, len(body) // chunks)
+        parts = [body[i : i + size] for i in range(0, len(body), size)] or [b""]
+
+        def send(remaining: List[bytes]) -> None:
+            self.exchange.response_body(remaining[0])
+            if remaining[1:]:
+                thor.schedule(interval, send, remaining[1:])
+            else:
+                self.exchange.response_done([])
+
+        send(parts)
+
+    @staticmethod
+    def text(size: int) -> bytes:
+        line = b"The quick brown fox jumps over the lazy dog, again and again.\n"
+        return (line * (size // len(line) + 1))[:size]
+
+    @staticmethod
+    def html(links: int) -> bytes:
+        tags = []
+        for i in range(links):
+            kind = ["css", "js", "img"][i % 3]
+            if kind == "css":
+                tags.append(f'<link rel="stylesheet" href="/asset?n={i}&amp;type=css">')
+            elif kind == "js":
+                tags.append(f'<script src="/asset?n={i}&amp;type=js"></script>')
+            else:
+                tags.append(f'<img src="/asset?n={i}&amp;type=img" alt="">')
+        return (
+            "<!DOCTYPE html><html><head><title>bench</title></head><body>\n"
+            + "\n".join(tags)
+            + "\n</body></html>\n"
+        ).encode("ascii")
+
+
+def run_origin(port: int) -> None:
+    "Run the synthetic origin server until killed."
+    server = thor.http.HttpServer(b"127.0.0.1", port)
+    server.on("exchange", SyntheticOrigin)
+    thor.run()
+
+
+def start_origin() -> Tuple[BaseProcess, int]:
+    "Start the synthetic origin in another process; return it and its port."
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    process = multiprocessing.get_context("spawn").Process(
+        target=run_origin, args=(port,), daemon=True
+    )
+    process.start()
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port), 0.1).close()
+            break
+        except OSError:
+            time.sleep(0.05)
+    return process, port
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def run_scenario(
+    config: Any,
+    uri: str,
+    descend: bool,
+    tests: int,
+    concurrency: int,
+    done: Callable[[Dict[str, Any]], None],
+) -> None:
+    """
+    Run tests checks of uri, concurrency at a time, and call done with a summary.
+
+    Scenarios run one after another on thor's loop, which is stopped after each one. That
+    leaves pooled connections unusable, so each scenario has a client of its own, and starts
+    cold.
+    """
+    client = RedHttpClient()
+    client.idle_timeout = RedFetcher.client.idle_timeout
+    latencies: List[float] = []
+    errors: List[str] = []
+    started = [0]
+    cpu_start = time.process_time()
+    wall_start = time.monotonic()
+
+    def finish() -> None:
+        wall = time.monotonic() - wall_start
+        cpu = time.process_time() - cpu_start
+        done(
+            {
+                "uri": uri,
+                "descend": descend,
+                "tests": tests,
+                "concurrency": concurrency,
+                "errors": len(errors),
+                "error_types": sorted(set(errors)),
+                "wall_seconds": round(wall, 3),
+                "throughput": round(tests / wall, 2),
+                "latency_p50_ms": round(percentile(latencies, 0.5) * 1000, 1),
+                "latency_p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+                "cpu_per_test_ms": round(cpu / tests * 1000, 2),
+                "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            }
+        )
+
+    def start_test() -> None:
+        started[0] += 1
+        top_resource = HttpResource(config, descend=descend)
+        top_resource.client = client
+        top_resource.set_request(uri)
+        test_start = time.monotonic()
+
+        @thor.events.on(top_resource)
+        def check_done() -> None:
+            latencies.append(time.monotonic() - test_start)
+            if top_resource.response.http_error:
+                errors.append(top_resource.response.http_error.desc)
+            if started[0] < tests:
+                start_test()
+            elif len(latencies) == tests:
+                finish()
+
+        top_resource.check()
+
+    for _ in range(min(tests, concurrency)):
+        start_test()
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    parser = ArgumentParser(description="REDbot end-to-end benchmark")
+    parser.add_argument(
+        "-n", "--tests", type=int, default=20, help="tests per scenario"
+    )
+    parser.add_argument(
+        "-c", "--concurrency", type=int, default=5, help="tests to run at once"
+    )
+    parser.add_argument(
+        "-s",
+        "--scenario",
+        action="append",
+        choices=list(SCENARIOS),
+        help="scenario to run (default: all); may be repeated",
+    )
+    parser.add_argument("-o", "--output", help="file to write JSON results to")
+    args = parser.parse_args()
+
+    config_parser = ConfigParser()
+    config_parser.read(os.environ.get("REDBOT_CONFIG", "config.txt"))
+    if not config_parser.has_section("redbot"):
+        config_parser.add_section("redbot")
+    config = config_parser["redbot"]
+    config["enable_local_access"] = "True"
+
+    origin, port = start_origin()
+    results: Dict[str, Any] = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "thor": thor.__version__,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "scenarios": {},
+    }
+
+    def scenario_done(name: str, result: Dict[str, Any]) -> None:
+        results["scenarios"][name] = result
+        sys.stderr.write(
+            f"{name:14} {result['throughput']:8.2f} tests/s  "
+            f"p50 {result['latency_p50_ms']:8.1f}ms  "
+            f"p99 {result['latency_p99_ms']:8.1f}ms  "
+            f"cpu {result['cpu_per_test_ms']:7.2f}ms/test  "
+            f"rss {result['peak_rss_kb'] / 1024:6.1f}MB  "
+            f"errors {result['errors']}\n"
+        )
+        thor.stop()
+
+    try:
+        for name in args.scenario or SCENARIOS:
+            path, descend = SCENARIOS[name]
+            run_scenario(
+                config,
+                f"http://127.0.0.1:{port}{path}",
+                descend,
+                args.tests,
+                args.concurrency,
+                partial(scenario_done, name),
+            )
+            thor.run()
+    finally:
+        origin.terminate()
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            fh.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
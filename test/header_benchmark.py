@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+
+"""
+Micro-benchmark for REDbot's header processing.
+
+Runs a corpus of response header blocks through HeaderProcessor with a DummyMsg, and reports
+headers per second, followed by the time spent in each header handler's handle_input syntax
+checks, parse and finish.
+
+The corpus is either the bundled sample set (test/corpus/response_headers.txt) or the responses
+in one or more HAR files:
+
+    PYTHONPATH=. python test/header_benchmark.py --rounds 500 site1.har site2.har
+"""
+
+from argparse import ArgumentParser
+from collections import defaultdict
+import json
+import os
+import sys
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+from redbot.message import DummyMsg
+from redbot.message.headers import HeaderProcessor, HttpHeader
+from redbot.type import RawHeaderListType
+
+SAMPLE_CORPUS = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "corpus", "response_headers.txt"
+)
+
+# version, status code, status phrase, headers
+HeaderBlock = Tuple[str, str, str, RawHeaderListType]
+
+PHASES = ["syntax", "parse", "finish"]
+
+
+def load_text_corpus(path: str) -> List[HeaderBlock]:
+    """
+    Load header blocks from a text file. Each block is a status line followed by header lines;
+    blocks are separated by blank lines, and lines starting with '#' are ignored.
+    """
+    blocks: List[HeaderBlock] = []
+    with open(path, "rb") as fh:
+        lines = [line.rstrip(b"\r\n") for line in fh if not line.startswith(b"#")] + [
+            b""
+        ]
+    current: List[bytes] = []
+    for line in lines:
+        if line.strip():
+            current.append(line)
+            continue
+        if current:
+            version, status_code, status_phrase = (
+                current[0].decode("ascii").split(" ", 2) + ["", ""]
+            )[:3]
+            headers = [
+                (name.strip(), value.strip())
+                for name, value in (line.split(b":", 1) for line in current[1:])
+            ]
+            blocks.append((version, status_code, status_phrase, headers))
+            current = []
+    return blocks
+
+
+def load_har(path: str) -> List[HeaderBlock]:
+    "Load the response header blocks from a HAR file."
+    with open(path, encoding="utf-8") as fh:
+        har = json.load(fh)
+    blocks: List[HeaderBlock] = []
+    for entry in har.get("log", {}).get("entries", []):
+        response = entry.get("response", {})
+        headers = [
+            (
+                hdr["name"].encode("iso-8859-1", "replace"),
+                hdr["value"].encode("iso-8859-1", "replace"),
+            )
+            for hdr in response.get("headers", [])
+            if not hdr["name"].startswith(":")  # HTTP/2 pseudo-headers
+        ]
+        if headers:
+            blocks.append(
+                (
+                    response.get("httpVersion", "HTTP/1.1"),
+                    str(response.get("status", 200)),
+                    response.get("statusText", ""),
+                    headers,
+                )
+            )
+    return blocks
+
+
+def new_message(block: HeaderBlock) -> DummyMsg:
+    message = DummyMsg()
+    message.version, message.status_code, message.status_phrase = block[:3]
+    return message
+
+
+class TimedHeaderProcessor(HeaderProcessor):
+    """
+    A HeaderProcessor that times each of its handlers' methods, per handler class.
+
+    handle_input's time includes parse, which is subtracted from it to get the time spent in
+    splitting and syntax checks.
+    """
+
+    stats: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+
+    def get_header_handler(self, header_name: str) -> HttpHeader:
+        is_new = header_name.lower() not in self._header_handlers
+        handler = HeaderProcessor.get_header_handler(self, header_name)
+        if is_new:
+            stats = self.stats[handler.__class__.__name__]
+            for method, phase in [
+                ("handle_input", "handle_input"),
+                ("parse", "parse"),
+                ("finish", "finish"),
+            ]:
+                setattr(
+                    handler, method, self.timed(getattr(handler, method), stats, phase)
+                )
+        return handler
+
+    @staticmethod
+    def timed(
+        method: Callable[..., Any], stats: Dict[str, float], phase: str
+    ) -> Callable[..., Any]:
+        def wrapper(*args: Any, **kw: Any) -> Any:
+            start = time.perf_counter()
+            try:
+                return method(*args, **kw)
+            finally:
+                stats[phase] += time.perf_counter() - start
+                if phase == "handle_input":
+                    stats["count"] += 1
+
+        return wrapper
+
+
+def run(blocks: List[HeaderBlock], rounds: int, processor: type) -> float:
+    "Process blocks rounds times with processor; return the seconds spent processing."
+    elapsed = 0.0
+    for _ in range(rounds):
+        for block in blocks:
+            message = new_message(block)
+            start = time.perf_counter()
+            processor(message).process(block[3])
+            elapsed += time.perf_counter() - start
+    return elapsed
+
+
+def breakdown(stats: Dict[str, Dict[str, float]]) -> List[Dict[str, Any]]:
+    "Summarise per-handler timings, slowest first."
+    results = []
+    for name, handler_stats in stats.items():
+        timings = {
+            "syntax": handler_stats["handle_input"] - handler_stats["parse"],
+            "parse": handler_stats["parse"],
+            "finish": handler_stats["finish"],
+        }
+        total = sum(timings.values())
+        count = int(handler_stats["count"])
+        results.append(
+            {
+                "handler": name,
+                "fields": count,
+                "total_ms": round(total * 1000, 3),
+                "us_per_field": round(total / count * 1000000, 2) if count else 0,
+                **{f"{phase}_ms": round(timings[phase] * 1000, 3) for phase in PHASES},
+            }
+        )
+    return sorted(results, key=lambda r: r["total_ms"], reverse=True)
+
+
+def main() -> None:
+    parser = ArgumentParser(description="REDbot header processing micro-benchmark")
+    parser.add_argument(
+        "har", nargs="*", help="HAR files to use as the corpus (default: sample set)"
+    )
+    parser.add_argument(
+        "-r", "--rounds", type=int, default=200, help="times to process the corpus"
+    )
+    parser.add_argument(
+        "-t", "--top", type=int, default=20, help="handlers to show; 0 for all"
+    )
+    parser.add_argument(
+        "--json", action="store_true", help="write results as JSON to STDOUT"
+    )
+    args = parser.parse_args()
+
+    blocks: List[HeaderBlock] = []
+    for path in args.har:
+        blocks.extend(load_har(path))
+    if not args.har:
+        blocks = load_text_corpus(SAMPLE_CORPUS)
+    if not blocks:
+        sys.stderr.write("No response headers found.\n")
+        sys.exit(1)
+    header_count = sum(len(block[3]) for block in blocks) * args.rounds
+
+    run(blocks, 1, HeaderProcessor)  # warm up imports and regex caches
+    elapsed = run(blocks, args.rounds, HeaderProcessor)
+    timed_elapsed = run(blocks, args.rounds, TimedHeaderProcessor)
+    handlers = breakdown(TimedHeaderProcessor.stats)
+    results = {
+        "blocks": len(blocks),
+        "headers": header_count,
+        "seconds": round(elapsed, 3),
+        "headers_per_second": round(header_count / elapsed),
+        "timing_overhead": round(timed_elapsed / elapsed, 2),
+        "handlers": handlers,
+    }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(
+        f"{results['headers']} headers in {len(blocks)} blocks x {args.rounds} rounds: "
+        f"{results['headers_per_second']:,} headers/sec"
+    )
+    print(
+        f"(timings below are {results['timing_overhead']}x slower, due to overhead)\n"
+    )
+    print(
+        f"{'handler':28} {'fields':>8} {'total ms':>10} {'us/field':>9} "
+        f"{'syntax ms':>10} {'parse ms':>10} {'finish ms':>10}"
+    )
+    for handler in handlers[: args.top or None]:
+        print(
+            f"{handler['handler']:28} {handler['fields']:8} {handler['total_ms']:10.1f} "
+            f"{handler['us_per_field']:9.1f} {handler['syntax_ms']:10.1f} "
+            f"{handler['parse_ms']:10.1f} {handler['finish_ms']:10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+
+"""
+Soak test for REDbot.
+
+Runs thousands of tests through RedWebUi against the synthetic origin from benchmark.py, and
+checks that the process' RSS stays flat once it has warmed up, and that tests don't leave
+resources behind.
+
+    PYTHONPATH=. python test/soak_test.py
+
+SOAK_TESTS sets how many tests to run (after SOAK_WARMUP warm-up tests), and SOAK_RSS_GROWTH
+how many megabytes RSS may grow by.
+"""
+
+from configparser import ConfigParser
+import gc
+import os
+import sys
+import unittest
+from typing import Any, Callable, Dict, List, Tuple
+from urllib.parse import urlencode
+
+import thor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from benchmark import start_origin  # pylint: disable=wrong-import-position
+from redbot.type import RawHeaderListType  # pylint: disable=wrong-import-position
+from redbot.webui import RedWebUi  # pylint: disable=wrong-import-position
+from redbot.webui.memory import (  # pylint: disable=wrong-import-position
+    live_objects,
+    rss,
+)
+
+TESTS = int(os.environ.get("SOAK_TESTS", 2000))
+WARMUP = int(os.environ.get("SOAK_WARMUP", 200))
+RSS_GROWTH = float(os.environ.get("SOAK_RSS_GROWTH", 16))  # megabytes
+CONCURRENCY = 10
+
+# path, descend
+PATHS: List[Tuple[str, bool]] = [
+    ("/headers?count=40&size=80", False),
+    ("/body?size=100000&gzip=1", False),
+    ("/body?size=100000&chunked=1", False),
+    ("/html?links=10", False),
+    ("/html?links=10", True),
+]
+
+
+class SoakExchange:
+    "An HttpResponseExchange that throws the response away, noting its status."
+
+    def __init__(self, done: Callable[[bytes], None]) -> None:
+        self.done = done
+        self.status = b""
+
+    def response_start(
+        self, status_code: bytes, status_phrase: bytes, res_hdrs: RawHeaderListType
+    ) -> None:
+        self.status = status_code
+
+    def response_body(self, chunk: bytes) -> None:
+        pass
+
+    def response_done(self, trailers: RawHeaderListType) -> None:
+        self.done(self.status)
+
+
+class SoakTest(unittest.TestCase):
+    origin: Any = None
+    port = 0
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.origin, cls.port = start_origin()
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.origin.terminate()
+
+    def setUp(self) -> None:
+        config_parser = ConfigParser()
+        config_parser.read(os.environ.get("REDBOT_CONFIG", "config.txt"))
+        if not config_parser.has_section("redbot"):
+            config_parser.add_section("redbot")
+        self.config = config_parser["redbot"]
+        self.config["enable_local_access"] = "True"
+        self.config["save_dir"] = ""
+        for option in list(self.config):
+            if option.startswith("limit_") or option in [
+                "instant_limit",
+                "max_inflight_cost",
+                "profile_dir",
+            ]:
+                config_parser.remove_option("redbot", option)
+        self.errors: List[str] = []
+
+    def run_tests(self, tests: int, sample: Callable[[int], None]) -> List[bytes]:
+        """
+        Run tests, CONCURRENCY at a time, calling sample with the number done after each one.
+        Return their statuses.
+
+        The loop isn't stopped until they're all done, since that would break pooled
+        connections.
+        """
+        statuses: List[bytes] = []
+        started = [0]
+
+        def start() -> None:
+            path, descend = PATHS[started[0] % len(PATHS)]
+            started[0] += 1
+            args = {"uri": f"http://127.0.0.1:{self.port}{path}"}
+            if descend:
+                args["descend"] = "1"
+            RedWebUi(
+                self.config,
+                "POST",
+                urlencode(args).encode("ascii"),
+                [(b"client-ip", b"127.0.0.1")],
+                b"",
+                SoakExchange(done),
+                self.errors.append,  # type: ignore
+            )
+
+        def done(status: bytes) -> None:
+            statuses.append(status)
+            sample(len(statuses))
+            if started[0] < tests:
+                start()
+            elif len(statuses) == tests:
+                thor.stop()
+
+        for _ in range(min(tests, CONCURRENCY)):
+            start()
+        thor.run()
+        return statuses
+
+    def test_rss(self) -> None:
+        samples: Dict[int, int] = {}
+        every = max(1, TESTS // 10)
+
+        def sample(done: int) -> None:
+            if done >= WARMUP and (done - WARMUP) % every == 0:
+                gc.collect()
+                samples[done - WARMUP] = rss()
+
+        statuses = self.run_tests(WARMUP + TESTS, sample)
+        gc.collect()
+        live = live_objects()
+        sys.stderr.write(
+            "rss after warm-up: "
+            + ", ".join(
+                f"{done}: {size / 1024 / 1024:.1f} MB"
+                for done, size in sorted(samples.items())
+            )
+            + f"\nlive: {live}\n"
+        )
+        self.assertEqual(set(statuses), {b"200"}, self.errors)
+        self.assertFalse(self.errors)
+        growth = (samples[max(samples)] - samples[0]) / 1024 / 1024
+        self.assertLessEqual(growth, RSS_GROWTH)
+        # idle pooled connections can keep the last few tests alive, but no more
+        self.assertLessEqual(live["HttpResource"], CONCURRENCY * 11)
+        self.assertLessEqual(live["Formatter"], CONCURRENCY)
+
+
+if __name__ == "__main__":
+    unittest.main()